@@ -1,14 +1,37 @@
+import asyncio
+import random
+import time
+import uuid
 import pandas as pd
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
 from loguru import logger
 from tqdm import tqdm
 from pymongo import AsyncMongoClient
 from app.envs import settings
 from app.utils.embedders import embedder
 from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+from haystack_integrations.document_stores.qdrant.converters import convert_id
+from qdrant_client.http import models as rest
 from haystack import Document
 from haystack.components.preprocessors import DocumentPreprocessor
-from haystack.utils import Secret
+from haystack.document_stores.types import DuplicatePolicy
+from app.utils.qdrant import qdrant_clients
 from app.models.stats import QueryStats
+from app.utils.paraphrase import get_precomputed_paraphrase, paraphrase_documents
+from app.utils.faq_index import write_faq_snapshot
+from app.utils.dedup import DocumentDeduplicator
+from app.utils.tables import TableSplitter
+from app.utils.file_hierarchy import SUMMARY_COLLECTION, SectionSummaryBuilder
+from app.utils.stats import ensure_stats_indexes, stats_rollups
+from app.utils.breakers import CircuitOpenError, mongo_breaker
+from app.utils.snapshot import export_collection, iter_collection_batches, read_manifest, reservoir_sample, write_manifest
+
+SNAPSHOT_COLLECTIONS = ["faq", "web", "files"]
+
+class ReindexValidationError(Exception):
+    """Raised when a freshly built collection version fails validation and is not published."""
 
 class Database:
     def __init__(self, recreate_index=False):
@@ -23,53 +46,20 @@ class Database:
             self.mongo_client = None
             self.mongo_db = None
 
-        if settings.DEBUG:
-            self.faq_documents_store = QdrantDocumentStore(
-                ":memory:",
-                embedding_dim=settings.EMBEDDING_DIM,
-            )
-
-            self.web_documents_store = QdrantDocumentStore(
-                ":memory:",
-                embedding_dim=settings.EMBEDDING_DIM,
-            )
-            self.file_documents_store = QdrantDocumentStore( # New store for general files
-                ":memory:",
-                embedding_dim=settings.EMBEDDING_DIM,
-            )
-        else:
-            self.faq_documents_store = QdrantDocumentStore(
-                url=settings.QDRANTDB_URL,
-                api_key=Secret.from_token(settings.QDRANTDB_API_KEY),
-                embedding_dim=settings.EMBEDDING_DIM,
-                hnsw_config={"m": 128},
-                timeout=settings.DB_TIMEOUT,
-                write_batch_size=settings.DB_BATCH_SIZE,
-                recreate_index=recreate_index,
-                index="faq",
-            )
-
-            self.web_documents_store = QdrantDocumentStore(
-                url=settings.QDRANTDB_URL,
-                api_key=Secret.from_token(settings.QDRANTDB_API_KEY),
-                embedding_dim=settings.EMBEDDING_DIM,
-                hnsw_config={"m": 128},
-                timeout=settings.DB_TIMEOUT,
-                write_batch_size=settings.DB_BATCH_SIZE,
-                recreate_index=recreate_index,
-                index="web",
-            )
+        self.faq_documents_store = qdrant_clients.create_document_store("faq", recreate_index=recreate_index)
+        self.web_documents_store = qdrant_clients.create_document_store("web", recreate_index=recreate_index)
+        self.file_documents_store = qdrant_clients.create_document_store("files")
+        # Section summary vectors of uploaded files, for the coarse step of file search.
+        self.file_summaries_store = qdrant_clients.create_document_store(SUMMARY_COLLECTION) if settings.FILE_HIERARCHY_ENABLED else None
 
-            self.file_documents_store = QdrantDocumentStore(
-                url=settings.QDRANTDB_URL,
-                api_key=Secret.from_token(settings.QDRANTDB_API_KEY),
-                embedding_dim=settings.EMBEDDING_DIM,
-                hnsw_config={"m": 128},
-                timeout=settings.DB_TIMEOUT,
-                write_batch_size=settings.DB_BATCH_SIZE,
-                recreate_index=False,
-                index="files",
-            )
+    async def write_documents_async(self, document_store: QdrantDocumentStore, documents: List[Document], policy: DuplicatePolicy = DuplicatePolicy.OVERWRITE) -> int:
+        """
+        Writes documents through the shared async Qdrant client, or in a worker thread when no
+        async client is available (DEBUG in-memory mode).
+        """
+        if qdrant_clients.async_client is None:
+            return await asyncio.to_thread(document_store.write_documents, documents, policy)
+        return await document_store.write_documents_async(documents, policy)
     
     def reindex(self, faq_file, web_file, dev=False, batch_size=None):
         """
@@ -134,33 +124,234 @@ class Database:
 
         # Process documents with the preprocessor
         processed_faq = processor.run(documents=faq_documents)
-        embedder.run(processed_faq["documents"])
-        self.faq_documents_store.write_documents(
-            documents=processed_faq["documents"],
-            policy="OVERWRITE",
-        )
+        if settings.DEDUP_ENABLED:
+            # Rephrasings of a question help retrieval, so only exact question/answer repeats are dropped.
+            processed_faq = DocumentDeduplicator(near_duplicates=False, meta_fields=("answer",)).run(documents=processed_faq["documents"])
+        embedded_faq = embedder.run(documents=processed_faq["documents"])["documents"]
+        if settings.FAQ_PRECOMPUTE_PARAPHRASES:
+            asyncio.run(paraphrase_documents(embedded_faq, known=self._get_known_paraphrases()))
+
         # Process web documents
         web_documents = []
+        table_documents = []
         idx = 0
         for _, d in tqdm(web_df.iterrows(), desc="Loading web data..."):
             content = d["text"]
-            web_documents.append(Document(content=content, id=str(idx)))
+            web_documents.append(Document(content=content, id=str(idx), meta={"content_type": "text"}))
             idx += 1
 
             if len(d["tables"]) > 0:
                 for table in d["tables"]:
-                    web_documents.append(
-                        Document(content=table, content_type="table", id=str(idx))
+                    # Kept in meta so queries can filter on it (`meta.content_type`).
+                    table_documents.append(
+                        Document(content=table, id=str(idx), meta={"content_type": "table"})
                     )
                     idx += 1
 
-        # Process documents with the preprocessor
-        processed_web = processor.run(documents=web_documents)
-        embedder.run(processed_web["documents"])
-        self.web_documents_store.write_documents(
-            documents=processed_web["documents"],
-            policy="OVERWRITE",
+        # Process documents with the preprocessor; tables are split into row groups instead
+        if settings.TABLE_CHUNKING_ENABLED:
+            processed_web = processor.run(documents=web_documents)
+            processed_web["documents"].extend(TableSplitter().run(documents=table_documents)["documents"])
+        else:
+            processed_web = processor.run(documents=web_documents + table_documents)
+        if settings.DEDUP_ENABLED:
+            processed_web = DocumentDeduplicator().run(documents=processed_web["documents"])
+        embedded_web = embedder.run(documents=processed_web["documents"])["documents"]
+
+        # Build and validate both new versions before publishing either of them
+        faq_store = self._build_collection_version("faq", [embedded_faq], db_batch_size)
+        try:
+            web_store = self._build_collection_version("web", [embedded_web], db_batch_size)
+        except Exception:
+            qdrant_clients.client.delete_collection(faq_store.index)
+            raise
+        self._publish_collection_version("faq", faq_store.index)
+        self._publish_collection_version("web", web_store.index)
+        if settings.FAQ_INDEX_ENABLED:
+            write_faq_snapshot(embedded_faq, source=faq_store.index)
+
+    def _build_collection_version(self, alias: str, batches: Iterable[List[Document]], batch_size: int) -> QdrantDocumentStore:
+        """
+        Writes the documents of `batches` into a fresh versioned collection (`<alias>_v<timestamp>`)
+        and validates it. Batches are written as they arrive, so they can be streamed from disk.
+        The live alias is not touched, so the chatbot keeps serving the previous version meanwhile.
+        """
+        collection_name = f"{alias}_v{int(time.time() * 1000)}"
+        logger.info(f"Building collection '{collection_name}'...")
+        document_store = qdrant_clients.create_document_store(collection_name, recreate_index=True)
+        document_store.write_batch_size = batch_size
+        ids = set()
+        sample: List[Document] = []
+        seen = 0
+        rng = random.Random(0)
+        try:
+            for documents in batches:
+                document_store.write_documents(documents=documents, policy=DuplicatePolicy.OVERWRITE)
+                ids.update(doc.id for doc in documents)
+                seen = reservoir_sample(sample, seen, [doc for doc in documents if doc.embedding is not None], settings.REINDEX_VALIDATION_SAMPLES, rng)
+            self._validate_collection_version(document_store, len(ids), sample)
+        except Exception:
+            qdrant_clients.client.delete_collection(collection_name)
+            raise
+        return document_store
+
+    def _validate_collection_version(self, document_store: QdrantDocumentStore, expected: int, sample: List[Document]):
+        """
+        Checks the document count and that a sample of documents finds itself in the top-k when
+        searched with its own embedding.
+        """
+        count = document_store.count_documents()
+        if count != expected:
+            raise ReindexValidationError(f"Collection '{document_store.index}' has {count} documents, expected {expected}.")
+
+        if not sample:
+            return
+        responses = qdrant_clients.client.query_batch_points(
+            collection_name=document_store.index,
+            requests=[rest.QueryRequest(query=doc.embedding, limit=settings.EMBEDDING_TOP_K) for doc in sample],
+        )
+        hits = sum(
+            1 for doc, response in zip(sample, responses)
+            if convert_id(doc.id) in {uuid.UUID(str(point.id)).hex for point in response.points}
         )
+        recall = hits / len(sample)
+        logger.info(f"Collection '{document_store.index}': {count} documents, sample recall@{settings.EMBEDDING_TOP_K} = {recall:.3f}.")
+        if recall < settings.REINDEX_MIN_RECALL:
+            raise ReindexValidationError(f"Collection '{document_store.index}' sample recall {recall:.3f} is below {settings.REINDEX_MIN_RECALL}.")
+
+    def _publish_collection_version(self, alias: str, collection_name: str):
+        qdrant_clients.swap_alias(alias, collection_name)
+        qdrant_clients.drop_old_versions(alias, keep=settings.REINDEX_KEEP_VERSIONS)
+
+    def build_faq_index(self):
+        """Writes an in-process FAQ index snapshot of the live FAQ collection."""
+        source = qdrant_clients.get_alias_target("faq") or self.faq_documents_store.index
+        return write_faq_snapshot(self.faq_documents_store.filter_documents(), source=source)
+
+    def build_file_summaries(self) -> int:
+        """
+        Rewrites the section summaries of every uploaded file from the chunks in the `files` collection,
+        scrolled `DB_BATCH_SIZE` at a time so only the running per-section sums are kept in memory.
+        """
+        builder = SectionSummaryBuilder()
+        # Chunks indexed before the hierarchy was enabled have no section and no summary.
+        sectioned = rest.Filter(must_not=[rest.IsEmptyCondition(is_empty=rest.PayloadField(key="meta.section_id"))])
+        offset = None
+        while True:
+            records, offset = qdrant_clients.client.scroll(
+                self.file_documents_store.index, scroll_filter=sectioned, limit=settings.DB_BATCH_SIZE,
+                offset=offset, with_payload=["content", "meta"], with_vectors=True,
+            )
+            builder.add([
+                Document(content=(record.payload or {}).get("content"), meta=(record.payload or {}).get("meta") or {}, embedding=record.vector)
+                for record in records
+            ])
+            if offset is None:
+                break
+        summaries = builder.build()
+        self.file_summaries_store.write_documents(summaries, policy=DuplicatePolicy.OVERWRITE)
+        return len(summaries)
+
+    def export_snapshot(self, directory: str, collections: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Exports collections (ids, content, meta and vectors) to a snapshot directory, so another
+        environment can load them with `import_snapshot` instead of re-embedding everything.
+        :return: The manifest entry of each exported collection.
+        """
+        root = Path(directory)
+        root.mkdir(parents=True, exist_ok=True)
+        entries = {
+            name: export_collection(qdrant_clients.client, qdrant_clients.get_alias_target(name) or name, root / name, settings.DB_BATCH_SIZE)
+            for name in collections or SNAPSHOT_COLLECTIONS
+        }
+        write_manifest(directory, entries)
+        return entries
+
+    def import_snapshot(self, directory: str, collections: Optional[List[str]] = None, only_if_empty: bool = False) -> Dict[str, int]:
+        """
+        Loads collections from a snapshot written by `export_snapshot`, streamed in `DB_BATCH_SIZE`
+        batches. `faq` and `web` are built as new versions, validated and published like a reindex;
+        `files` is written into the live collection.
+        :param only_if_empty: Skip collections that already hold documents.
+        :return: The number of documents loaded per collection.
+        """
+        manifest = read_manifest(directory)
+        stores = {"faq": self.faq_documents_store, "web": self.web_documents_store, "files": self.file_documents_store}
+        loaded = {}
+        for name in collections or list(manifest["collections"]):
+            entry = manifest["collections"].get(name)
+            if entry is None or name not in stores:
+                raise ValueError(f"Snapshot has no '{name}' collection (available: {list(manifest['collections'])}).")
+            if only_if_empty and stores[name].count_documents() > 0:
+                logger.info(f"Collection '{name}' is not empty; not loading it from the snapshot.")
+                continue
+            logger.info(f"Loading {entry['count']} documents into '{name}' from the snapshot...")
+            batches = iter_collection_batches(directory, entry, settings.DB_BATCH_SIZE)
+            if name == "files":
+                for documents in batches:
+                    stores[name].write_documents(documents=documents, policy=DuplicatePolicy.OVERWRITE)
+            else:
+                document_store = self._build_collection_version(name, batches, settings.DB_BATCH_SIZE)
+                self._publish_collection_version(name, document_store.index)
+            loaded[name] = entry["count"]
+        if "faq" in loaded and settings.FAQ_INDEX_ENABLED:
+            self.build_faq_index()
+        if "files" in loaded and self.file_summaries_store is not None:
+            # Summaries are not part of snapshots; sections without one would never be searched.
+            self.build_file_summaries()
+        return loaded
+
+    def _get_known_paraphrases(self) -> Dict[str, str]:
+        """Maps paraphrase keys to the paraphrased answers already stored in the live FAQ collection."""
+        try:
+            documents = self.faq_documents_store.filter_documents()
+        except Exception as e:
+            logger.warning(f"Could not read existing FAQ paraphrases: {e}")
+            return {}
+        return {
+            doc.meta["paraphrase_key"]: doc.meta["paraphrased_answer"]
+            for doc in documents
+            if doc.meta.get("paraphrase_key") and doc.meta.get("paraphrased_answer")
+        }
+
+    def refresh_paraphrases(self) -> Dict[str, int]:
+        """
+        Generates paraphrased answers for FAQ entries of the live collection that are missing
+        one or whose answer changed since it was generated, and stores them in the entries' payload.
+        """
+        documents = [
+            doc for doc in self.faq_documents_store.filter_documents()
+            if doc.meta.get("answer") and get_precomputed_paraphrase(doc.content, doc.meta) is None
+        ]
+        logger.info(f"{len(documents)} FAQ entries need a paraphrased answer.")
+        stats = asyncio.run(paraphrase_documents(documents))
+        for doc in documents:
+            if "paraphrase_key" not in doc.meta:
+                continue
+            qdrant_clients.client.set_payload(
+                collection_name=self.faq_documents_store.index,
+                payload={"paraphrased_answer": doc.meta["paraphrased_answer"], "paraphrase_key": doc.meta["paraphrase_key"]},
+                points=[convert_id(doc.id)],
+                key="meta",
+            )
+        if settings.FAQ_INDEX_ENABLED:
+            self.build_faq_index()
+        return stats
+
+    def rollback(self, alias: str) -> str:
+        """
+        Points `alias` back to the version built before the live one.
+        :return: The name of the collection now served.
+        """
+        live = qdrant_clients.get_alias_target(alias)
+        versions = qdrant_clients.list_versions(alias)
+        older = [v for v in versions if live is None or v < live]
+        if not older:
+            raise ValueError(f"No previous version of '{alias}' to roll back to (available: {versions}).")
+        qdrant_clients.swap_alias(alias, older[-1])
+        if alias == "faq" and settings.FAQ_INDEX_ENABLED:
+            self.build_faq_index()
+        return older[-1]
 
 
     async def insert_query_stats(self, stats_data: QueryStats):
@@ -169,11 +360,61 @@ class Database:
             return None
         try:
             collection = self.mongo_db[QueryStats.Config.collection_name]
-            inserted_result = await collection.insert_one(stats_data.model_dump(by_alias=True))
+            # Bounded by the MongoDB circuit breaker, so an unreachable MongoDB does not delay responses.
+            inserted_result = await mongo_breaker.run(lambda: collection.insert_one(stats_data.model_dump(by_alias=True)))
+            if settings.STATS_ROLLUPS_ENABLED:
+                stats_rollups.record(stats_data)
             logger.info(f"Inserted query stats with ID: {inserted_result.inserted_id}")
             return inserted_result.inserted_id
+        except CircuitOpenError as e:
+            logger.warning(f"Query stats not recorded: {e}")
+            return None
         except Exception as e:
             logger.error(f"Error inserting query stats into MongoDB: {e}")
             return None
 
+    async def ensure_stats_indexes(self):
+        if self.mongo_db is None:
+            logger.error("MongoDB is not connected. Cannot create stats indexes.")
+            return
+        await ensure_stats_indexes(self.mongo_db)
+
+    async def get_stats_summary(self, window: timedelta, top: int = 10) -> Dict[str, Any]:
+        """Summarizes the queries of the last `window` from the stats rollups."""
+        if self.mongo_db is None:
+            raise RuntimeError("MongoDB is not connected. Cannot read query stats.")
+        return await stats_rollups.summarize(self.mongo_db, window, top)
+
+    async def rebuild_stats_rollups(self) -> int:
+        if self.mongo_db is None:
+            raise RuntimeError("MongoDB is not connected. Cannot rebuild stats rollups.")
+        await ensure_stats_indexes(self.mongo_db)
+        return await stats_rollups.rebuild(self.mongo_db)
+
+    async def get_top_queries(self, since: datetime, limit: int) -> Dict[str, Any]:
+        """
+        Returns the `limit` most frequent standalone queries (not follow-up turns of a conversation)
+        recorded since `since`, grouped case-insensitively.
+        :return: `queries` (dicts with `query` and `count`, most frequent first), `total` (standalone
+            queries in the window) and `distinct` (distinct queries in the window).
+        """
+        if self.mongo_db is None:
+            raise RuntimeError("MongoDB is not connected. Cannot read query stats.")
+        collection = self.mongo_db[QueryStats.Config.collection_name]
+        cursor = await collection.aggregate([
+            {"$match": {"created_at": {"$gte": since}, "conversation_id": None}},
+            {"$group": {
+                "_id": {"$toLower": {"$trim": {"input": "$user_query"}}},
+                "query": {"$first": "$user_query"},
+                "count": {"$sum": 1},
+            }},
+            {"$facet": {
+                "top": [{"$sort": {"count": -1}}, {"$limit": limit}, {"$project": {"_id": 0, "query": 1, "count": 1}}],
+                "totals": [{"$group": {"_id": None, "total": {"$sum": "$count"}, "distinct": {"$sum": 1}}}],
+            }},
+        ])
+        result = (await cursor.to_list(length=1))[0]
+        totals = result["totals"][0] if result["totals"] else {"total": 0, "distinct": 0}
+        return {"queries": result["top"], "total": totals["total"], "distinct": totals["distinct"]}
+
 database = Database()
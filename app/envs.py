@@ -1,10 +1,15 @@
 import os
+import json
 from loguru import logger
 from enum import Enum
 from app.models.embedding import EmbeddingProvider
+from app.models.llm import LoadBalancingStrategy, PromptLayout
 from dotenv import load_dotenv
 from haystack.utils.hf import HFEmbeddingAPIType
 
+# Qdrant payload schema types usable in QDRANTDB_PAYLOAD_INDEXES.
+PAYLOAD_SCHEMA_TYPES = ["keyword", "integer", "float", "bool", "text", "datetime", "uuid"]
+
 class Settings:
     def __init__(self):
         load_dotenv(override=True)
@@ -20,6 +25,8 @@ class Settings:
         self.APP_PORT = int(os.getenv("APP_PORT", 8000))
         self.APP_CORS_ORIGINS = os.getenv("APP_CORS_ORIGINS", "*")
         self.APP_WORKERS = int(os.getenv("APP_WORKERS", 1))
+        # Key required in the X-Admin-Key header of the /admin endpoints; they are disabled when empty.
+        self.ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
 
         # Logging Settings
         self.LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -31,6 +38,51 @@ class Settings:
         self.QDRANTDB_API_KEY = os.getenv("QDRANTDB_API_KEY", "YOUR_QDRANT_API_KEY")
         self.DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", 256))
         self.DB_TIMEOUT = int(os.getenv("DB_TIMEOUT", 60))
+        self.QDRANTDB_PREFER_GRPC = os.getenv("QDRANTDB_PREFER_GRPC", "false").lower() == "true"
+        self.QDRANTDB_GRPC_PORT = int(os.getenv("QDRANTDB_GRPC_PORT", 6334))
+        self.QDRANTDB_POOL_SIZE = int(os.getenv("QDRANTDB_POOL_SIZE", 16))
+        # Comma-separated `field:schema` payload indexes kept on every collection, for filtered search.
+        self.QDRANTDB_PAYLOAD_INDEXES = {}
+        for entry in os.getenv("QDRANTDB_PAYLOAD_INDEXES", "meta.content_type:keyword,meta.file_path:keyword,meta.upload_id:keyword,meta.content_hash:keyword").split(","):
+            if not entry.strip():
+                continue
+            field, _, schema = entry.strip().rpartition(":")
+            if not field or schema not in PAYLOAD_SCHEMA_TYPES:
+                raise ValueError(f"Invalid QDRANTDB_PAYLOAD_INDEXES entry: '{entry}'. Must be 'field:schema' with schema one of {PAYLOAD_SCHEMA_TYPES}")
+            self.QDRANTDB_PAYLOAD_INDEXES[field] = schema
+
+        # Reindex Settings
+        self.REINDEX_KEEP_VERSIONS = int(os.getenv("REINDEX_KEEP_VERSIONS", 2))
+        self.REINDEX_VALIDATION_SAMPLES = int(os.getenv("REINDEX_VALIDATION_SAMPLES", 100))
+        self.REINDEX_MIN_RECALL = float(os.getenv("REINDEX_MIN_RECALL", 0.9))
+
+        # File Conversion Settings
+        self.CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", os.cpu_count() or 1))
+        self.CONVERSION_FILE_TIMEOUT = float(os.getenv("CONVERSION_FILE_TIMEOUT", 300))
+        self.CONVERSION_PDF_PAGES_PER_TASK = int(os.getenv("CONVERSION_PDF_PAGES_PER_TASK", 25))
+
+        # Hierarchical File Retrieval Settings
+        self.FILE_HIERARCHY_ENABLED = os.getenv("FILE_HIERARCHY_ENABLED", "false").lower() == "true"
+        self.FILE_SECTION_CHUNKS = int(os.getenv("FILE_SECTION_CHUNKS", 20))
+        self.FILE_COARSE_TOP_K = int(os.getenv("FILE_COARSE_TOP_K", 5))
+        self.FILE_NEIGHBOR_CHUNKS = int(os.getenv("FILE_NEIGHBOR_CHUNKS", 1))
+
+        # Deduplication Settings
+        self.DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "false").lower() == "true"
+        self.DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.9))
+        self.DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", 5))
+        self.DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", 128))
+
+        # Table Chunking Settings
+        self.TABLE_CHUNKING_ENABLED = os.getenv("TABLE_CHUNKING_ENABLED", "true").lower() == "true"
+        self.TABLE_CHUNK_MAX_TOKENS = int(os.getenv("TABLE_CHUNK_MAX_TOKENS", 200))
+        self.TABLE_CHUNK_FORMAT = os.getenv("TABLE_CHUNK_FORMAT", "markdown")
+        if self.TABLE_CHUNK_FORMAT not in ("markdown", "text"):
+            raise ValueError(f"Invalid TABLE_CHUNK_FORMAT: {self.TABLE_CHUNK_FORMAT}. Must be 'markdown' or 'text'")
+
+        # Snapshot Settings
+        # Directory of an exported snapshot loaded at startup into collections that are still empty.
+        self.SNAPSHOT_AUTOLOAD_DIR = os.getenv("SNAPSHOT_AUTOLOAD_DIR", "")
 
         # Embedding Settings
         self.EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", EmbeddingProvider.OPENAI.value)
@@ -48,6 +100,7 @@ class Settings:
         self.EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 768))
         self.EMBEDDING_TOP_K = int(os.getenv("EMBEDDING_TOP_K", 3))
         self.EMBEDDING_THRESHOLD = float(os.getenv("EMBEDDING_THRESHOLD", 0.7))
+        self.QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", 1000))
 
         # LLM Settings
         self.LLM_OPENAI_API_KEY = os.getenv("LLM_OPENAI_API_KEY", "")
@@ -55,14 +108,101 @@ class Settings:
         self.LLM_OPENAI_MODEL = os.getenv("LLM_OPENAI_MODEL", "gpt-3.5-turbo")
         self.LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", 0.7))
         self.LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", 1000))
+        self.LLM_PROMPT_LAYOUT = os.getenv("LLM_PROMPT_LAYOUT", PromptLayout.LEGACY.value)
+        if self.LLM_PROMPT_LAYOUT not in [layout.value for layout in PromptLayout]:
+            raise ValueError(f"Invalid LLM_PROMPT_LAYOUT: {self.LLM_PROMPT_LAYOUT}. Must be one of {[layout.value for layout in PromptLayout]}")
+
+        # LLM Routing Settings
+        # JSON list of OpenAI-compatible backends, e.g.
+        # [{"base_url": "http://tgi-1:80/v1", "model": "tgi", "weight": 2}, {"base_url": "https://api.openai.com/v1", "api_key": "...", "model": "gpt-4o-mini"}]
+        # When empty, a single backend is built from the LLM_OPENAI_* settings above.
+        try:
+            self.LLM_BACKENDS = json.loads(os.getenv("LLM_BACKENDS", "") or "[]")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid LLM_BACKENDS: {e}. Must be a JSON list of backend objects.")
+        if not isinstance(self.LLM_BACKENDS, list) or not all(isinstance(b, dict) and b.get("base_url") for b in self.LLM_BACKENDS):
+            raise ValueError("Invalid LLM_BACKENDS: every backend must be an object with at least a 'base_url' key.")
+        self.LLM_LOAD_BALANCING = os.getenv("LLM_LOAD_BALANCING", LoadBalancingStrategy.LEAST_OUTSTANDING.value)
+        if self.LLM_LOAD_BALANCING not in [strategy.value for strategy in LoadBalancingStrategy]:
+            raise ValueError(f"Invalid LLM_LOAD_BALANCING: {self.LLM_LOAD_BALANCING}. Must be one of {[strategy.value for strategy in LoadBalancingStrategy]}")
+        self.LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 3))
+        self.LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", 0))
+        self.LLM_BACKEND_FAILURE_THRESHOLD = int(os.getenv("LLM_BACKEND_FAILURE_THRESHOLD", 3))
+        self.LLM_BACKEND_COOLDOWN = float(os.getenv("LLM_BACKEND_COOLDOWN", 30))
 
         # Cache Settings
         self.CACHE_ENABLED = os.getenv("CACHE_ENABLED", "false").lower() == "true"
         self.FAQ_ENABLE_PARAPHRASING = os.getenv("FAQ_ENABLE_PARAPHRASING", "false").lower() == "true"
+        self.FAQ_PRECOMPUTE_PARAPHRASES = os.getenv("FAQ_PRECOMPUTE_PARAPHRASES", "false").lower() == "true"
+        self.FAQ_PARAPHRASE_CONCURRENCY = int(os.getenv("FAQ_PARAPHRASE_CONCURRENCY", 8))
+        self.FAQ_SPECULATIVE_STREAMING = os.getenv("FAQ_SPECULATIVE_STREAMING", "false").lower() == "true"
+        self.FAQ_SPECULATIVE_THRESHOLD = float(os.getenv("FAQ_SPECULATIVE_THRESHOLD", 0.85))
+        self.FAQ_INDEX_ENABLED = os.getenv("FAQ_INDEX_ENABLED", "false").lower() == "true"
+        self.FAQ_INDEX_DIR = os.getenv("FAQ_INDEX_DIR", "data/faq_index")
+        self.FAQ_INDEX_DTYPE = os.getenv("FAQ_INDEX_DTYPE", "float32")
+        if self.FAQ_INDEX_DTYPE not in ["float32", "float16"]:
+            raise ValueError(f"Invalid FAQ_INDEX_DTYPE: {self.FAQ_INDEX_DTYPE}. Must be one of ['float32', 'float16']")
+        self.FAQ_INDEX_REFRESH_INTERVAL = float(os.getenv("FAQ_INDEX_REFRESH_INTERVAL", 5))
+        # Query caches (embeddings, retrievals, answers of standalone queries), used when CACHE_ENABLED.
+        self.QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 10000))
+        self.QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 3600))
+        # Seconds between checks for a reindex or an upload, which drops cached results and re-runs the warm-up.
+        self.QUERY_CACHE_VERSION_CHECK_INTERVAL = float(os.getenv("QUERY_CACHE_VERSION_CHECK_INTERVAL", 30))
+
+        # Cache Warm-up Settings
+        self.WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "false").lower() == "true"
+        self.WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", 500))
+        self.WARMUP_WINDOW_DAYS = float(os.getenv("WARMUP_WINDOW_DAYS", 7))
+        self.WARMUP_BATCH_SIZE = int(os.getenv("WARMUP_BATCH_SIZE", 64))
+        self.WARMUP_ANSWERS = os.getenv("WARMUP_ANSWERS", "false").lower() == "true"
+        self.WARMUP_ANSWER_CONCURRENCY = int(os.getenv("WARMUP_ANSWER_CONCURRENCY", 4))
+
+        # Batch Answering Settings (`python -m app.main --batch-answer`)
+        self.BATCH_ANSWER_BATCH_SIZE = int(os.getenv("BATCH_ANSWER_BATCH_SIZE", 64))
+        self.BATCH_ANSWER_CONCURRENCY = int(os.getenv("BATCH_ANSWER_CONCURRENCY", 8))
+        # LLM requests per second at most (0: no limit).
+        self.BATCH_ANSWER_RATE_LIMIT = float(os.getenv("BATCH_ANSWER_RATE_LIMIT", 0))
+
+        # Conversation Settings
+        self.CONVERSATION_ENABLED = os.getenv("CONVERSATION_ENABLED", "false").lower() == "true"
+        self.CONVERSATION_RETRIEVAL_TURNS = int(os.getenv("CONVERSATION_RETRIEVAL_TURNS", 3))
+        self.CONVERSATION_TURN_DECAY = float(os.getenv("CONVERSATION_TURN_DECAY", 0.5))
+        self.CONVERSATION_MAX_HISTORY_MESSAGES = int(os.getenv("CONVERSATION_MAX_HISTORY_MESSAGES", 6))
+        self.CONVERSATION_MAX_HISTORY_CHARS = int(os.getenv("CONVERSATION_MAX_HISTORY_CHARS", 4000))
+        self.CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", 1000))
+        self.CONVERSATION_CACHE_TTL = float(os.getenv("CONVERSATION_CACHE_TTL", 3600))
 
         # MongoDB Settings
         self.MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
         self.MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "stats")
 
+        # Circuit Breaker Settings
+        self.BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+        self.BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+        self.BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", 30))
+        # Latency budgets (seconds) of a single call; a slower call counts as a failure.
+        self.BREAKER_QDRANT_TIMEOUT = float(os.getenv("BREAKER_QDRANT_TIMEOUT", 5))
+        self.BREAKER_EMBEDDER_TIMEOUT = float(os.getenv("BREAKER_EMBEDDER_TIMEOUT", 5))
+        self.BREAKER_MONGO_TIMEOUT = float(os.getenv("BREAKER_MONGO_TIMEOUT", 2))
+        # When retrieval fails and no stale cached retrieval or FAQ index hit is available, answer without context.
+        self.DEGRADED_LLM_ONLY = os.getenv("DEGRADED_LLM_ONLY", "true").lower() == "true"
+
+        # Profiling Settings
+        self.PROFILER_SAMPLE_INTERVAL = float(os.getenv("PROFILER_SAMPLE_INTERVAL", 0.01))
+        self.PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", 300))
+        # Requests slower than this get a timing/stack breakdown stored with their QueryStats; 0 disables it.
+        self.SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", 10000))
+        self.SLOW_REQUEST_SAMPLE_INTERVAL = float(os.getenv("SLOW_REQUEST_SAMPLE_INTERVAL", 0.1))
+        self.SLOW_REQUEST_MAX_STACKS = int(os.getenv("SLOW_REQUEST_MAX_STACKS", 10))
+
+        # Stats Settings
+        # Per-minute/hour rollups of query_stats, merged into MongoDB every STATS_ROLLUP_FLUSH_INTERVAL seconds.
+        self.STATS_ROLLUPS_ENABLED = os.getenv("STATS_ROLLUPS_ENABLED", "true").lower() == "true"
+        self.STATS_ROLLUP_FLUSH_INTERVAL = float(os.getenv("STATS_ROLLUP_FLUSH_INTERVAL", 10))
+        # Retention in days (TTL indexes); 0 keeps documents forever.
+        self.STATS_RETENTION_DAYS = float(os.getenv("STATS_RETENTION_DAYS", 0))
+        self.STATS_MINUTE_ROLLUP_RETENTION_DAYS = float(os.getenv("STATS_MINUTE_ROLLUP_RETENTION_DAYS", 7))
+        self.STATS_HOUR_ROLLUP_RETENTION_DAYS = float(os.getenv("STATS_HOUR_ROLLUP_RETENTION_DAYS", 0))
+
 
 settings = Settings()
@@ -1,34 +1,176 @@
 import uvicorn
 import argparse
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from app.envs import settings
-from app.routers import query, upload, completions
-from app.database import Database
 from loguru import logger
 
-app = FastAPI()
+# The routers, the database and the utilities that connect to services are imported where they are
+# used, not here: the file conversion workers re-import the main module when they start.
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.APP_CORS_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def _ensure_stats_indexes():
+    from app.database import database
+    try:
+        await database.ensure_stats_indexes()
+    except Exception as e:
+        logger.error(f"Could not create the query stats indexes: {e}")
 
-# Include routers
-app.include_router(query.router, tags=["query"])
-app.include_router(upload.router, tags=["File Uploads"])
-app.include_router(completions.router, tags=["Completions"])
+async def _warm_up_caches():
+    from app.utils.warmup import warm_up_caches
+    try:
+        await warm_up_caches()
+    except Exception as e:
+        logger.error(f"Cache warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app.database import database
+    from app.utils.query_cache import query_caches
+    from app.utils.stats import stats_rollups
+    from app.utils.warmup import watch_for_reindex
+
+    if settings.SNAPSHOT_AUTOLOAD_DIR:
+        # Fills empty (e.g. DEBUG in-memory) collections without re-embedding the corpus.
+        try:
+            loaded = await run_in_threadpool(database.import_snapshot, settings.SNAPSHOT_AUTOLOAD_DIR, only_if_empty=True)
+            logger.info(f"Loaded snapshot '{settings.SNAPSHOT_AUTOLOAD_DIR}': {loaded}.")
+        except Exception as e:
+            logger.error(f"Could not load snapshot '{settings.SNAPSHOT_AUTOLOAD_DIR}': {e}")
+
+    # In the background: an unreachable MongoDB must not hold up startup.
+    indexer = asyncio.create_task(_ensure_stats_indexes())
+    flusher = None
+    if settings.STATS_ROLLUPS_ENABLED and database.mongo_db is not None:
+        flusher = asyncio.create_task(stats_rollups.run_flusher(database.mongo_db))
+
+    watcher = warmer = None
+    if settings.CACHE_ENABLED:
+        try:
+            # Records the live collection versions, so the watcher can tell when a reindex swaps them.
+            await run_in_threadpool(query_caches.check_versions)
+        except Exception as e:
+            logger.error(f"Could not read the collection versions: {e}")
+        if settings.WARMUP_ENABLED:
+            # In the background: requests are served (from cold caches) while the warm-up runs.
+            warmer = asyncio.create_task(_warm_up_caches())
+        watcher = asyncio.create_task(watch_for_reindex())
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    if warmer is not None:
+        warmer.cancel()
+    indexer.cancel()
+    if flusher is not None:
+        # Writes the rollups recorded since the last flush.
+        flusher.cancel()
+        try:
+            await flusher
+        except asyncio.CancelledError:
+            pass
+
+def create_app() -> FastAPI:
+    from app.routers import query, upload, completions, stats, admin, health
+
+    app = FastAPI(lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.APP_CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Include routers
+    app.include_router(query.router, tags=["query"])
+    app.include_router(upload.router, tags=["File Uploads"])
+    app.include_router(completions.router, tags=["Completions"])
+    app.include_router(stats.router, tags=["Stats"])
+    app.include_router(admin.router, tags=["Admin"])
+    app.include_router(health.router, tags=["Health"])
+    return app
+
+def __getattr__(name: str):
+    # `app.main:app` (uvicorn, tests) builds the application on first access.
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def main():
+    from app.database import Database, ReindexValidationError, SNAPSHOT_COLLECTIONS, database
+    from app.utils.batch_answer import answer_questions
+
     parser = argparse.ArgumentParser(description="Main application CLI")
     parser.add_argument(
         "--reindex",
         action="store_true",
         help="Reindex the database with specified FAQ and Web files.",
     )
+    parser.add_argument(
+        "--rollback",
+        action="store_true",
+        help="Point the FAQ and Web collections back to their previous reindexed versions.",
+    )
+    parser.add_argument(
+        "--refresh-paraphrases",
+        action="store_true",
+        help="Generate paraphrased answers for FAQ entries that are missing one or are stale.",
+    )
+    parser.add_argument(
+        "--build-faq-index",
+        action="store_true",
+        help="Write an in-process FAQ index snapshot of the live FAQ collection.",
+    )
+    parser.add_argument(
+        "--export-snapshot",
+        metavar="DIR",
+        help="Export the collections (with their vectors) to a snapshot directory.",
+    )
+    parser.add_argument(
+        "--import-snapshot",
+        metavar="DIR",
+        help="Load the collections from a snapshot directory instead of re-embedding them.",
+    )
+    parser.add_argument(
+        "--collections",
+        nargs="+",
+        choices=SNAPSHOT_COLLECTIONS,
+        help="Collections to export or import (default: all).",
+    )
+    parser.add_argument(
+        "--rebuild-stats-rollups",
+        action="store_true",
+        help="Recompute the query stats rollups from the raw query_stats collection (run while the app is stopped).",
+    )
+    parser.add_argument(
+        "--batch-answer",
+        metavar="FILE",
+        help="Answer the questions of a CSV or JSONL file offline, writing the answers to a JSONL file.",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        help="JSONL file the batch answers are written to and resumed from (default: <input>.answers.jsonl).",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Questions embedded and searched together (default: BATCH_ANSWER_BATCH_SIZE).",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="LLM requests in flight at most during batch answering (default: BATCH_ANSWER_CONCURRENCY).",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        help="LLM requests per second at most during batch answering, 0 for no limit (default: BATCH_ANSWER_RATE_LIMIT).",
+    )
     parser.add_argument(
         "--dev",
         action="store_true",
@@ -42,9 +184,11 @@ def main():
         web_file_path = input("Enter the path to the Web data file (e.g., data/web.json): ")
         
         try:
-            database = Database(recreate_index=True)
+            database = Database()
             database.reindex(faq_file_path, web_file_path, dev=args.dev)
             logger.info("Database reindexing completed successfully.")
+        except ReindexValidationError as e:
+            logger.error(f"Reindexed collections failed validation and were not published: {e}")
         except FileNotFoundError as e:
             logger.error(f"Error during reindexing: {e}. Please check file paths.")
         except KeyError as e:
@@ -53,9 +197,76 @@ def main():
             logger.error(f"Error during reindexing: {e}. Please check file formats (must be CSV or JSON).")
         except Exception as e:
             logger.error(f"An unexpected error occurred during reindexing: {e}")
+    elif args.rollback:
+        logger.info("Rolling back to the previous collection versions...")
+        try:
+            database = Database()
+            for alias in ("faq", "web"):
+                logger.info(f"'{alias}' now serves '{database.rollback(alias)}'.")
+        except ValueError as e:
+            logger.error(f"Error during rollback: {e}")
+    elif args.refresh_paraphrases:
+        logger.info("Refreshing paraphrased FAQ answers...")
+        try:
+            database = Database()
+            stats = database.refresh_paraphrases()
+            logger.info(f"Paraphrase refresh completed: {stats}.")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during paraphrase refresh: {e}")
+    elif args.build_faq_index:
+        logger.info("Building the in-process FAQ index snapshot...")
+        try:
+            database = Database()
+            logger.info(f"FAQ index snapshot written to '{database.build_faq_index()}'.")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while building the FAQ index: {e}")
+    elif args.export_snapshot:
+        logger.info(f"Exporting snapshot to '{args.export_snapshot}'...")
+        try:
+            entries = database.export_snapshot(args.export_snapshot, args.collections)
+            logger.info(f"Snapshot export completed: { {name: entry['count'] for name, entry in entries.items()} }.")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during snapshot export: {e}")
+    elif args.import_snapshot:
+        logger.info(f"Importing snapshot from '{args.import_snapshot}'...")
+        try:
+            loaded = database.import_snapshot(args.import_snapshot, args.collections)
+            logger.info(f"Snapshot import completed: {loaded}.")
+        except ReindexValidationError as e:
+            logger.error(f"Imported collections failed validation and were not published: {e}")
+        except (FileNotFoundError, ValueError) as e:
+            logger.error(f"Error during snapshot import: {e}")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during snapshot import: {e}")
+    elif args.rebuild_stats_rollups:
+        logger.info("Rebuilding the query stats rollups...")
+        try:
+            rows = asyncio.run(database.rebuild_stats_rollups())
+            logger.info(f"Query stats rollups rebuilt from {rows} rows.")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while rebuilding the stats rollups: {e}")
+    elif args.batch_answer:
+        logger.info(f"Batch answering the questions of '{args.batch_answer}'...")
+        try:
+            report = asyncio.run(answer_questions(
+                args.batch_answer,
+                output_path=args.output,
+                batch_size=args.batch_size,
+                concurrency=args.concurrency,
+                rate_limit=args.rate_limit,
+            ))
+            logger.info(f"Batch answering completed: {report}.")
+        except FileNotFoundError as e:
+            logger.error(f"Error during batch answering: {e}. Please check the file path.")
+        except KeyError as e:
+            logger.error(f"Error during batch answering: {e}. Please check the question column.")
+        except ValueError as e:
+            logger.error(f"Error during batch answering: {e}")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during batch answering: {e}")
     else:
         uvicorn.run(
-            app,
+            "app.main:app",
             host=settings.APP_HOST,
             port=settings.APP_PORT,
             workers=settings.APP_WORKERS,
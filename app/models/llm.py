@@ -0,0 +1,15 @@
+from enum import Enum
+
+class LoadBalancingStrategy(str, Enum):
+    """
+    Enum for the strategies used to pick an LLM backend from the pool.
+    """
+    LEAST_OUTSTANDING = "least_outstanding"
+    WEIGHTED = "weighted"
+
+class PromptLayout(str, Enum):
+    """
+    Enum for the ways the LLM prompt is assembled.
+    """
+    LEGACY = "legacy"
+    PREFIX_CACHE = "prefix_cache"
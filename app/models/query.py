@@ -1,27 +1,41 @@
-from pydantic import BaseModel
-from typing import Optional, List
-from haystack import Document
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional, List
 
 class Query(BaseModel):
     """
     Query model for the API.
     """
     query: str
+    # A Haystack filter applied to every collection, or a mapping of "faq"/"web"/"files" to filters.
+    filters: Optional[Dict[str, Any]] = None
 
     class Config:
         json_schema_extra = {
             "example": {
                 "query": "example query",
+                "filters": {"files": {"field": "meta.upload_id", "operator": "==", "value": "3f2b9c..."}},
             }
         }
 
+class RetrievedDocumentResponse(BaseModel):
+    """
+    A retrieved document as returned by the API, read from the attributes of a `RetrievedDocument`.
+    """
+    id: str
+    content: Optional[str] = None
+    score: Optional[float] = None
+    meta: Dict[str, Any] = {}
+
+    class Config:
+        from_attributes = True
+
 class QueryResponse(BaseModel):
     """
     Response model for the API.
     """
-    faq_documents: Optional[List[Document]] = None
-    web_documents: Optional[List[Document]] = None
-    file_documents: Optional[List[Document]] = None
+    faq_documents: Optional[List[RetrievedDocumentResponse]] = None
+    web_documents: Optional[List[RetrievedDocumentResponse]] = None
+    file_documents: Optional[List[RetrievedDocumentResponse]] = None
     llm_answer: Optional[str] = None
 
     class Config:
@@ -31,7 +45,6 @@ class QueryResponse(BaseModel):
                     {
                         "id": "1",
                         "content": "Question",
-                        "blob": None,
                         "meta": {
                             "answer": "Answer",
                             "source_id": "0",
@@ -39,43 +52,57 @@ class QueryResponse(BaseModel):
                             "split_id": 0,
                             "split_idx_start": 0
                         },
-                        "score": 0.95,
-                        "embedding": None,
-                        "sparse_embedding": None
+                        "score": 0.95
                     }
                 ],
                 "web_documents": [
                     {
                         "id": "2",
                         "content": "Web content",
-                        "blob": None,
                         "meta": {
                             "source_id": "1",
                             "page_number": 1,
                             "split_id": 0,
                             "split_idx_start": 0
                         },
-                        "score": 0.90,
-                        "embedding": None,
-                        "sparse_embedding": None
+                        "score": 0.90
                     }
                 ],
                 "file_documents": [
                     {
                         "id": "3",
                         "content": "File content",
-                        "blob": None,
                         "meta": {
                             "source_id": "2",
                             "page_number": 1,
                             "split_id": 0,
                             "split_idx_start": 0
                         },
-                        "score": 0.85,
-                        "embedding": None,
-                        "sparse_embedding": None
+                        "score": 0.85
                     }
                 ],
                 "llm_answer": "This is the answer from the LLM."
             }
-        }
\ No newline at end of file
+        }
+
+class BatchQuery(BaseModel):
+    """
+    Batch query model for the API.
+    """
+    queries: List[str] = Field(..., min_length=1)
+    filters: Optional[Dict[str, Any]] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "queries": ["first query", "second query"],
+            }
+        }
+
+class BatchQueryResponse(BaseModel):
+    """
+    Response model for the batch query API, one result per query in input order.
+    `llm_answer` is only filled from the top FAQ hit (its answer, or its precomputed paraphrase when
+    paraphrasing is enabled); no LLM calls are made.
+    """
+    results: List[QueryResponse]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 class QueryStats(BaseModel):
@@ -7,7 +7,10 @@ class QueryStats(BaseModel):
     resolve_time_ms: float = Field(...)
     bot_answer: str = Field(...)
     rag_hit: bool = Field(...)
+    conversation_id: Optional[str] = Field(default=None)
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Step timings and stack samples of requests slower than SLOW_REQUEST_THRESHOLD_MS.
+    slow_request: Optional[Dict[str, Any]] = Field(default=None)
 
     class Config:
         collection_name = "query_stats"
@@ -21,3 +24,42 @@ class QueryStats(BaseModel):
                 "created_at": "2023-10-27T10:30:00.000Z"
             }
         }
+
+
+class LatencySummary(BaseModel):
+    avg: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+    max: Optional[float] = None
+
+
+class StatsBucket(BaseModel):
+    start: datetime
+    count: int
+    rag_hit_rate: Optional[float] = None
+    errors: int = 0
+    latency_p50_ms: Optional[float] = None
+    latency_p95_ms: Optional[float] = None
+
+
+class TopQuery(BaseModel):
+    query: str
+    count: int
+
+
+class StatsSummary(BaseModel):
+    """
+    Query statistics over a window, computed from the per-minute/hour rollups of `query_stats`.
+    Percentiles are estimated from fixed latency histogram buckets.
+    """
+    window_seconds: int
+    granularity: str
+    since: datetime
+    count: int
+    rag_hit_rate: Optional[float] = None
+    error_rate: Optional[float] = None
+    latency_ms: LatencySummary
+    series: List[StatsBucket]
+    top_queries: List[TopQuery]
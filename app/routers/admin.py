@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, Response
+
+from app.envs import settings
+from app.utils.auth import require_admin
+from app.utils.profiling import profiler
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+@router.post("/profiler/start")
+async def start_profiler_endpoint(
+    seconds: float = Query(30, gt=0, description="How long to sample, capped at PROFILER_MAX_SECONDS."),
+    interval: float = Query(None, gt=0, le=1, description="Seconds between samples (default PROFILER_SAMPLE_INTERVAL)."),
+    include_idle: bool = Query(False, description="Keep samples of threads waiting for work or I/O."),
+):
+    """
+    Starts the sampling profiler of the worker serving this request. Each worker process profiles
+    only itself.
+    """
+    try:
+        profiler.start(seconds, interval=interval, include_idle=include_idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiler.status()
+
+@router.post("/profiler/stop")
+async def stop_profiler_endpoint():
+    # Waits for the sampling thread to finish its current sample, off the event loop.
+    await run_in_threadpool(profiler.stop)
+    return profiler.status()
+
+@router.get("/profiler/status")
+async def profiler_status_endpoint():
+    return profiler.status()
+
+@router.get("/profiler/flamegraph")
+async def profiler_flamegraph_endpoint(format: str = Query("svg", pattern="^(svg|folded)$")):
+    """
+    Downloads the last profile as an SVG flame graph, or in the folded stack format for other
+    tools (speedscope, inferno, flamegraph.pl).
+    """
+    if profiler.started_at is None:
+        raise HTTPException(status_code=404, detail="No profile has been recorded yet.")
+    if format == "folded":
+        return PlainTextResponse(profiler.folded(), headers={"Content-Disposition": 'attachment; filename="profile.folded"'})
+    return Response(
+        profiler.flamegraph_svg(title=f"{settings.APP_NAME} sampling profile"),
+        media_type="image/svg+xml",
+        headers={"Content-Disposition": 'attachment; filename="flamegraph.svg"'},
+    )
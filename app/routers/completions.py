@@ -1,158 +1,289 @@
 import json
 import time
+import asyncio
 import uuid
-import copy
 from typing import List, Dict, Any, Optional, Union, AsyncGenerator
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
 from fastapi.concurrency import run_in_threadpool
 
 from app.utils.pipelines import ChatPipeline
-from app.utils.llm import LLM
+from app.utils.llm import LLM, LLMStream
+from app.utils.citations import build_citations_and_context
 from app.envs import settings
 from loguru import logger
 from app.database import database
 from app.models.stats import QueryStats
+from app.utils.paraphrase import get_precomputed_paraphrase
+from app.utils.filters import CollectionFilters, get_filters_key, parse_filters
+from app.utils.query_cache import get_query_key, query_caches
+from app.utils.profiling import RequestTrace, finish_trace, span, start_trace
+from app.utils.breakers import embedder_breaker, get_degraded_mode, set_degraded_mode
+from app.utils.faq_index import faq_index
+from app.utils.conversation import (
+    ConversationState,
+    build_retrieval_embedding,
+    get_bounded_history,
+    get_conversation_id,
+    get_conversation_state,
+    get_retrieval_key,
+    get_retrieval_turns,
+    get_transcript_key,
+    get_user_turns,
+)
 from datetime import datetime
 
-def _extract_source_from_meta(meta: Dict[str, Any]) -> Optional[str]:
-    if not meta or not isinstance(meta, dict):
+router = APIRouter()
+
+def _get_cached_retrieval(query: str, filters: Optional[CollectionFilters]) -> Optional[Dict[str, Any]]:
+    if not settings.CACHE_ENABLED or filters:
         return None
-    source_keys = ['name', 'filename', 'file_path', 'url', 'link', 'source_id', 'title']
-    for key in source_keys:
-        if key in meta and isinstance(meta[key], str):
-            return meta[key]
-    if 'id' in meta and isinstance(meta['id'], str):
-        return meta['id']
-    return None
-
-def _format_documents_for_citation(haystack_docs: List[Any]) -> List[Dict[str, Any]]:
-    citations: List[Dict[str, Any]] = []
-    if not haystack_docs:
-        return citations
-    for doc in haystack_docs:        
-        doc_meta = getattr(doc, 'meta', {})
-        if not isinstance(doc_meta, dict):
-            doc_meta = {}
-
-        citations.append({
-            "id": str(getattr(doc, 'id', uuid.uuid4().hex)),
-            "content": doc.content,
-            "source": _extract_source_from_meta(doc_meta),
-            "score": getattr(doc, 'score', None),
-            "meta": doc_meta
-        })
-    return citations
+    return query_caches.retrievals.get(get_query_key(query))
 
-router = APIRouter()
+def _cache_retrieval(query: str, filters: Optional[CollectionFilters], pipeline_output: Dict[str, Any]):
+    if settings.CACHE_ENABLED and not filters:
+        query_caches.retrievals.set(get_query_key(query), pipeline_output)
+
+def _get_degraded_documents_and_context(
+    query: str,
+    filters: Optional[CollectionFilters],
+    error: Exception,
+    query_embedding: Optional[List[float]] = None,
+    faq_documents: Optional[List[Any]] = None
+) -> tuple[List[Dict[str, Any]], str]:
+    """
+    Fallback while retrieval is unavailable (a circuit breaker is open, or a dependency failed or ran
+    out of its latency budget): the last cached retrieval of the query, even if expired; else the
+    FAQ hits already retrieved or found in the FAQ index; else, with `DEGRADED_LLM_ONLY`, no context.
+    """
+    pipeline_output = None
+    if settings.CACHE_ENABLED and not filters:
+        pipeline_output = query_caches.retrievals.get(get_query_key(query), allow_stale=True)
+    mode = "stale"
+    if pipeline_output is None:
+        if not faq_documents and query_embedding is not None and settings.FAQ_INDEX_ENABLED and not (filters or {}).get("faq") and faq_index.ready:
+            faq_documents = faq_index.search(query_embedding)
+        if faq_documents:
+            pipeline_output, mode = {"faq_documents": faq_documents}, "faq_only"
+        elif settings.DEGRADED_LLM_ONLY:
+            pipeline_output, mode = {}, "llm_only"
+        else:
+            raise HTTPException(status_code=503, detail=f"Document retrieval is unavailable: {str(error)}")
+    logger.warning(f"Retrieval unavailable ({type(error).__name__}: {error}); answering in degraded mode '{mode}'.")
+    set_degraded_mode(mode)
+    return build_citations_and_context(pipeline_output)
+
+async def _get_documents_and_context(query: str, filters: Optional[CollectionFilters] = None) -> tuple[List[Dict[str, Any]], str]:
+    pipeline_output = _get_cached_retrieval(query, filters)
+    if pipeline_output is not None:
+        return build_citations_and_context(pipeline_output)
 
-async def _get_documents_and_context(query: str) -> tuple[List[Dict[str, Any]], str]:
     chat_pipeline = ChatPipeline()
+    query_embedding = None
     try:
-        pipeline_output = await run_in_threadpool(chat_pipeline.run, query)
+        query_embedding = await chat_pipeline.embed_async(query)
+        pipeline_output = await chat_pipeline.retrieve_async(query_embedding, filters)
     except Exception as e:
         logger.error(f"ChatPipeline run error: {e}")
-        raise HTTPException(status_code=500, detail=f"Error processing documents: {str(e)}")
+        return _get_degraded_documents_and_context(query, filters, e, query_embedding)
 
-    faq_documents = pipeline_output.get("faq_documents", [])
-    web_documents = pipeline_output.get("web_documents", [])
-    file_documents = pipeline_output.get("file_documents", [])
+    _cache_retrieval(query, filters, pipeline_output)
 
-    all_retrieved_docs = (faq_documents or []) + (web_documents or []) + (file_documents or [])
-    
+    return build_citations_and_context(pipeline_output)
+
+async def _get_conversation_documents_and_context(conversation_id: Optional[str], messages: List[Any], filters: Optional[CollectionFilters] = None) -> tuple[List[Dict[str, Any]], str]:
+    """
+    Retrieves documents for the recent user turns of a conversation. With a conversation ID, turn
+    embeddings and retrieval results are cached per conversation, so only the newest turn is embedded;
+    without one, every turn is embedded again.
+    """
+    state = get_conversation_state(conversation_id) if conversation_id else ConversationState()
+    turns = get_retrieval_turns(messages)
+    retrieval_key = get_retrieval_key(turns) + get_filters_key(filters)
+    cached = state.retrievals.get(retrieval_key)
+    if cached is not None:
+        logger.info(f"Conversation {conversation_id[:12]}: reusing cached retrieval.")
+        return cached
+
+    chat_pipeline = ChatPipeline()
+    query_embedding = None
     try:
-        all_retrieved_docs.sort(key=lambda x: getattr(x, 'score', 0) or 0, reverse=True)
+        query_embedding = await embedder_breaker.run(lambda: run_in_threadpool(build_retrieval_embedding, state, turns, chat_pipeline.embed))
+        pipeline_output = await chat_pipeline.retrieve_async(query_embedding, filters)
     except Exception as e:
-        logger.warning(f"Could not sort documents by score: {e}")
-
-    citations = _format_documents_for_citation(all_retrieved_docs)
-
-    context_parts = []
-    if faq_documents:
-        for doc in faq_documents:
-            if doc.content:
-                context_parts.append(f"FAQ: {doc.content}. Answer: {doc.meta.get('answer', '')}")
-    if web_documents:
-        context_parts.extend([doc.content for doc in web_documents if doc.content])
-    if file_documents:
-        context_parts.extend([doc.content for doc in file_documents if doc.content])
-    
-    context = "\n\n".join(context_parts)
-    return citations, context
+        logger.error(f"ChatPipeline conversational retrieval error: {e}")
+        return _get_degraded_documents_and_context(turns[-1], filters, e, query_embedding)
+
+    result = build_citations_and_context(pipeline_output)
+    state.retrievals = {retrieval_key: result}
+    return result
+
+async def _get_documents_and_context_speculative(query: str, filters: Optional[CollectionFilters] = None) -> tuple[List[Dict[str, Any]], str, Optional["asyncio.Future[List[Dict[str, Any]]]"]]:
+    """
+    Searches the FAQ collection first. When its top hit clears `FAQ_SPECULATIVE_THRESHOLD`, returns
+    immediately with the FAQ-only context and citations so LLM generation can start, plus a future
+    resolving to the `web` and `files` hits once their retrievers finish. Those were not in the
+    prompt, so they are related documents rather than citations of the answer.
+    """
+    pipeline_output = _get_cached_retrieval(query, filters)
+    if pipeline_output is not None:
+        return (*build_citations_and_context(pipeline_output), None)
+
+    chat_pipeline = ChatPipeline()
+    query_embedding = None
+    rest_task = None
+    try:
+        query_embedding = await chat_pipeline.embed_async(query)
+        rest_task = asyncio.ensure_future(chat_pipeline.retrieve_web_and_files_async(query_embedding, filters))
+        faq_documents = await chat_pipeline.retrieve_faq_async(query_embedding, filters)
+    except Exception as e:
+        logger.error(f"ChatPipeline run error: {e}")
+        if rest_task is not None:
+            rest_task.cancel()
+        return (*_get_degraded_documents_and_context(query, filters, e, query_embedding), None)
+
+    top_score = max((doc.score or 0 for doc in faq_documents), default=0)
+    if top_score >= settings.FAQ_SPECULATIVE_THRESHOLD:
+        logger.info(f"Speculative FAQ hit (score {top_score:.3f}); starting generation before web/files retrieval completes.")
+
+        async def related_documents() -> List[Dict[str, Any]]:
+            return build_citations_and_context(await rest_task)[0]
+
+        citations, context = build_citations_and_context({"faq_documents": faq_documents})
+        return citations, context, asyncio.ensure_future(related_documents())
+
+    try:
+        rest = await rest_task
+    except Exception as e:
+        logger.error(f"ChatPipeline run error: {e}")
+        return (*_get_degraded_documents_and_context(query, filters, e, query_embedding, faq_documents), None)
+    pipeline_output = {"faq_documents": faq_documents, **rest}
+    _cache_retrieval(query, filters, pipeline_output)
+    citations, context = build_citations_and_context(pipeline_output)
+    return citations, context, None
+
+async def _resolve_related_documents(
+    pending_related: Optional["asyncio.Future[List[Dict[str, Any]]]"],
+    related_list: List[Dict[str, Any]],
+    wait: bool
+) -> tuple[Optional["asyncio.Future[List[Dict[str, Any]]]"], List[Dict[str, Any]]]:
+    if pending_related is None or (not wait and not pending_related.done()):
+        return pending_related, related_list
+    try:
+        return None, await pending_related
+    except Exception as e:
+        logger.warning(f"Could not retrieve related documents for speculative stream: {e}")
+        return None, related_list
 
 async def _stream_response_generator(
-    llm_client_stream: AsyncGenerator,
+    llm_client_stream: LLMStream,
     citations_list: List[Dict[str, Any]],
     user_query: str,
     start_time: float,
-    rag_hit: bool
+    rag_hit: bool,
+    conversation_id: Optional[str] = None,
+    pending_related: Optional["asyncio.Future[List[Dict[str, Any]]]"] = None,
+    answer_cache_key: Optional[str] = None,
+    trace: Optional[RequestTrace] = None
 ) -> AsyncGenerator[str, None]:
-    full_bot_answer = ""
-    async for chunk in llm_client_stream:
-        delta_content = chunk.choices[0].delta.content
-        delta_role = chunk.choices[0].delta.role
-        finish_reason = chunk.choices[0].finish_reason
-
-        current_delta: Dict[str, Any] = {}
-        if delta_role:
-            current_delta["role"] = delta_role
-        if delta_content:
-            current_delta["content"] = delta_content
-            full_bot_answer += delta_content
+    """
+    Re-emits the LLM stream as SSE chunks. `pending_related`, when given (speculative FAQ answers),
+    resolves to the web/files hits that were not in the prompt; chunks carry them as
+    `related_documents` once known, apart from the `citations` the answer was generated from.
+    The complete answer is stored under `answer_cache_key`, when given.
+    """
+    if trace is not None:
+        # The body is streamed from another task than the endpoint's.
+        trace.task = asyncio.current_task()
+    stream_started = time.perf_counter()
+    related_list: Optional[List[Dict[str, Any]]] = [] if pending_related is not None else None
+    try:
+        full_bot_answer = ""
+        async for chunk in llm_client_stream:
+            delta_content = chunk.choices[0].delta.content
+            delta_role = chunk.choices[0].delta.role
+            finish_reason = chunk.choices[0].finish_reason
+
+            current_delta: Dict[str, Any] = {}
+            if delta_role:
+                current_delta["role"] = delta_role
+            if delta_content:
+                current_delta["content"] = delta_content
+                full_bot_answer += delta_content
         
-        chunk_choices = [{
-            "index": 0,
-            "delta": current_delta,
-            "finish_reason": finish_reason
-        }]
+            chunk_choices = [{
+                "index": 0,
+                "delta": current_delta,
+                "finish_reason": finish_reason
+            }]
+            if related_list is not None:
+                pending_related, related_list = await _resolve_related_documents(pending_related, related_list, wait=bool(finish_reason))
         
-        response_chunk_dict = {
-            "id": chunk.id,
-            "object": "chat.completion.chunk",
-            "created": chunk.created,
-            "model": chunk.model,
-            "choices": chunk_choices,
-            "citations": citations_list
-        }
+            response_chunk_dict = {
+                "id": chunk.id,
+                "object": "chat.completion.chunk",
+                "created": chunk.created,
+                "model": chunk.model,
+                "choices": chunk_choices,
+                "citations": citations_list
+            }
+            if related_list is not None:
+                response_chunk_dict["related_documents"] = related_list
         
-        if finish_reason:
-            augmented_json = copy.deepcopy(response_chunk_dict)
-            end_time = time.time()
-            resolve_time_ms = (end_time - start_time) * 1000
-            final_answer_to_log = full_bot_answer
-            if not citations_list:
-                # augmented_message = "\n\n---\nThis answer was generated by an AI model and may not be accurate or reliable. Please verify the information independently."
-                augmented_message = "\n\n---\nChú ý: Đây là một câu trả lời tự động và có thể không chính xác. Vui lòng kiểm tra thông tin lại."
-                augmented_json["choices"][0]["finish_reason"] = None
-                augmented_json["choices"][0]["delta"]["content"] = augmented_message
-                final_answer_to_log += augmented_message
-
-            stats_data = QueryStats(
-                user_query=user_query,
-                resolve_time_ms=resolve_time_ms,
-                bot_answer=final_answer_to_log.strip(),
-                rag_hit=rag_hit,
-                created_at=datetime.utcnow()
-            )
-            try:
-                await database.insert_query_stats(stats_data)
-            except Exception as e:
-                logger.error(f"Error inserting query stats during streaming: {e}")
-            yield f"data: {json.dumps(augmented_json)}\n\n"
+            if finish_reason:
+                # Only the choice is modified below; the citations are shared, not deep-copied.
+                augmented_json = {**response_chunk_dict, "choices": [{**chunk_choices[0], "delta": dict(current_delta)}]}
+                end_time = time.time()
+                resolve_time_ms = (end_time - start_time) * 1000
+                final_answer_to_log = full_bot_answer
+                if not citations_list:
+                    # augmented_message = "\n\n---\nThis answer was generated by an AI model and may not be accurate or reliable. Please verify the information independently."
+                    augmented_message = "\n\n---\nChú ý: Đây là một câu trả lời tự động và có thể không chính xác. Vui lòng kiểm tra thông tin lại."
+                    augmented_json["choices"][0]["finish_reason"] = None
+                    augmented_json["choices"][0]["delta"]["content"] = augmented_message
+                    final_answer_to_log += augmented_message
+                elif answer_cache_key:
+                    query_caches.answers.set(answer_cache_key, full_bot_answer)
 
-        yield f"data: {json.dumps(response_chunk_dict)}\n\n"
+                if trace is not None:
+                    trace.spans.append({
+                        "name": "llm_stream",
+                        "start_ms": round((stream_started - trace.started) * 1000, 1),
+                        "duration_ms": round((time.perf_counter() - stream_started) * 1000, 1),
+                    })
+                stats_data = QueryStats(
+                    user_query=user_query,
+                    resolve_time_ms=resolve_time_ms,
+                    bot_answer=final_answer_to_log.strip(),
+                    rag_hit=rag_hit,
+                    conversation_id=conversation_id,
+                    created_at=datetime.utcnow(),
+                    slow_request=finish_trace(trace)
+                )
+                try:
+                    await database.insert_query_stats(stats_data)
+                except Exception as e:
+                    logger.error(f"Error inserting query stats during streaming: {e}")
+                yield f"data: {json.dumps(augmented_json)}\n\n"
 
-    yield "data: [DONE]\n\n"
+            yield f"data: {json.dumps(response_chunk_dict)}\n\n"
+
+        yield "data: [DONE]\n\n"
+    finally:
+        if pending_related is not None and not pending_related.done():
+            pending_related.cancel()
+        await llm_client_stream.aclose()
 
 
 @router.post("/v1/chat/completions", tags=["Completions"])
-async def chat_completions_endpoint(request: Request):
+async def chat_completions_endpoint(request: Request, response: Response):
     """
     OpenAI-compatible chat completions endpoint with RAG and citations.
     Supports streaming and non-streaming responses.
     """
     start_time = time.time()
+    trace = start_trace("chat_completions")
     try:
         request_data = await request.json()
     except json.JSONDecodeError:
@@ -174,51 +305,115 @@ async def chat_completions_endpoint(request: Request):
     if not isinstance(is_stream, bool):
         is_stream = False
 
+    try:
+        filters = parse_filters(request_data.get("filters"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     logger.info(f"Received chat completion request. Stream: {is_stream}. Query: '{user_query[:50]}...'")
 
+    # `conversation_id` keys the cached conversation state and is only set by the client;
+    # `stats_conversation_id` also groups the turns of conversations sent without one.
+    conversation_id = stats_conversation_id = None
+    history: List[Dict[str, str]] = []
+    is_conversation = settings.CONVERSATION_ENABLED and len(get_user_turns(messages)) > 1
+    if is_conversation:
+        conversation_id = get_conversation_id(request_data, request)
+        stats_conversation_id = conversation_id or get_transcript_key(messages)
+        history = get_bounded_history(messages)
+
+    pending_related = None
     try:
-        citations, context = await _get_documents_and_context(user_query)
+        with span("retrieval"):
+            if is_conversation:
+                citations, context = await _get_conversation_documents_and_context(conversation_id, messages, filters)
+            elif is_stream and settings.FAQ_ENABLE_PARAPHRASING and settings.FAQ_SPECULATIVE_STREAMING:
+                citations, context, pending_related = await _get_documents_and_context_speculative(user_query, filters)
+            else:
+                citations, context = await _get_documents_and_context(user_query, filters)
     except HTTPException as e:
         raise e
     except Exception as e:
         logger.error(f"Error getting documents and context: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve or process documents.")
 
+    # Set when retrieval was unavailable and the answer is served in a degraded mode.
+    degraded_mode = get_degraded_mode()
+    degraded_headers = {"X-Degraded-Mode": degraded_mode} if degraded_mode else None
+    if degraded_headers:
+        response.headers.update(degraded_headers)
+
     rag_hit = bool(citations)
     answer_from_rag = citations[0]["meta"].get("answer", "") if citations else ""
+    precomputed_paraphrase = None
+    if citations and settings.FAQ_ENABLE_PARAPHRASING:
+        precomputed_paraphrase = get_precomputed_paraphrase(citations[0]["content"], citations[0]["meta"])
+        if precomputed_paraphrase:
+            answer_from_rag = precomputed_paraphrase
+            if pending_related is not None:
+                pending_related.cancel()
     
-    if settings.FAQ_ENABLE_PARAPHRASING or not citations or not answer_from_rag:
+    needs_llm = (settings.FAQ_ENABLE_PARAPHRASING and not precomputed_paraphrase) or not citations or not answer_from_rag
+    # Answers of standalone queries with retrieved context are cached (and precomputed by the warm-up);
+    # while degraded, the cache is only read.
+    answer_cache_key = get_query_key(user_query) if settings.CACHE_ENABLED and (citations or degraded_mode) and not filters and not is_conversation else None
+    if needs_llm and answer_cache_key:
+        # While degraded, the last known answer is served even if it expired.
+        cached_answer = query_caches.answers.get(answer_cache_key, allow_stale=bool(degraded_mode))
+        if cached_answer:
+            logger.info("Serving a cached answer.")
+            answer_from_rag, needs_llm = cached_answer, False
+            if pending_related is not None:
+                pending_related.cancel()
+    if degraded_mode:
+        # Answers generated from degraded context would outlive the outage under the normal key.
+        answer_cache_key = None
+
+    if needs_llm:
         logger.info(f"RAG hit: {rag_hit}. Answer from RAG: '{answer_from_rag[:50]}...'")
         llm = LLM()
 
         if is_stream:
+            llm_client_stream = None
             try:
-                llm_client_stream = await llm.get_answer_async_stream(
-                    query=user_query,
-                    context=context
-                )
+                with span("llm_first_chunk"):
+                    llm_client_stream = await llm.get_answer_async_stream(
+                        query=user_query,
+                        context=context,
+                        history=history
+                    )
                
                 generator = _stream_response_generator(
                     llm_client_stream=llm_client_stream,
                     citations_list=citations,
                     user_query=user_query,
                     start_time=start_time,
-                    rag_hit=rag_hit
+                    rag_hit=rag_hit,
+                    conversation_id=stats_conversation_id,
+                    pending_related=pending_related,
+                    answer_cache_key=answer_cache_key,
+                    trace=trace
                 )
-                return StreamingResponse(generator, media_type="text/event-stream")
+                return StreamingResponse(generator, media_type="text/event-stream", headers=degraded_headers)
 
             except Exception as e:
                 logger.error(f"Streaming error: {e}")
+                if pending_related is not None:
+                    pending_related.cancel()
+                if llm_client_stream is not None:
+                    await llm_client_stream.aclose()
                 if await request.is_disconnected():
                     logger.warning("Client disconnected during streaming error handling.")
                     return
                 raise HTTPException(status_code=500, detail=f"Streaming failed: {str(e)}")
         else:
             try:
-                llm_answer_content_obj = await llm.get_answer_async(
-                    query=user_query,
-                    context=context
-                )
+                with span("llm"):
+                    llm_answer_content_obj = await llm.get_answer_async(
+                        query=user_query,
+                        context=context,
+                        history=history
+                    )
                 response_dict = llm_answer_content_obj.to_dict()
                 bot_answer = response_dict["choices"][0]["message"]["content"]
                 if not citations:
@@ -226,6 +421,8 @@ async def chat_completions_endpoint(request: Request):
                     augmentation_message = "\n\n---\n\nChú ý: Đây là một câu trả lời tự động và có thể không chính xác. Vui lòng kiểm tra thông tin lại."
                     bot_answer += augmentation_message
                     response_dict["choices"][0]["message"]["content"] = bot_answer
+                elif answer_cache_key:
+                    query_caches.answers.set(answer_cache_key, bot_answer)
 
                 response_dict["citations"] = citations
                 end_time = time.time()
@@ -235,7 +432,9 @@ async def chat_completions_endpoint(request: Request):
                     resolve_time_ms=resolve_time_ms,
                     bot_answer=bot_answer.strip(),
                     rag_hit=rag_hit,
-                    created_at=datetime.utcnow()
+                    conversation_id=stats_conversation_id,
+                    created_at=datetime.utcnow(),
+                    slow_request=finish_trace(trace)
                 )
                 await database.insert_query_stats(stats_data)
                 return response_dict
@@ -248,7 +447,9 @@ async def chat_completions_endpoint(request: Request):
                     resolve_time_ms=resolve_time_ms,
                     bot_answer=f"Error: {str(e)}",
                     rag_hit=rag_hit,
-                    created_at=datetime.utcnow()
+                    conversation_id=stats_conversation_id,
+                    created_at=datetime.utcnow(),
+                    slow_request=finish_trace(trace)
                 )
                 try:
                     await database.insert_query_stats(error_stats)
@@ -265,7 +466,9 @@ async def chat_completions_endpoint(request: Request):
             resolve_time_ms=resolve_time_ms,
             bot_answer=bot_answer.strip(),
             rag_hit=True,
-            created_at=datetime.utcnow()
+            conversation_id=stats_conversation_id,
+            created_at=datetime.utcnow(),
+            slow_request=finish_trace(trace)
         )
         await database.insert_query_stats(stats_data)
 
@@ -288,7 +491,7 @@ async def chat_completions_endpoint(request: Request):
             async def async_stream_response():
                 yield f"data: {json.dumps(json_response)}\n\n"
                 yield "data: [DONE]\n\n"
-            return StreamingResponse(async_stream_response(), media_type="text/event-stream")
+            return StreamingResponse(async_stream_response(), media_type="text/event-stream", headers=degraded_headers)
         else:
             json_response = {
                 "id": str(uuid.uuid4()),
@@ -0,0 +1,57 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.utils.breakers import OPEN, STATE_VALUES, breaker_status, degraded_responses
+from app.utils.llm import backend_pool
+
+router = APIRouter()
+
+_BREAKER_COUNTERS = {
+    "successes": "Calls to the dependency that succeeded within the latency budget.",
+    "failures": "Calls to the dependency that failed.",
+    "timeouts": "Calls to the dependency that exceeded the latency budget.",
+    "rejected": "Calls rejected without reaching the dependency because the breaker was open.",
+    "opened": "Times the breaker opened.",
+}
+
+@router.get("/health")
+async def health_endpoint():
+    """
+    Liveness of the worker serving the request, with the state of its dependency circuit breakers and
+    LLM backends. `status` is `degraded` while a breaker is open or no LLM backend is healthy; the
+    worker still answers then (see the degraded modes), so the response is always a 200.
+    """
+    breakers = breaker_status()
+    llm_backends = backend_pool.status()
+    degraded = any(status["state"] == OPEN for status in breakers.values()) or not any(backend["healthy"] for backend in llm_backends)
+    return {
+        "status": "degraded" if degraded else "ok",
+        "breakers": breakers,
+        "llm_backends": llm_backends,
+        "degraded_responses": dict(degraded_responses),
+    }
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Circuit breaker, degraded-mode and LLM backend metrics of this worker in the Prometheus text format."""
+    breakers = breaker_status()
+    lines = [
+        "# HELP circuit_breaker_state Circuit breaker state (0 closed, 1 half-open, 2 open).",
+        "# TYPE circuit_breaker_state gauge",
+        *(f'circuit_breaker_state{{dependency="{name}"}} {STATE_VALUES[status["state"]]}' for name, status in breakers.items()),
+    ]
+    for counter, description in _BREAKER_COUNTERS.items():
+        lines += [
+            f"# HELP circuit_breaker_{counter}_total {description}",
+            f"# TYPE circuit_breaker_{counter}_total counter",
+            *(f'circuit_breaker_{counter}_total{{dependency="{name}"}} {status[counter]}' for name, status in breakers.items()),
+        ]
+    lines += [
+        "# HELP degraded_responses_total Chat completions answered in a degraded mode.",
+        "# TYPE degraded_responses_total counter",
+        *(f'degraded_responses_total{{mode="{mode}"}} {count}' for mode, count in sorted(degraded_responses.items())),
+        "# HELP llm_backend_healthy Whether the LLM backend is in rotation (1) or cooling down (0).",
+        "# TYPE llm_backend_healthy gauge",
+        *(f'llm_backend_healthy{{backend="{backend["name"]}"}} {int(backend["healthy"])}' for backend in backend_pool.status()),
+    ]
+    return "\n".join(lines) + "\n"
@@ -2,8 +2,12 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.concurrency import run_in_threadpool
 from app.utils.pipelines import ChatPipeline
 from app.envs import settings
-from app.models.query import Query, QueryResponse
-from app.utils.llm import LLM
+from app.models.query import Query, QueryResponse, BatchQuery, BatchQueryResponse
+from app.utils.llm import LLM, order_passages
+from app.utils.paraphrase import get_precomputed_paraphrase
+from app.utils.filters import parse_filters
+from app.utils.query_cache import query_caches
+from app.utils.profiling import finish_trace, span, start_trace
 from loguru import logger
 
 router = APIRouter()
@@ -13,12 +17,18 @@ async def query_endpoint(query_request: Query):
     """
     Endpoint to handle query requests.
     """
+    try:
+        filters = parse_filters(query_request.filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    trace = start_trace("query")
     try:
         # Initialize the pipeline
         pipeline = ChatPipeline()
         
         # Run the pipeline with the provided query
-        pipeline_output = await run_in_threadpool(pipeline.run, query_request.query)
+        pipeline_output = await run_in_threadpool(pipeline.run, query_request.query, filters)
         
         # Extract relevant information from the pipeline output
         faq_documents = pipeline_output.get("faq_documents", [])
@@ -36,6 +46,14 @@ async def query_endpoint(query_request: Query):
                     file_documents=file_documents,
                     llm_answer=faq_documents[0].meta.get('answer', "")
                 )
+            precomputed_paraphrase = get_precomputed_paraphrase(faq_documents[0].content, faq_documents[0].meta)
+            if precomputed_paraphrase:
+                return QueryResponse(
+                    faq_documents=faq_documents,
+                    web_documents=web_documents,
+                    file_documents=file_documents,
+                    llm_answer=precomputed_paraphrase
+                )
 
         # Initialize LLM
         llm = LLM()
@@ -43,15 +61,16 @@ async def query_endpoint(query_request: Query):
         # Get answer from LLM using the retrieved documents
         context_parts = []
         if faq_documents:
-            context_parts.extend([doc.content for doc in faq_documents if doc.content])
+            context_parts.extend([doc.content for doc in order_passages(faq_documents) if doc.content])
         if web_documents:
-            context_parts.extend([doc.content for doc in web_documents if doc.content])
+            context_parts.extend([doc.content for doc in order_passages(web_documents) if doc.content])
         if file_documents:
-            context_parts.extend([doc.content for doc in file_documents if doc.content])
+            context_parts.extend([doc.content for doc in order_passages(file_documents) if doc.content])
         
         context = "\n\n".join(context_parts)
         
-        llm_answer = await run_in_threadpool(llm.get_answer, query_request.query, context if context else "")
+        with span("llm"):
+            llm_answer = await run_in_threadpool(llm.get_answer, query_request.query, context if context else "")
         
         return QueryResponse(
             faq_documents=faq_documents,
@@ -62,3 +81,54 @@ async def query_endpoint(query_request: Query):
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Slow requests are logged with their step timings and stack samples.
+        finish_trace(trace)
+
+
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def batch_query_endpoint(batch_request: BatchQuery):
+    """
+    Endpoint to retrieve documents for many queries in one call.
+    """
+    if len(batch_request.queries) > settings.QUERY_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {settings.QUERY_BATCH_MAX_SIZE} queries are allowed per batch.")
+    try:
+        filters = parse_filters(batch_request.filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        pipeline = ChatPipeline()
+        pipeline_outputs = await run_in_threadpool(pipeline.run_batch, batch_request.queries, filters)
+
+        results = []
+        for pipeline_output in pipeline_outputs:
+            faq_documents = pipeline_output["faq_documents"]
+            llm_answer = None
+            if faq_documents and not settings.FAQ_ENABLE_PARAPHRASING:
+                llm_answer = faq_documents[0].meta.get('answer', "")
+            elif faq_documents:
+                llm_answer = get_precomputed_paraphrase(faq_documents[0].content, faq_documents[0].meta)
+            results.append(QueryResponse(
+                faq_documents=faq_documents,
+                web_documents=pipeline_output["web_documents"],
+                file_documents=pipeline_output["file_documents"],
+                llm_answer=llm_answer
+            ))
+        return BatchQueryResponse(results=results)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/query/cache")
+async def query_cache_endpoint():
+    """
+    Sizes of this worker's query caches and the report of its last cache warm-up.
+    """
+    return {
+        "enabled": settings.CACHE_ENABLED,
+        "entries": query_caches.stats(),
+        "last_warmup": query_caches.last_warmup,
+    }
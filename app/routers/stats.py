@@ -0,0 +1,30 @@
+from fastapi import APIRouter, HTTPException, Query
+from loguru import logger
+
+from app.database import database
+from app.envs import settings
+from app.models.stats import StatsSummary
+from app.utils.stats import parse_window
+
+router = APIRouter()
+
+@router.get("/stats/summary", response_model=StatsSummary)
+async def stats_summary_endpoint(
+    window: str = Query("24h", description="Time window, e.g. '30m', '24h' or '7d'."),
+    top: int = Query(10, ge=0, le=100, description="Number of top queries to return."),
+):
+    """
+    Query count, RAG hit rate, error rate, latency percentiles, a per-minute or per-hour series and
+    the top queries of the last `window`, answered from the stats rollups.
+    """
+    if not settings.STATS_ROLLUPS_ENABLED:
+        raise HTTPException(status_code=404, detail="Stats rollups are disabled (STATS_ROLLUPS_ENABLED=false).")
+    try:
+        window_delta = parse_window(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return await database.get_stats_summary(window_delta, top)
+    except Exception as e:
+        logger.error(f"Error summarizing query stats: {e}")
+        raise HTTPException(status_code=500, detail=f"Could not summarize query stats: {str(e)}")
@@ -4,10 +4,14 @@ from pathlib import Path
 from typing import List, Annotated
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
+from fastapi.concurrency import run_in_threadpool
 from loguru import logger
 
+from app.envs import settings
 from app.models.upload import FileUploadParams, FileUploadRequest
 from app.utils.pipelines import FileProcessingPipeline
+from app.utils.profiling import finish_trace, start_trace
+from app.utils.query_cache import query_caches
 
 router = APIRouter()
 
@@ -47,6 +51,7 @@ async def upload_and_process_files(
     processed_files_paths: List[Path] = []
     results = []
 
+    trace = start_trace("upload_files")
     try:
         for uploaded_file in files:
             if not uploaded_file.filename:
@@ -67,20 +72,43 @@ async def upload_and_process_files(
         file_pipeline = FileProcessingPipeline(file_upload_params=params)
         
         logger.info(f"Running pipeline for files: {processed_files_paths}")
-        pipeline_result = file_pipeline.run(file_paths=processed_files_paths)
-                
+        pipeline_result = await run_in_threadpool(file_pipeline.run, file_paths=processed_files_paths)
+
+        if settings.CACHE_ENABLED and pipeline_result["documents_written"]:
+            # Cached retrievals predate the new documents. Other workers drop theirs at their next
+            # version check, which sees the `files` point count change.
+            query_caches.clear_results()
+
+        succeeded = sum(report["status"] != "failed" for report in pipeline_result["files"].values())
+        status = "ok" if succeeded == len(processed_files_paths) else "partial" if succeeded else "failed"
         results.append({
-            "message": f"Successfully processed {len(processed_files_paths)} files.",
+            "message": f"Successfully processed {succeeded} of {len(processed_files_paths)} files.",
+            "status": status,
             "processed_files": [str(p.name) for p in processed_files_paths],
-            "pipeline_output_keys": list(pipeline_result.keys()) if pipeline_result else []
+            "upload_id": pipeline_result["upload_id"],
+            "documents_written": pipeline_result["documents_written"],
+            "seconds": pipeline_result["seconds"],
+            "files": pipeline_result["files"],
+            "deduplication": pipeline_result["deduplication"],
         })
-        logger.info(f"Files processed successfully: {[str(p.name) for p in processed_files_paths]}")
+        if status == "failed":
+            logger.error(f"None of the files could be processed: {[str(p.name) for p in processed_files_paths]}")
+        else:
+            logger.info(f"Files processed ({status}): {[str(p.name) for p in processed_files_paths]}")
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error during file processing: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An error occurred during file processing: {str(e)}")
     finally:
         logger.info(f"Cleaning up temporary directory: {temp_dir}")
         shutil.rmtree(temp_dir)
+        # Slow uploads are logged with their conversion and indexing spans and stack samples.
+        finish_trace(trace)
 
-    return {"detail": "Files processed and indexed successfully.", "results": results}
+    if status == "failed":
+        # Every file failed to convert or timed out; the per-file errors are in the results.
+        raise HTTPException(status_code=422, detail={"message": "None of the files could be processed.", "status": status, "results": results})
+    detail = "Files processed and indexed successfully." if status == "ok" else "Some files could not be processed; see the per-file status."
+    return {"detail": detail, "status": status, "results": results}
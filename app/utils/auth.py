@@ -0,0 +1,17 @@
+import secrets
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from app.envs import settings
+
+
+async def require_admin(x_admin_key: Optional[str] = Header(default=None)):
+    """
+    Dependency of admin-only endpoints: requires the `X-Admin-Key` header to match `ADMIN_API_KEY`.
+    Admin endpoints are disabled while no key is configured.
+    """
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_API_KEY is not set).")
+    if not x_admin_key or not secrets.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Key header.")
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+from haystack import Document
+from loguru import logger
+
+from app.envs import settings
+from app.utils.citations import build_citations_and_context, get_rag_answer
+from app.utils.embedders import embedder
+from app.utils.llm import LLM
+from app.utils.pipelines import ChatPipeline
+
+_QUESTION_FIELDS = ("question", "query")
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """
+    Reads the questions of a CSV or JSONL file. The question is taken from a `question` (or `query`)
+    column or key; JSONL lines may also be plain strings. The `id` column or key identifies a question
+    in the output and when resuming (default: its 1-based row number); other fields are passed through.
+    :return: `{"id": str, "question": str, "fields": dict}` per non-empty question, in file order.
+    """
+    if path.endswith(".csv"):
+        rows = pd.read_csv(path, dtype=str, keep_default_na=False).to_dict(orient="records")
+    elif path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        raise ValueError(f"Unsupported questions file: {path}. Must be CSV or JSONL.")
+
+    questions = []
+    for number, row in enumerate(rows, start=1):
+        if isinstance(row, str):
+            row = {"question": row}
+        field = next((name for name in _QUESTION_FIELDS if name in row), None)
+        if field is None:
+            raise KeyError(f"Row {number} of {path} has no 'question' or 'query' field.")
+        question = str(row[field] or "").strip()
+        if question:
+            fields = {key: value for key, value in row.items() if key not in (field, "id")}
+            questions.append({"id": str(row.get("id") or number), "question": question, "fields": fields})
+    return questions
+
+
+def load_checkpoint(path: Path) -> Dict[str, Dict[str, Any]]:
+    """The last record of each question id in an output file; missing files are empty checkpoints."""
+    records: Dict[str, Dict[str, Any]] = {}
+    if not path.exists():
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short when the previous run was killed.
+                continue
+            records[record["id"]] = record
+    return records
+
+
+class RateLimiter:
+    """Spaces calls at least `1 / rate` seconds apart; no limit when `rate` is 0."""
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    return {f"p{q}": round(float(np.percentile(values, q)), 1) for q in (50, 95, 99)}
+
+
+async def answer_questions(
+    input_path: str,
+    output_path: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    rate_limit: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Answers the questions of a CSV or JSONL file offline through the same retrieval and answer logic
+    as `/v1/chat/completions` (FAQ answer or precomputed paraphrase when it has one, LLM otherwise).
+
+    Questions are embedded in one embedder request and searched with Qdrant batch requests per
+    `batch_size`; LLM calls run with at most `concurrency` in flight and `rate_limit` per second,
+    overlapping the retrieval of the next batches. Each result is appended to `output_path` (JSONL) as
+    soon as it is known. Questions that already have a successful record there are skipped, so an
+    interrupted run resumes where it stopped; failed ones are retried. Nothing is written to
+    `query_stats` or the query caches.
+    :return: A report of this run: counts, throughput, latency percentiles and RAG hit rate.
+    """
+    batch_size = batch_size or settings.BATCH_ANSWER_BATCH_SIZE
+    concurrency = concurrency or settings.BATCH_ANSWER_CONCURRENCY
+    rate_limit = settings.BATCH_ANSWER_RATE_LIMIT if rate_limit is None else rate_limit
+    output = Path(output_path or f"{Path(input_path).with_suffix('')}.answers.jsonl")
+
+    questions = load_questions(input_path)
+    done = {record_id for record_id, record in load_checkpoint(output).items() if not record.get("error")}
+    pending_questions = [question for question in questions if question["id"] not in done]
+    logger.info(
+        f"Batch answering {len(pending_questions)} of {len(questions)} questions from '{input_path}' into '{output}' "
+        f"({len(questions) - len(pending_questions)} already answered; batch size {batch_size}, "
+        f"concurrency {concurrency}, rate limit {rate_limit or 'none'}/s)."
+    )
+
+    chat_pipeline = ChatPipeline()
+    llm = LLM()
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate_limit)
+    records: List[Dict[str, Any]] = []
+    started = time.perf_counter()
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(output, "a", encoding="utf-8") as f:
+        def write(question: Dict[str, Any], batch_started: float, **result):
+            record = {
+                "id": question["id"],
+                "question": question["question"],
+                **result,
+                "latency_ms": round((time.perf_counter() - batch_started) * 1000, 1),
+                # Under their own key: a question bank may well have an `answer` column of its own.
+                "fields": question["fields"],
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            # Flushed per record: the file is the checkpoint a resumed run starts from.
+            f.flush()
+            records.append(record)
+
+        async def answer(question: Dict[str, Any], batch_started: float, citations: List[Dict[str, Any]], context: str):
+            sources = [{"id": citation["id"], "source": citation["source"], "score": citation["score"]} for citation in citations]
+            rag_answer = get_rag_answer(citations)
+            if rag_answer:
+                write(question, batch_started, answer=rag_answer, answered_by="faq", rag_hit=True, citations=sources, llm_ms=None, error=None)
+                return
+            async with semaphore:
+                await limiter.wait()
+                llm_started = time.perf_counter()
+                try:
+                    response = await llm.get_answer_async(query=question["question"], context=context)
+                    result = {"answer": response.choices[0].message.content, "error": None}
+                except Exception as e:
+                    logger.warning(f"Could not answer question {question['id']}: {e}")
+                    result = {"answer": None, "error": f"{type(e).__name__}: {e}"}
+                llm_ms = round((time.perf_counter() - llm_started) * 1000, 1)
+            write(question, batch_started, **result, answered_by="llm", rag_hit=bool(citations), citations=sources, llm_ms=llm_ms)
+
+        tasks: set = set()
+        for start in range(0, len(pending_questions), batch_size):
+            batch = pending_questions[start:start + batch_size]
+            batch_started = time.perf_counter()
+            try:
+                embedded = await run_in_threadpool(embedder.run, documents=[Document(content=question["question"]) for question in batch])
+                outputs = await run_in_threadpool(chat_pipeline.retrieve_batch, [document.embedding for document in embedded["documents"]])
+            except Exception as e:
+                logger.warning(f"Retrieval for a batch of {len(batch)} questions failed: {e}")
+                for question in batch:
+                    write(question, batch_started, answer=None, answered_by=None, rag_hit=False, citations=[], llm_ms=None, error=f"{type(e).__name__}: {e}")
+                continue
+            for question, pipeline_output in zip(batch, outputs):
+                tasks.add(asyncio.ensure_future(answer(question, batch_started, *build_citations_and_context(pipeline_output))))
+            # Retrieval runs ahead of the LLM calls by a bounded number of questions.
+            while len(tasks) > max(2 * concurrency, batch_size):
+                finished, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    task.result()
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    seconds = time.perf_counter() - started
+    answered = [record for record in records if not record["error"]]
+    report = {
+        "input": input_path,
+        "output": str(output),
+        "questions": len(questions),
+        "skipped": len(questions) - len(pending_questions),
+        "answered": len(answered),
+        "failed": len(records) - len(answered),
+        "answered_by_faq": sum(record["answered_by"] == "faq" for record in answered),
+        "llm_calls": sum(record["answered_by"] == "llm" for record in records),
+        "rag_hit_rate": round(sum(record["rag_hit"] for record in answered) / len(answered), 4) if answered else 0.0,
+        "seconds": round(seconds, 3),
+        "questions_per_second": round(len(records) / seconds, 2) if seconds > 0 else 0.0,
+        "latency_ms": _percentiles([record["latency_ms"] for record in records]),
+        "llm_ms": _percentiles([record["llm_ms"] for record in records if record["llm_ms"] is not None]),
+    }
+    logger.info(
+        f"Batch answering: {report['answered']} answered ({report['answered_by_faq']} from the FAQ), {report['failed']} failed, "
+        f"{report['skipped']} skipped in {report['seconds']}s ({report['questions_per_second']} questions/s); "
+        f"RAG hit rate {report['rag_hit_rate']:.1%}; latency p50 {report['latency_ms']['p50']} ms, p99 {report['latency_ms']['p99']} ms."
+    )
+    return report
@@ -0,0 +1,141 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from loguru import logger
+
+from app.envs import settings
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+# Numeric states for the metrics endpoint.
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker with a latency budget for one dependency (Qdrant, the embedder, MongoDB).
+
+    Every call must finish within `timeout` seconds. After `failure_threshold` consecutive failures
+    or timeouts the breaker opens and calls fail immediately with `CircuitOpenError`, instead of
+    each request waiting for the dependency's full client timeout and holding a worker thread.
+    After `reset_timeout` seconds one probe call is let through (half-open); its success closes
+    the breaker, its failure opens it again.
+    """
+    def __init__(self, name: str, timeout: float, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold or settings.BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = settings.BREAKER_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.counters: Counter = Counter()
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; in the half-open state only one probe at a time may."""
+        if not settings.BREAKER_ENABLED:
+            return True
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.counters["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.counters["successes"] += 1
+            self.consecutive_failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                logger.info(f"Circuit breaker '{self.name}' closed.")
+            self.state = CLOSED
+
+    def record_failure(self, error: BaseException):
+        with self._lock:
+            self.counters["timeouts" if isinstance(error, asyncio.TimeoutError) else "failures"] += 1
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.counters["opened"] += 1
+                logger.warning(f"Circuit breaker '{self.name}' opened for {self.reset_timeout}s after {self.consecutive_failures} consecutive failures ({self.last_error}).")
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Awaits `call()` within the latency budget.
+        :raises CircuitOpenError: If the breaker is open.
+        :raises asyncio.TimeoutError: If the call exceeded `timeout` (counted as a failure).
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit breaker open).")
+        try:
+            try:
+                result = await asyncio.wait_for(call(), timeout=self.timeout if settings.BREAKER_ENABLED else None)
+            except asyncio.TimeoutError:
+                raise asyncio.TimeoutError(f"{self.name} did not respond within {self.timeout}s.")
+        except asyncio.CancelledError:
+            with self._lock:
+                self._probing = False
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = round(max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0), 1)
+            return {
+                "state": self.state,
+                "timeout": self.timeout,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in": retry_in,
+                "last_error": self.last_error,
+                **{key: self.counters[key] for key in ("successes", "failures", "timeouts", "rejected", "opened")},
+            }
+
+
+qdrant_breaker = CircuitBreaker("qdrant", timeout=settings.BREAKER_QDRANT_TIMEOUT)
+embedder_breaker = CircuitBreaker("embedder", timeout=settings.BREAKER_EMBEDDER_TIMEOUT)
+mongo_breaker = CircuitBreaker("mongo", timeout=settings.BREAKER_MONGO_TIMEOUT)
+breakers = {breaker.name: breaker for breaker in (qdrant_breaker, embedder_breaker, mongo_breaker)}
+
+# Responses served in degraded mode, per mode (`stale`, `faq_only`, `llm_only`).
+degraded_responses: Counter = Counter()
+_degraded_mode: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("degraded_mode", default=None)
+
+
+def set_degraded_mode(mode: str):
+    """Marks the current request as answered in degraded mode."""
+    _degraded_mode.set(mode)
+    degraded_responses[mode] += 1
+
+
+def get_degraded_mode() -> Optional[str]:
+    return _degraded_mode.get()
+
+
+def breaker_status() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.status() for name, breaker in breakers.items()}
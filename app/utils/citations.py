@@ -0,0 +1,69 @@
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.envs import settings
+from app.utils.llm import order_passages
+from app.utils.paraphrase import get_precomputed_paraphrase
+from app.utils.results import RetrievedDocument
+
+def extract_source_from_meta(meta: Dict[str, Any]) -> Optional[str]:
+    if not meta or not isinstance(meta, dict):
+        return None
+    source_keys = ['name', 'filename', 'file_path', 'url', 'link', 'source_id', 'title']
+    for key in source_keys:
+        if key in meta and isinstance(meta[key], str):
+            return meta[key]
+    if 'id' in meta and isinstance(meta['id'], str):
+        return meta['id']
+    return None
+
+def format_documents_for_citation(documents: List[RetrievedDocument]) -> List[Dict[str, Any]]:
+    """
+    One citation dict per retrieved document. The meta is referenced, not copied: citations are only
+    serialized, never modified.
+    """
+    citations: List[Dict[str, Any]] = []
+    for doc in documents:
+        doc_meta = doc.meta
+        citations.append({
+            "id": doc.id if doc.id is not None else uuid.uuid4().hex,
+            "content": doc.content,
+            "source": extract_source_from_meta(doc_meta),
+            "score": doc.score,
+            "meta": doc_meta
+        })
+    return citations
+
+def build_citations_and_context(pipeline_output: Dict[str, Any]) -> tuple[List[Dict[str, Any]], str]:
+    faq_documents = pipeline_output.get("faq_documents", [])
+    web_documents = pipeline_output.get("web_documents", [])
+    file_documents = pipeline_output.get("file_documents", [])
+
+    all_retrieved_docs = (faq_documents or []) + (web_documents or []) + (file_documents or [])
+    all_retrieved_docs.sort(key=lambda doc: doc.score or 0, reverse=True)
+
+    citations = format_documents_for_citation(all_retrieved_docs)
+
+    context_parts = []
+    if faq_documents:
+        for doc in order_passages(faq_documents):
+            if doc.content:
+                context_parts.append(f"FAQ: {doc.content}. Answer: {doc.meta.get('answer', '')}")
+    if web_documents:
+        context_parts.extend([doc.content for doc in order_passages(web_documents) if doc.content])
+    if file_documents:
+        context_parts.extend([doc.content for doc in order_passages(file_documents) if doc.content])
+    
+    context = "\n\n".join(context_parts)
+    return citations, context
+
+def get_rag_answer(citations: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    The answer `/v1/chat/completions` serves without calling the LLM: the top FAQ hit's answer or, with
+    `FAQ_ENABLE_PARAPHRASING`, its precomputed paraphrase. None when the LLM has to answer.
+    """
+    if not citations:
+        return None
+    if settings.FAQ_ENABLE_PARAPHRASING:
+        return get_precomputed_paraphrase(citations[0]["content"], citations[0]["meta"]) or None
+    return citations[0]["meta"].get("answer", "") or None
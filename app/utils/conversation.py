@@ -0,0 +1,123 @@
+import hashlib
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from fastapi import Request
+
+from app.envs import settings
+from app.utils.cache import TTLCache
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha1(text.strip().encode("utf-8")).hexdigest()
+
+
+class ConversationState:
+    """
+    Per-conversation cache: embeddings of user turns (keyed by turn text) and retrieval
+    results (keyed by the turns that produced them), so a new turn only embeds the delta.
+    """
+    def __init__(self):
+        self.turn_embeddings: Dict[str, List[float]] = {}
+        self.retrievals: Dict[str, tuple[List[Dict[str, Any]], str]] = {}
+
+
+conversations = TTLCache(max_size=settings.CONVERSATION_CACHE_SIZE, ttl=settings.CONVERSATION_CACHE_TTL)
+
+
+def get_conversation_id(request_data: Dict[str, Any], request: Request) -> Optional[str]:
+    """
+    Returns the conversation ID from the `conversation_id` body field or the `X-Conversation-Id`
+    header, which keys the cached conversation state; None when the client sends neither.
+    """
+    conversation_id = request_data.get("conversation_id") or request.headers.get("X-Conversation-Id")
+    return str(conversation_id) if conversation_id else None
+
+
+def get_transcript_key(messages: List[Any]) -> Optional[str]:
+    """
+    Groups the turns of a conversation sent without an ID in the query stats: OpenAI-style clients
+    resend the whole transcript on every turn, so the first user message is stable. Unrelated
+    clients opening with the same question share it, so it never keys conversation state.
+    """
+    turns = get_user_turns(messages)
+    return _text_key(turns[0]) if turns else None
+
+
+def get_conversation_state(conversation_id: str) -> ConversationState:
+    state = conversations.get(conversation_id)
+    if state is None:
+        state = ConversationState()
+    # Re-set on every access so active conversations are kept alive by the TTL.
+    conversations.set(conversation_id, state)
+    return state
+
+
+def get_user_turns(messages: List[Any]) -> List[str]:
+    return [
+        m["content"] for m in messages
+        if isinstance(m, dict) and m.get("role", "user") == "user" and isinstance(m.get("content"), str) and m["content"].strip()
+    ]
+
+
+def get_retrieval_turns(messages: List[Any]) -> List[str]:
+    """The most recent user turns used to condense the retrieval query, oldest first."""
+    return get_user_turns(messages)[-settings.CONVERSATION_RETRIEVAL_TURNS:]
+
+
+def get_retrieval_key(turns: List[str]) -> str:
+    return _text_key("\n".join(turns))
+
+
+def build_retrieval_embedding(state: ConversationState, turns: List[str], embed: Callable[[str], List[float]]) -> List[float]:
+    """
+    Condenses the recent user turns into a single query embedding.
+
+    Each turn is embedded once and cached on the conversation; the latest turn has weight 1 and
+    older turns decay by `CONVERSATION_TURN_DECAY` per step, so follow-ups like "what about the
+    second semester?" keep the topic of the previous questions.
+    """
+    # Requests of the same conversation may run concurrently in threadpool threads: read the cached
+    # embeddings, and replace them (pruned to the retrieval window) in one assignment.
+    cached = state.turn_embeddings
+    embeddings: Dict[str, List[float]] = {}
+    vectors = []
+    weights = []
+    for age, turn in enumerate(reversed(turns)):
+        key = _text_key(turn)
+        embedding = embeddings.get(key) or cached.get(key)
+        if embedding is None:
+            embedding = embed(turn)
+        embeddings[key] = embedding
+        vectors.append(np.asarray(embedding, dtype=np.float32))
+        weights.append(settings.CONVERSATION_TURN_DECAY ** age)
+    state.turn_embeddings = embeddings
+
+    combined = np.average(np.stack(vectors), axis=0, weights=weights)
+    norm = np.linalg.norm(combined)
+    if norm > 0:
+        combined = combined / norm
+    return combined.tolist()
+
+
+def get_bounded_history(messages: List[Any]) -> List[Dict[str, str]]:
+    """
+    Returns the previous user/assistant messages (excluding the last one) to send to the LLM,
+    bounded by `CONVERSATION_MAX_HISTORY_MESSAGES` and `CONVERSATION_MAX_HISTORY_CHARS`.
+    """
+    history: List[Dict[str, str]] = []
+    budget = settings.CONVERSATION_MAX_HISTORY_CHARS
+    for message in reversed(messages[:-1]):
+        if len(history) >= settings.CONVERSATION_MAX_HISTORY_MESSAGES:
+            break
+        if not isinstance(message, dict) or message.get("role") not in ("user", "assistant"):
+            continue
+        content = message.get("content")
+        if not isinstance(content, str) or not content.strip():
+            continue
+        if len(content) > budget:
+            break
+        budget -= len(content)
+        history.append({"role": message["role"], "content": content})
+    history.reverse()
+    return history
@@ -0,0 +1,225 @@
+import io
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from haystack import Document
+from haystack.components.converters import MultiFileConverter, PyPDFToDocument
+from haystack.components.preprocessors import DocumentPreprocessor
+from haystack.dataclasses import ByteStream
+from loguru import logger
+from pypdf import PdfReader, PdfWriter
+
+from app.envs import settings
+from app.utils.profiling import span
+
+# Per worker process: converters are created by `_init_worker`, preprocessors per parameter set.
+_converters: Dict[str, Any] = {}
+_preprocessors: Dict[Tuple, DocumentPreprocessor] = {}
+
+
+def _init_worker(ready):
+    _converters["multi"] = MultiFileConverter()
+    _converters["pdf"] = PyPDFToDocument()
+    ready.release()
+
+
+def _get_preprocessor(params: Dict[str, Any]) -> DocumentPreprocessor:
+    key = tuple(sorted(params.items()))
+    if key not in _preprocessors:
+        _preprocessors[key] = DocumentPreprocessor(**params)
+    return _preprocessors[key]
+
+
+def convert_and_preprocess(path: str, pages: Optional[Tuple[int, int]], params: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], float]:
+    """
+    Converts one file, or pages [start, end) of a PDF, and splits it with `DocumentPreprocessor(**params)`.
+    Runs in a worker process; documents are returned as dicts.
+    """
+    started = time.perf_counter()
+    if pages is None:
+        documents = _converters["multi"].run(sources=[Path(path)])["documents"]
+    else:
+        writer = PdfWriter()
+        reader = PdfReader(path)
+        for page in reader.pages[pages[0]:pages[1]]:
+            writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        source = ByteStream(data=buffer.getvalue(), meta={"file_path": path}, mime_type="application/pdf")
+        documents = _converters["pdf"].run(sources=[source])["documents"]
+    documents = _get_preprocessor(params).run(documents=documents)["documents"]
+    if pages is not None:
+        for document in documents:
+            # Page numbers restart in every range; make them relative to the whole file again.
+            if "page_number" in document.meta:
+                document.meta["page_number"] += pages[0]
+            document.meta["page_range"] = [pages[0] + 1, pages[1]]
+    return [document.to_dict(flatten=False) for document in documents], time.perf_counter() - started
+
+
+class ConversionTask:
+    def __init__(self, path: Path, pages: Optional[Tuple[int, int]] = None):
+        self.path = path
+        self.pages = pages
+        # Times a worker crashed while running this task.
+        self.crashes = 0
+
+
+class ConversionResult:
+    def __init__(self, task: ConversionTask, documents: List[Document], seconds: float, error: Optional[str] = None):
+        self.task = task
+        self.documents = documents
+        self.seconds = seconds
+        self.error = error
+
+
+class ParallelFileConverter:
+    """
+    Converts and preprocesses files in a process pool, one task per file and per
+    `CONVERSION_PDF_PAGES_PER_TASK` pages of a PDF, and yields results as they complete.
+
+    The pool is shared by all uploads of the process, and at most `CONVERSION_WORKERS` tasks are in
+    flight across all of them, so a task is submitted only when a worker is free and its time in the
+    pool is its run time. A task running longer than `CONVERSION_FILE_TIMEOUT` is reported as failed
+    and the pool is restarted (a running task cannot be cancelled otherwise). The tasks that died with
+    it, of this upload or of others, are resubmitted without counting as an attempt; a task whose
+    worker crashed is retried once.
+    """
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Tasks in flight across all runs; a slot is released when its future completes.
+        self._slots = threading.Semaphore(settings.CONVERSION_WORKERS)
+        # Pools restarted because of a timeout: their other tasks were not at fault.
+        self._restarted: "weakref.WeakSet[ProcessPoolExecutor]" = weakref.WeakSet()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is not None and getattr(self._executor, "_broken", False):
+                # A worker crashed; the pool refuses new tasks.
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._executor is None:
+                # Forkserver: workers are forked from a clean single-threaded server process, not from
+                # this one, whose event loop, threadpool, database clients and profiler threads may
+                # hold locks that a fork would copy.
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+                ready = context.Semaphore(0)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.CONVERSION_WORKERS,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(ready,),
+                )
+                self._start_workers(self._executor, ready)
+            return self._executor
+
+    @staticmethod
+    def _start_workers(executor: ProcessPoolExecutor, ready):
+        """
+        Starts every worker and waits until they are initialized, so that worker start-up (which
+        imports the app's main module again; `app.main` keeps that import light) does not count
+        against a task's timeout.
+        """
+        # The pool starts a new worker for each task submitted while none is idle.
+        for _ in range(settings.CONVERSION_WORKERS):
+            executor.submit(os.getpid)
+        deadline = time.monotonic() + settings.CONVERSION_FILE_TIMEOUT
+        for _ in range(settings.CONVERSION_WORKERS):
+            if not ready.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                logger.warning(f"Conversion workers did not all start within {settings.CONVERSION_FILE_TIMEOUT}s.")
+                break
+
+    def _restart(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+            self._restarted.add(executor)
+        # ProcessPoolExecutor has no public way to stop a running task.
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def plan(self, file_paths: List[Path]) -> List[ConversionTask]:
+        tasks = []
+        pages_per_task = settings.CONVERSION_PDF_PAGES_PER_TASK
+        for path in file_paths:
+            page_count = 0
+            if path.suffix.lower() == ".pdf" and pages_per_task > 0:
+                try:
+                    page_count = len(PdfReader(path).pages)
+                except Exception as e:
+                    logger.warning(f"Could not read the page count of {path.name}, converting it as a whole: {e}")
+            if page_count > pages_per_task:
+                tasks.extend(ConversionTask(path, (start, min(start + pages_per_task, page_count))) for start in range(0, page_count, pages_per_task))
+            else:
+                tasks.append(ConversionTask(path))
+        return tasks
+
+    def run(self, tasks: List[ConversionTask], params: Dict[str, Any]) -> Iterator[ConversionResult]:
+        queued = deque(tasks)
+        running: Dict[Future, Tuple[ConversionTask, ProcessPoolExecutor, float]] = {}
+        timeout = settings.CONVERSION_FILE_TIMEOUT
+        try:
+            while queued or running:
+                # Waiting for workers and results is a span of the current (upload) request trace.
+                with span("convert", sync=True):
+                    # Block for a free worker only when nothing of this run is in flight to wait for instead.
+                    while queued and self._slots.acquire(blocking=not running):
+                        task = queued.popleft()
+                        executor = self._get_executor()
+                        try:
+                            future = executor.submit(convert_and_preprocess, str(task.path), task.pages, params)
+                        except BrokenProcessPool:
+                            # Restarted by another run between getting and using it.
+                            self._slots.release()
+                            queued.appendleft(task)
+                            continue
+                        future.add_done_callback(lambda _: self._slots.release())
+                        running[future] = (task, executor, time.monotonic())
+
+                    next_deadline = min(started for _, _, started in running.values()) + timeout
+                    done, _ = wait(running, timeout=max(next_deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                for future in done:
+                    task, executor, started = running.pop(future)
+                    try:
+                        documents, seconds = future.result()
+                        yield ConversionResult(task, [Document.from_dict(d) for d in documents], seconds)
+                    except (BrokenProcessPool, CancelledError) as e:
+                        if executor in self._restarted:
+                            # Killed with the pool because another task (possibly of another run) timed out.
+                            queued.appendleft(task)
+                            continue
+                        task.crashes += 1
+                        if task.crashes < 2:
+                            queued.appendleft(task)
+                        else:
+                            yield ConversionResult(task, [], time.monotonic() - started, error=f"Worker process died: {e}")
+                    except Exception as e:
+                        yield ConversionResult(task, [], time.monotonic() - started, error=f"{type(e).__name__}: {e}")
+
+                now = time.monotonic()
+                expired = [future for future, (_, _, started) in running.items() if now - started >= timeout]
+                for future in expired:
+                    task, executor, started = running.pop(future)
+                    logger.warning(f"Conversion of {task.path.name} (pages {task.pages}) timed out after {timeout}s.")
+                    self._restart(executor)
+                    yield ConversionResult(task, [], now - started, error=f"Timed out after {timeout}s")
+        finally:
+            # The consumer stopped early (e.g. an error while indexing): release what is left of this run.
+            for future, (_, executor, _) in running.items():
+                if not future.cancel() and not future.done():
+                    # Still running, possibly hung: only a restart guarantees its slot comes back.
+                    self._restart(executor)
+
+
+parallel_file_converter = ParallelFileConverter()
@@ -0,0 +1,179 @@
+import hashlib
+import math
+import re
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document, component
+from haystack.document_stores.types import DocumentStore
+from loguru import logger
+
+from app.envs import settings
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# Number of hashes checked per filter request against the document store.
+_EXISTING_LOOKUP_BATCH = 256
+
+
+def normalize_content(content: str) -> str:
+    return " ".join(content.lower().split())
+
+
+def get_content_hash(content: str, meta: Optional[Dict[str, Any]] = None, meta_fields: Tuple[str, ...] = ()) -> str:
+    """Hash of the normalized content (and of `meta_fields`, if any), identifying exact duplicates."""
+    key = normalize_content(content)
+    for field in meta_fields:
+        key += f"\n{normalize_content(str((meta or {}).get(field, '')))}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Picks the LSH banding (bands, rows) whose candidate threshold (1/bands)^(1/rows) is the highest
+    one still below `threshold`, so pairs at the threshold are very likely to become candidates.
+    """
+    best = (num_perm, 1)
+    best_threshold = 0.0
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        candidate_threshold = (1 / bands) ** (1 / rows)
+        if best_threshold < candidate_threshold <= threshold:
+            best, best_threshold = (bands, rows), candidate_threshold
+    return best
+
+
+@component
+class DocumentDeduplicator:
+    """
+    Drops duplicate documents before they are embedded.
+
+    Exact duplicates are found by a hash of the normalized content. Near-duplicates (repeated
+    headers/footers, near-identical crawled pages) are found with MinHash signatures over word
+    shingles and LSH banding: a document is dropped when its estimated Jaccard similarity to an
+    already kept document is at least `threshold`. With a `document_store`, documents whose content
+    hash is already stored (e.g. a re-uploaded file) are dropped too.
+
+    Kept documents get `content_hash` and, when they absorbed duplicates, `duplicates` in their meta.
+    State is kept across `run` calls, so documents fed in several batches (e.g. one per converted
+    file) are deduplicated against each other too.
+    """
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        near_duplicates: bool = True,
+        meta_fields: Tuple[str, ...] = (),
+        document_store: Optional[DocumentStore] = None,
+        shingle_size: Optional[int] = None,
+        num_perm: Optional[int] = None,
+    ):
+        """
+        :param meta_fields: Meta fields that must also match for documents to be duplicates
+            (e.g. the answer of an FAQ entry). Near-duplicate detection only looks at the content.
+        """
+        self.threshold = settings.DEDUP_THRESHOLD if threshold is None else threshold
+        self.near_duplicates = near_duplicates
+        self.meta_fields = tuple(meta_fields)
+        self.document_store = document_store
+        self.shingle_size = shingle_size or settings.DEDUP_SHINGLE_SIZE
+        self.num_perm = num_perm or settings.DEDUP_NUM_PERM
+        self.bands, self.rows = _choose_bands(self.num_perm, self.threshold)
+        rng = np.random.default_rng(1)
+        self._a = rng.integers(1, 1 << 32, size=self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=self.num_perm, dtype=np.uint64)
+        self.reset()
+
+    def reset(self):
+        self._kept: List[Document] = []
+        self._kept_by_hash: Dict[str, Document] = {}
+        self._signatures: List[np.ndarray] = []
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+
+    def _signature(self, content: str) -> np.ndarray:
+        words = re.findall(r"\w+", content.lower())
+        if len(words) <= self.shingle_size:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # (a * h + b) mod p for every permutation at once; a, h < 2^32 so the product fits in uint64.
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def _existing_hashes(self, hashes: List[str]) -> set:
+        if self.document_store is None or not hashes:
+            return set()
+        existing = set()
+        for start in range(0, len(hashes), _EXISTING_LOOKUP_BATCH):
+            batch = hashes[start:start + _EXISTING_LOOKUP_BATCH]
+            try:
+                documents = self.document_store.filter_documents(
+                    filters={"field": "meta.content_hash", "operator": "in", "value": batch}
+                )
+            except Exception as e:
+                logger.warning(f"Could not look up already indexed duplicates: {e}")
+                return existing
+            existing.update(doc.meta.get("content_hash") for doc in documents)
+        return existing
+
+    @component.output_types(documents=List[Document], stats=Dict[str, int])
+    def run(self, documents: List[Document]):
+        """
+        :returns: The kept documents, in input order, and a report of what was dropped and how many
+            embedding requests that saves (at the embedder's batch size).
+        """
+        kept: List[Document] = []
+        kept_by_hash, signatures, buckets = self._kept_by_hash, self._signatures, self._buckets
+        stats = {"documents": len(documents), "exact_duplicates": 0, "near_duplicates": 0, "already_indexed": 0}
+
+        hashes = [get_content_hash(doc.content or "", doc.meta, self.meta_fields) for doc in documents]
+        existing = self._existing_hashes(sorted(set(hashes)))
+
+        for document, content_hash in zip(documents, hashes):
+            if content_hash in existing:
+                stats["already_indexed"] += 1
+                continue
+            if content_hash in kept_by_hash:
+                representative = kept_by_hash[content_hash]
+                representative.meta["duplicates"] = representative.meta.get("duplicates", 0) + 1
+                stats["exact_duplicates"] += 1
+                continue
+
+            if self.near_duplicates and document.content:
+                signature = self._signature(document.content)
+                band_keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+                candidates = {i for key in band_keys for i in buckets.get(key, ())}
+                duplicate_of = next(
+                    (i for i in sorted(candidates) if np.mean(signatures[i] == signature) >= self.threshold),
+                    None,
+                )
+                if duplicate_of is not None:
+                    representative = self._kept[duplicate_of]
+                    representative.meta["duplicates"] = representative.meta.get("duplicates", 0) + 1
+                    stats["near_duplicates"] += 1
+                    continue
+                for key in band_keys:
+                    buckets[key].append(len(self._kept))
+            else:
+                signature = np.zeros(0, dtype=np.uint64)
+
+            document.meta["content_hash"] = content_hash
+            kept_by_hash[content_hash] = document
+            signatures.append(signature)
+            self._kept.append(document)
+            kept.append(document)
+
+        # The document embedders send DB_BATCH_SIZE documents per request.
+        stats["kept"] = len(kept)
+        stats["embedding_calls_saved"] = math.ceil(len(documents) / settings.DB_BATCH_SIZE) - math.ceil(len(kept) / settings.DB_BATCH_SIZE)
+        stats["embedded_documents_saved"] = len(documents) - len(kept)
+        logger.info(
+            f"Deduplication: kept {stats['kept']} of {stats['documents']} documents "
+            f"({stats['exact_duplicates']} exact, {stats['near_duplicates']} near-duplicates, "
+            f"{stats['already_indexed']} already indexed); {stats['embedding_calls_saved']} embedding requests saved."
+        )
+        return {"documents": kept, "stats": stats}
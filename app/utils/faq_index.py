@@ -0,0 +1,171 @@
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document
+from loguru import logger
+
+from app.envs import settings
+from app.utils.results import RetrievedDocument
+
+# Rows upcast to float32 at a time when scoring a float16 snapshot.
+_FLOAT16_BLOCK_ROWS = 4096
+
+
+def write_faq_snapshot(documents: List[Document], source: str, directory: Optional[str] = None) -> Path:
+    """
+    Writes an FAQ snapshot (`vectors.npy` with L2-normalized embeddings, `documents.json` with the
+    rest of each document, `manifest.json`) into a new version directory, then points `CURRENT` at it.
+
+    Serving workers pick the new snapshot up on their next refresh check; old versions beyond
+    `REINDEX_KEEP_VERSIONS` are deleted.
+    :param source: The collection the documents were read from, recorded in the manifest.
+    """
+    root = Path(directory or settings.FAQ_INDEX_DIR)
+    documents = [doc for doc in documents if doc.embedding is not None]
+    version = f"v{int(time.time() * 1000)}"
+    target = root / version
+    target.mkdir(parents=True, exist_ok=False)
+
+    vectors = np.asarray([doc.embedding for doc in documents], dtype=np.float32).reshape(len(documents), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    np.save(target / "vectors.npy", vectors.astype(settings.FAQ_INDEX_DTYPE))
+
+    payloads = []
+    for doc in documents:
+        payload = doc.to_dict(flatten=False)
+        payload.pop("embedding", None)
+        payload.pop("score", None)
+        payloads.append(payload)
+    with open(target / "documents.json", "w", encoding="utf-8") as f:
+        json.dump(payloads, f, ensure_ascii=False)
+    with open(target / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "source": source,
+            "count": len(documents),
+            "dim": int(vectors.shape[1]) if len(documents) else settings.EMBEDDING_DIM,
+            "dtype": settings.FAQ_INDEX_DTYPE,
+            "embedding_model": settings.EMBEDDING_MODEL,
+        }, f)
+
+    # Publish atomically: readers either see the old or the new version name.
+    current_tmp = root / "CURRENT.tmp"
+    current_tmp.write_text(version)
+    os.replace(current_tmp, root / "CURRENT")
+    logger.info(f"Published FAQ index snapshot '{target}' with {len(documents)} vectors from '{source}'.")
+
+    versions = sorted(p for p in root.iterdir() if p.is_dir() and p.name.startswith("v") and p.name[1:].isdigit())
+    for stale in versions[:max(len(versions) - settings.REINDEX_KEEP_VERSIONS, 0)]:
+        # Workers that still map an old snapshot keep their pages until they refresh.
+        shutil.rmtree(stale, ignore_errors=True)
+    return target
+
+
+class FAQVectorIndex:
+    """
+    In-process exact vector index over the FAQ collection.
+
+    The FAQ collection is small, so a single dot product of the query against a contiguous matrix
+    of all FAQ vectors is cheaper than a network round-trip to Qdrant. The matrix is memory-mapped
+    from the snapshot written at reindex time, so all uvicorn workers share the same pages. Every
+    `FAQ_INDEX_REFRESH_INTERVAL` seconds a search checks whether a newer snapshot was published and
+    remaps it.
+    """
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = Path(directory or settings.FAQ_INDEX_DIR)
+        self.version: Optional[str] = None
+        # Vectors and documents are swapped together so a concurrent search never mixes snapshots.
+        self._snapshot: Optional[Tuple[np.ndarray, List[Dict[str, Any]]]] = None
+        self._checked_at = 0.0
+        self._warned_missing = False
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        self.maybe_refresh()
+        return self._snapshot is not None
+
+    def maybe_refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < settings.FAQ_INDEX_REFRESH_INTERVAL:
+            return
+        with self._lock:
+            if not force and now - self._checked_at < settings.FAQ_INDEX_REFRESH_INTERVAL:
+                return
+            self._checked_at = now
+            try:
+                version = (self.directory / "CURRENT").read_text().strip()
+            except FileNotFoundError:
+                if self._snapshot is None and not self._warned_missing:
+                    self._warned_missing = True
+                    logger.warning(f"No FAQ index snapshot in '{self.directory}'; FAQ search falls back to Qdrant.")
+                return
+            if version != self.version:
+                self._load(version)
+
+    def _load(self, version: str):
+        path = self.directory / version
+        try:
+            with open(path / "manifest.json", encoding="utf-8") as f:
+                manifest = json.load(f)
+            vectors = np.load(path / "vectors.npy", mmap_mode="r")
+            with open(path / "documents.json", encoding="utf-8") as f:
+                documents = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load FAQ index snapshot '{path}': {e}")
+            return
+        if manifest.get("embedding_model") != settings.EMBEDDING_MODEL or vectors.shape[1:] != (settings.EMBEDDING_DIM,):
+            logger.error(f"FAQ index snapshot '{path}' was built with {manifest.get('embedding_model')} (dim {vectors.shape[1:]}), not {settings.EMBEDDING_MODEL}; ignoring it.")
+            return
+        self._snapshot, self.version = (vectors, documents), version
+        logger.info(f"Loaded FAQ index snapshot '{path}' ({len(documents)} vectors, {vectors.dtype}).")
+
+    @staticmethod
+    def _scores(vectors: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        if vectors.dtype == np.float32:
+            return queries @ vectors.T
+        # NumPy has no fast float16 matmul; upcast the snapshot block by block instead.
+        return np.concatenate([
+            queries @ np.asarray(vectors[start:start + _FLOAT16_BLOCK_ROWS], dtype=np.float32).T
+            for start in range(0, len(vectors), _FLOAT16_BLOCK_ROWS)
+        ], axis=1)
+
+    def search_batch(self, query_embeddings: List[List[float]], top_k: Optional[int] = None, score_threshold: Optional[float] = None) -> List[List[RetrievedDocument]]:
+        """
+        Returns, for each query, the `top_k` FAQ documents by cosine similarity above `score_threshold`,
+        like `QdrantEmbeddingRetriever` does for a cosine collection.
+        """
+        top_k = top_k or settings.EMBEDDING_TOP_K
+        score_threshold = settings.EMBEDDING_THRESHOLD if score_threshold is None else score_threshold
+        self.maybe_refresh()
+        snapshot = self._snapshot
+        if snapshot is None or len(snapshot[1]) == 0:
+            return [[] for _ in query_embeddings]
+        vectors, documents = snapshot
+
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = self._scores(vectors, queries)
+
+        k = min(top_k, scores.shape[1])
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, row_candidates in zip(scores, candidates):
+            ranked = row_candidates[np.argsort(-row[row_candidates])]
+            results.append([
+                RetrievedDocument.from_payload(documents[i], score=float(row[i]))
+                for i in ranked if row[i] >= score_threshold
+            ])
+        return results
+
+    def search(self, query_embedding: List[float], top_k: Optional[int] = None, score_threshold: Optional[float] = None) -> List[RetrievedDocument]:
+        return self.search_batch([query_embedding], top_k, score_threshold)[0]
+
+
+faq_index = FAQVectorIndex()
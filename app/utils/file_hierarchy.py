@@ -0,0 +1,218 @@
+import hashlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from haystack import Document
+from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+from haystack_integrations.document_stores.qdrant.filters import convert_filters_to_qdrant
+from qdrant_client.http import models as rest
+
+from app.envs import settings
+from app.utils.qdrant import qdrant_clients
+from app.utils.results import RetrievedDocument, search, search_async
+
+SUMMARY_COLLECTION = "file_summaries"
+# Keyword payload indexes the fine and neighbor searches filter on.
+HIERARCHY_PAYLOAD_INDEXES = {"meta.section_id": "keyword", "meta.doc_id": "keyword"}
+# Characters of a section's first chunk kept as the content of its summary point.
+_PREVIEW_CHARS = 300
+
+
+def assign_chunk_positions(documents: List[Document], doc_id: str, part: int, hierarchical: bool):
+    """
+    Records where each chunk of one converted part of a file sits: `doc_id`, `part` (first page of
+    the part, 0 for whole files) and `chunk_index` (order within the part), which neighbor
+    expansion relies on. With `hierarchical`, chunks also get the `section_id` of their group of
+    `FILE_SECTION_CHUNKS` chunks, which `build_section_summaries` writes a summary vector for.
+    """
+    for index, document in enumerate(documents):
+        document.meta.update({"doc_id": doc_id, "part": part, "chunk_index": index})
+        if hierarchical:
+            document.meta["section_id"] = f"{doc_id}:{part}:{index // settings.FILE_SECTION_CHUNKS}"
+
+
+class SectionSummaryBuilder:
+    """
+    Builds the section summaries of a stream of embedded chunks without keeping the chunks: per
+    `section_id` it only holds the chunk count, the sum of the normalized chunk vectors and the
+    chunk with the lowest `chunk_index` (its content preview and position meta).
+    """
+    def __init__(self):
+        self._sections: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, documents: List[Document]):
+        for document in documents:
+            if document.embedding is None or "section_id" not in document.meta:
+                continue
+            vector = np.asarray(document.embedding, dtype=np.float32)
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+            index = document.meta["chunk_index"]
+            section = self._sections.get(document.meta["section_id"])
+            if section is None:
+                section = self._sections[document.meta["section_id"]] = {"chunks": 0, "vector_sum": np.zeros_like(vector), "chunk_start": index, "chunk_end": index + 1}
+                self._set_first(section, document)
+            elif index < section["chunk_start"]:
+                section["chunk_start"] = index
+                self._set_first(section, document)
+            section["chunks"] += 1
+            section["vector_sum"] += vector
+            section["chunk_end"] = max(section["chunk_end"], index + 1)
+
+    @staticmethod
+    def _set_first(section: Dict[str, Any], document: Document):
+        section["preview"] = (document.content or "")[:_PREVIEW_CHARS]
+        section["meta"] = {key: document.meta[key] for key in ("doc_id", "part", "section_id", "file_path", "upload_id") if key in document.meta}
+
+    def build(self) -> List[Document]:
+        """
+        One summary document per section: the normalized centroid of the chunk embeddings, a preview
+        of the first chunk as content, and the section's position in meta.
+        """
+        summaries = []
+        for section_id, section in self._sections.items():
+            centroid = section["vector_sum"] / section["chunks"]
+            centroid /= max(float(np.linalg.norm(centroid)), 1e-12)
+            summaries.append(Document(
+                id=hashlib.sha256(section_id.encode("utf-8")).hexdigest(),
+                content=section["preview"],
+                embedding=centroid.tolist(),
+                meta={
+                    **section["meta"],
+                    "chunk_start": section["chunk_start"],
+                    "chunk_end": section["chunk_end"],
+                    "chunks": section["chunks"],
+                },
+            ))
+        return summaries
+
+
+def build_section_summaries(documents: List[Document]) -> List[Document]:
+    """
+    One summary document per `section_id` among the embedded chunks: the normalized centroid of the
+    chunk embeddings, a preview of the first chunk as content, and the section's position in meta.
+    """
+    builder = SectionSummaryBuilder()
+    builder.add(documents)
+    return builder.build()
+
+
+def _section_filter(section_ids: List[str]) -> rest.Filter:
+    # Chunks indexed before the hierarchy was enabled have no section and are always searched.
+    return rest.Filter(should=[
+        rest.FieldCondition(key="meta.section_id", match=rest.MatchAny(any=section_ids)),
+        rest.IsEmptyCondition(is_empty=rest.PayloadField(key="meta.section_id")),
+    ])
+
+
+def _neighbor_window(document: RetrievedDocument) -> Optional[Tuple[str, int, int, int]]:
+    meta = document.meta
+    if "doc_id" not in meta or "chunk_index" not in meta:
+        return None
+    window = settings.FILE_NEIGHBOR_CHUNKS
+    return meta["doc_id"], meta.get("part", 0), max(meta["chunk_index"] - window, 0), meta["chunk_index"] + window
+
+
+def _neighbor_request(windows: List[Tuple[str, int, int, int]]) -> Dict[str, Any]:
+    # Scroll parameters for every chunk of the windows, without vectors.
+    query_filter = convert_filters_to_qdrant({"operator": "OR", "conditions": [
+        {"operator": "AND", "conditions": [
+            {"field": "meta.doc_id", "operator": "==", "value": doc_id},
+            {"field": "meta.part", "operator": "==", "value": part},
+            {"field": "meta.chunk_index", "operator": ">=", "value": start},
+            {"field": "meta.chunk_index", "operator": "<=", "value": end},
+        ]}
+        for doc_id, part, start, end in windows
+    ]})
+    limit = sum(end - start + 1 for _, _, start, end in windows)
+    return {"scroll_filter": query_filter, "limit": limit, "with_payload": True, "with_vectors": False}
+
+
+class HierarchicalFileRetriever:
+    """
+    Coarse-to-fine search over the `files` collection.
+
+    1. The `file_summaries` collection (one centroid vector per section of `FILE_SECTION_CHUNKS`
+       chunks, written at upload) is searched for the `FILE_COARSE_TOP_K` best sections.
+    2. Chunks are searched only within those sections, so a query does not scan, or return
+       fragments of, unrelated files.
+    3. Each hit is expanded with up to `FILE_NEIGHBOR_CHUNKS` chunks on either side; overlapping
+       windows of the same file are merged into one passage.
+
+    A filtered search (e.g. on `meta.upload_id`) skips the coarse step: the filter already narrows the
+    search and may use fields the summaries do not have.
+    """
+    def __init__(self, file_store: QdrantDocumentStore, summary_store: QdrantDocumentStore):
+        self.file_store = file_store
+        self.summary_store = summary_store
+
+    def _fine_filters(self, sections: List[RetrievedDocument], filters: Optional[Dict[str, Any]]) -> Optional[rest.Filter]:
+        if filters:
+            return convert_filters_to_qdrant(filters)
+        if not sections:
+            # Nothing summarized yet: plain flat search.
+            return None
+        return _section_filter([section.meta["section_id"] for section in sections])
+
+    def run(self, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None) -> List[RetrievedDocument]:
+        sections = [] if filters else search(self.summary_store, query_embedding, top_k=settings.FILE_COARSE_TOP_K)
+        chunks = search(
+            self.file_store, query_embedding, self._fine_filters(sections, filters),
+            top_k=settings.EMBEDDING_TOP_K, score_threshold=settings.EMBEDDING_THRESHOLD,
+        )
+        windows = [window for window in map(_neighbor_window, chunks) if window]
+        neighbors = []
+        if windows and settings.FILE_NEIGHBOR_CHUNKS > 0:
+            records, _ = qdrant_clients.client.scroll(self.file_store.index, **_neighbor_request(windows))
+            neighbors = [RetrievedDocument.from_point(record) for record in records]
+        return expand_with_neighbors(chunks, neighbors)
+
+    async def run_async(self, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None) -> List[RetrievedDocument]:
+        sections = [] if filters else await search_async(self.summary_store, query_embedding, top_k=settings.FILE_COARSE_TOP_K)
+        chunks = await search_async(
+            self.file_store, query_embedding, self._fine_filters(sections, filters),
+            top_k=settings.EMBEDDING_TOP_K, score_threshold=settings.EMBEDDING_THRESHOLD,
+        )
+        windows = [window for window in map(_neighbor_window, chunks) if window]
+        neighbors = []
+        if windows and settings.FILE_NEIGHBOR_CHUNKS > 0:
+            records, _ = await qdrant_clients.async_client.scroll(self.file_store.index, **_neighbor_request(windows))
+            neighbors = [RetrievedDocument.from_point(record) for record in records]
+        return expand_with_neighbors(chunks, neighbors)
+
+
+def expand_with_neighbors(hits: List[RetrievedDocument], neighbors: List[RetrievedDocument]) -> List[RetrievedDocument]:
+    """
+    Replaces each hit with the passage of its neighbor window (hit included), in file order. Hits
+    whose windows overlap are merged into the passage of the better one. Hits without position
+    meta are kept as they are.
+    """
+    by_position = {(doc.meta.get("doc_id"), doc.meta.get("part", 0), doc.meta.get("chunk_index")): doc for doc in neighbors}
+    passages: List[RetrievedDocument] = []
+    covered: Dict[Tuple[str, int], List[Tuple[int, int, int]]] = defaultdict(list)
+    for hit in hits:
+        window = _neighbor_window(hit)
+        if window is None:
+            passages.append(hit)
+            continue
+        doc_id, part, start, end = window
+        merged = next((entry for entry in covered[(doc_id, part)] if entry[0] <= end and start <= entry[1]), None)
+        if merged is not None:
+            # Extend the better hit's passage rather than repeating text.
+            start, end = min(start, merged[0]), max(end, merged[1])
+            covered[(doc_id, part)].remove(merged)
+            passage_index = merged[2]
+        else:
+            passage_index = len(passages)
+            passages.append(hit)
+        covered[(doc_id, part)].append((start, end, passage_index))
+        base = passages[passage_index]
+        chunks = [by_position.get((doc_id, part, index)) for index in range(start, end + 1)]
+        chunks = [chunk for chunk in chunks if chunk is not None] or [hit]
+        passages[passage_index] = RetrievedDocument(
+            id=base.id,
+            content="\n".join(chunk.content or "" for chunk in chunks),
+            score=base.score,
+            meta={**base.meta, "context_chunks": [chunks[0].meta.get("chunk_index", start), chunks[-1].meta.get("chunk_index", end) + 1]},
+        )
+    return passages
@@ -0,0 +1,44 @@
+import json
+from typing import Any, Dict, Optional
+
+from haystack.errors import FilterError
+from haystack_integrations.document_stores.qdrant.filters import convert_filters_to_qdrant
+
+COLLECTIONS = ("faq", "web", "files")
+
+# Per-collection Haystack filters; a collection without an entry (or with None) is searched unfiltered.
+CollectionFilters = Dict[str, Optional[Dict[str, Any]]]
+
+
+def parse_filters(filters: Optional[Dict[str, Any]]) -> Optional[CollectionFilters]:
+    """
+    Accepts either one Haystack filter, applied to every collection, e.g.
+    `{"field": "meta.content_type", "operator": "==", "value": "table"}`, or a mapping from collection
+    (`faq`, `web`, `files`) to a filter, e.g. `{"files": {"field": "meta.upload_id", ...}}`.
+
+    :raises ValueError: If the filters are malformed.
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("Filters must be an object.")
+    if "operator" in filters:
+        collection_filters = {collection: filters for collection in COLLECTIONS}
+    else:
+        unknown = set(filters) - set(COLLECTIONS)
+        if unknown:
+            raise ValueError(f"Unknown collections in filters: {sorted(unknown)}. Use a Haystack filter or a mapping of {list(COLLECTIONS)} to filters.")
+        collection_filters = {collection: filters.get(collection) or None for collection in COLLECTIONS}
+    for collection, collection_filter in collection_filters.items():
+        if collection_filter is None:
+            continue
+        try:
+            convert_filters_to_qdrant(collection_filter)
+        except (FilterError, AttributeError, TypeError, KeyError) as e:
+            raise ValueError(f"Invalid filters for '{collection}': {e}")
+    return collection_filters
+
+
+def get_filters_key(filters: Optional[CollectionFilters]) -> str:
+    """Stable text form of parsed filters, for cache keys."""
+    return json.dumps(filters, sort_keys=True, default=str) if filters else ""
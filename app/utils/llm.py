@@ -1,18 +1,189 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
 from app.envs import settings
+from app.models.llm import LoadBalancingStrategy, PromptLayout
 from openai import OpenAI, AsyncOpenAI
 
+PREFIX_CACHED_SYSTEM_PROMPT = """You will receive a user query and some textual context, both inside xml tags in the user message. You have to answer the query based on the context while respecting the rules below.
+
+<rules>
+- If you don''t know, just say so.
+- If you are not sure, ask for clarification.
+- Answer in the same language as the user query.
+- If the context appears unreadable or of poor quality, tell the user then answer as best as you can.
+- If the answer is not in the context but you think you know the answer, explain that to the user then answer with your own knowledge.
+- Answer directly and without using xml tags.
+- Nếu người dùng nói rằng bạn đã sai, hãy trả lời: "Xin lỗi, tôi sẽ báo cáo lại cho nhóm phát triển để họ xem xét lại câu trả lời của tôi. Cảm ơn bạn đã thông báo cho tôi về điều này.".
+</rules>
+"""
+
+
+def order_passages(documents: List[Any]) -> List[Any]:
+    """
+    Orders retrieved documents for the prompt context. With the prefix-cache layout they are sorted by
+    ID, so the same set of passages always renders to the same bytes whatever their scores.
+    """
+    if settings.LLM_PROMPT_LAYOUT == PromptLayout.PREFIX_CACHE.value:
+        return sorted(documents, key=lambda doc: str(doc.id))
+    return documents
+
+
+class LLMBackend:
+    """
+    A single OpenAI-compatible endpoint (TGI, vLLM, OpenAI, ...) with its health state.
+    """
+    def __init__(self, base_url: str, model: str, api_key: str = "", weight: float = 1.0, name: Optional[str] = None):
+        self.base_url = base_url
+        self.model = model
+        self.weight = max(float(weight), 0.0)
+        self.name = name or base_url
+
+        self.openai_client = OpenAI(api_key=api_key or "EMPTY", base_url=base_url)
+        self.async_openai_client = AsyncOpenAI(api_key=api_key or "EMPTY", base_url=base_url)
+
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def acquire(self):
+        with self._lock:
+            self.outstanding += 1
+
+    def release(self):
+        with self._lock:
+            self.outstanding = max(self.outstanding - 1, 0)
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.unhealthy_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= settings.LLM_BACKEND_FAILURE_THRESHOLD:
+                self.unhealthy_until = time.monotonic() + settings.LLM_BACKEND_COOLDOWN
+                logger.warning(f"LLM backend '{self.name}' marked unhealthy for {settings.LLM_BACKEND_COOLDOWN}s after {self.consecutive_failures} consecutive failures.")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class LLMBackendPool:
+    """
+    Shared pool of LLM backends. Health and outstanding-request counters live here so that
+    they survive across the per-request `LLM` instances.
+    """
+    def __init__(self):
+        if settings.LLM_BACKENDS:
+            self.backends = [
+                LLMBackend(
+                    base_url=backend["base_url"],
+                    model=backend.get("model", settings.LLM_OPENAI_MODEL),
+                    api_key=backend.get("api_key", settings.LLM_OPENAI_API_KEY),
+                    weight=backend.get("weight", 1.0),
+                    name=backend.get("name"),
+                )
+                for backend in settings.LLM_BACKENDS
+            ]
+        else:
+            self.backends = [
+                LLMBackend(
+                    base_url=settings.LLM_OPENAI_BASE_URL,
+                    model=settings.LLM_OPENAI_MODEL,
+                    api_key=settings.LLM_OPENAI_API_KEY,
+                )
+            ]
+        self.strategy = LoadBalancingStrategy(settings.LLM_LOAD_BALANCING)
+
+    def select(self, exclude: Optional[List[LLMBackend]] = None) -> Optional[LLMBackend]:
+        exclude = exclude or []
+        candidates = [b for b in self.backends if b not in exclude and b.weight > 0]
+        if not candidates:
+            return None
+        healthy = [b for b in candidates if b.healthy]
+        # If every backend is cooling down, still try one rather than failing outright.
+        candidates = healthy or candidates
+
+        if self.strategy == LoadBalancingStrategy.WEIGHTED:
+            return random.choices(candidates, weights=[b.weight for b in candidates], k=1)[0]
+        return min(candidates, key=lambda b: (b.outstanding / b.weight, random.random()))
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [backend.status() for backend in self.backends]
+
+
+backend_pool = LLMBackendPool()
+
+
+class LLMStream:
+    """
+    A streaming completion opened on one backend, which holds one of that backend's outstanding
+    requests from the moment it is opened. `aclose()` releases it and closes the HTTP stream whether
+    or not iteration started; it is called automatically once the stream ends or fails, and calling
+    it again does nothing.
+    """
+    def __init__(self, backend: LLMBackend, stream, iterator: AsyncIterator[Any], first_chunk: Any):
+        self._backend = backend
+        self._stream = stream
+        self._iterator = iterator
+        # None when the stream ended before its first chunk.
+        self._first_chunk = first_chunk
+        self._exhausted = first_chunk is None
+        self._closed = False
+
+    def __aiter__(self) -> "LLMStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._closed:
+            raise StopAsyncIteration
+        if self._first_chunk is not None:
+            chunk, self._first_chunk = self._first_chunk, None
+            return chunk
+        try:
+            if self._exhausted:
+                raise StopAsyncIteration
+            return await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self._backend.record_success()
+            await self.aclose()
+            raise
+        except Exception:
+            self._backend.record_failure()
+            await self.aclose()
+            raise
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        # Released before awaiting, so that a cancelled close cannot leak the slot.
+        self._backend.release()
+        await self._stream.close()
+
+
 class LLM:
     def __init__(self):
-        self.openai_client = OpenAI(
-            api_key=settings.LLM_OPENAI_API_KEY,
-            base_url=settings.LLM_OPENAI_BASE_URL,
-        )
-
-        self.async_openai_client = AsyncOpenAI(
-            api_key=settings.LLM_OPENAI_API_KEY,
-            base_url=settings.LLM_OPENAI_BASE_URL,
-        )
-        
+        self.pool = backend_pool
+
     def build_prompt(self, query: str, context: str) -> str:
         prompt = f"""You are given a user query, some textual context and rules, all inside xml tags. You have to answer the query based on the context while respecting the rules.
 
@@ -37,43 +208,167 @@ class LLM:
         prompt = prompt.replace("[context]", context).replace("[query]", query)
         return prompt
 
-    def get_answer(self, query: str, context: str) -> str:
-        system_prompt = self.build_prompt(query, context)
-        response = self.openai_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            max_tokens=settings.LLM_MAX_TOKENS,
-            temperature=settings.LLM_TEMPERATURE,
-            model=settings.LLM_OPENAI_MODEL
-        )
-        answer = response.choices[0].message.content.strip()
-        return answer
-
-    async def get_answer_async(self, query: str, context: str) -> str:
-        system_prompt = self.build_prompt(query, context)
-        response = await self.async_openai_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            max_tokens=settings.LLM_MAX_TOKENS,
-            temperature=settings.LLM_TEMPERATURE,
-            model=settings.LLM_OPENAI_MODEL,
-        )
-        return response
-    
-    async def get_answer_async_stream(self, query: str, context: str):
-        system_prompt = self.build_prompt(query, context)
-        response = await self.async_openai_client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            max_tokens=settings.LLM_MAX_TOKENS,
-            temperature=settings.LLM_TEMPERATURE,
-            model=settings.LLM_OPENAI_MODEL,
-            stream=True,
-        )
-        return response
+    def build_prefix_cached_messages(self, query: str, context: str, history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
+        """
+        Prompt layout for backends with prefix caching (TGI, vLLM): the invariant instructions form a
+        byte-identical system message shared by every request, then the history, then the retrieved
+        passages, and the query comes last, so the KV cache of the static prefix can be reused.
+        """
+        return [
+            {"role": "system", "content": PREFIX_CACHED_SYSTEM_PROMPT},
+            *(history or []),
+            {"role": "user", "content": f"<context>\n{context}\n</context>\n\n<user_query>\n{query}\n</user_query>"}
+        ]
+
+    def build_messages(self, query: str, context: str, history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
+        if settings.LLM_PROMPT_LAYOUT == PromptLayout.PREFIX_CACHE.value:
+            return self.build_prefix_cached_messages(query, context, history)
+        return [
+            {"role": "system", "content": self.build_prompt(query, context)},
+            *(history or []),
+            {"role": "user", "content": query}
+        ]
+
+    def _completion_kwargs(self, query: str, context: str, history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        return {
+            "messages": self.build_messages(query, context, history),
+            "max_tokens": settings.LLM_MAX_TOKENS,
+            "temperature": settings.LLM_TEMPERATURE,
+        }
+
+    def get_answer(self, query: str, context: str, history: Optional[List[Dict[str, str]]] = None) -> str:
+        kwargs = self._completion_kwargs(query, context, history)
+        tried: List[LLMBackend] = []
+        last_error: Optional[Exception] = None
+        for _ in range(settings.LLM_MAX_ATTEMPTS):
+            backend = self.pool.select(exclude=tried)
+            if backend is None:
+                break
+            tried.append(backend)
+            backend.acquire()
+            try:
+                response = backend.openai_client.chat.completions.create(model=backend.model, **kwargs)
+                backend.record_success()
+                return response.choices[0].message.content.strip()
+            except Exception as e:
+                backend.record_failure()
+                last_error = e
+                logger.warning(f"LLM backend '{backend.name}' failed: {e}. Failing over.")
+            finally:
+                backend.release()
+        raise last_error or RuntimeError("No LLM backend available.")
+
+    async def _run_with_failover(self, attempt: Callable[[LLMBackend], Awaitable[Any]], discard: Callable[[Any], Awaitable[None]]) -> Any:
+        """
+        Runs `attempt` against pool backends until one succeeds.
+
+        Failed attempts fail over to the next backend. When `LLM_HEDGE_DELAY_MS` is set and the
+        running attempt has not completed within the delay, a hedged attempt is started on another
+        backend and whichever finishes first wins; `discard` releases the loser's result.
+        """
+        hedge_delay = settings.LLM_HEDGE_DELAY_MS / 1000 if settings.LLM_HEDGE_DELAY_MS > 0 else None
+        tried: List[LLMBackend] = []
+        pending: Dict[asyncio.Task, LLMBackend] = {}
+        last_error: Optional[Exception] = None
+
+        def start_attempt() -> bool:
+            if len(tried) >= settings.LLM_MAX_ATTEMPTS:
+                return False
+            backend = self.pool.select(exclude=tried)
+            if backend is None:
+                return False
+            tried.append(backend)
+            pending[asyncio.ensure_future(attempt(backend))] = backend
+            return True
+
+        start_attempt()
+        can_hedge = hedge_delay is not None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending.keys(), timeout=hedge_delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"LLM backend '{pending[next(iter(pending))].name}' slow to respond, sending hedged request.")
+                    can_hedge = start_attempt()
+                    continue
+
+                winner = None
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        logger.warning(f"LLM backend '{backend.name}' failed: {last_error}. Failing over.")
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        await discard(task.result())
+                if winner is not None:
+                    return winner
+                if not pending:
+                    start_attempt()
+        finally:
+            for task in pending:
+                task.cancel()
+            for task in pending:
+                try:
+                    result = await task
+                except BaseException:
+                    continue
+                await discard(result)
+
+        raise last_error or RuntimeError("No LLM backend available.")
+
+    async def get_answer_async(self, query: str, context: str, history: Optional[List[Dict[str, str]]] = None):
+        kwargs = self._completion_kwargs(query, context, history)
+
+        async def attempt(backend: LLMBackend):
+            backend.acquire()
+            try:
+                response = await backend.async_openai_client.chat.completions.create(model=backend.model, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                backend.record_failure()
+                raise
+            finally:
+                backend.release()
+            backend.record_success()
+            return response
+
+        async def discard(_response):
+            return None
+
+        return await self._run_with_failover(attempt, discard)
+
+    async def get_answer_async_stream(self, query: str, context: str, history: Optional[List[Dict[str, str]]] = None) -> "LLMStream":
+        """
+        Opens a streaming completion. The returned `LLMStream` yields the same chunk objects as the
+        OpenAI client; failover and hedging only apply until the first chunk has been received. The
+        caller must `aclose()` it, even if it never iterates it.
+        """
+        kwargs = self._completion_kwargs(query, context, history)
+
+        async def attempt(backend: LLMBackend):
+            backend.acquire()
+            stream = None
+            try:
+                stream = await backend.async_openai_client.chat.completions.create(model=backend.model, stream=True, **kwargs)
+                iterator = stream.__aiter__()
+                try:
+                    first_chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    first_chunk = None
+            except BaseException as e:
+                if not isinstance(e, asyncio.CancelledError):
+                    backend.record_failure()
+                backend.release()
+                if stream is not None:
+                    await stream.close()
+                raise
+            return backend, stream, iterator, first_chunk
+
+        async def discard(result):
+            backend, stream, _, _ = result
+            backend.release()
+            await stream.close()
+
+        return LLMStream(*await self._run_with_failover(attempt, discard))
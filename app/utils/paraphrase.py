@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from haystack import Document
+from loguru import logger
+from tqdm import tqdm
+
+from app.envs import settings
+from app.utils.llm import LLM
+
+# Bump when the paraphrasing prompt changes so stored paraphrases are regenerated.
+PARAPHRASE_VERSION = "1"
+
+
+def get_paraphrase_key(question: str, answer: str) -> str:
+    """Identifies the inputs a paraphrase was generated from; a mismatch means it is stale."""
+    return hashlib.sha1(f"{PARAPHRASE_VERSION}\n{question}\n{answer}".encode("utf-8")).hexdigest()
+
+
+def get_precomputed_paraphrase(question: Optional[str], meta: Dict[str, Any]) -> Optional[str]:
+    """Returns the stored paraphrased answer of an FAQ entry if it is present and up to date."""
+    paraphrased_answer = meta.get("paraphrased_answer")
+    answer = meta.get("answer")
+    if not paraphrased_answer or not question or not answer:
+        return None
+    if meta.get("paraphrase_key") != get_paraphrase_key(question, answer):
+        return None
+    return paraphrased_answer
+
+
+async def _paraphrase(llm: LLM, semaphore: asyncio.Semaphore, document: Document) -> Optional[str]:
+    async with semaphore:
+        try:
+            response = await llm.get_answer_async(
+                query=document.content,
+                context=f"FAQ: {document.content}. Answer: {document.meta['answer']}"
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            logger.warning(f"Could not paraphrase FAQ entry {document.id}: {e}")
+            return None
+
+
+async def paraphrase_documents(documents: List[Document], known: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+    """
+    Fills `paraphrased_answer`/`paraphrase_key` in the meta of FAQ documents, in place.
+
+    Entries whose key is found in `known` (key -> paraphrase, e.g. from the live collection) reuse
+    it; the rest are sent to the LLM in batches with at most `FAQ_PARAPHRASE_CONCURRENCY` requests in
+    flight. Entries that fail keep no paraphrase and fall back to live generation at request time.
+    """
+    known = known or {}
+    llm = LLM()
+    semaphore = asyncio.Semaphore(settings.FAQ_PARAPHRASE_CONCURRENCY)
+    stats = {"reused": 0, "generated": 0, "failed": 0}
+
+    pending = []
+    for document in documents:
+        answer = document.meta.get("answer")
+        if not document.content or not answer:
+            continue
+        key = get_paraphrase_key(document.content, answer)
+        if key in known:
+            document.meta["paraphrased_answer"] = known[key]
+            document.meta["paraphrase_key"] = key
+            stats["reused"] += 1
+        else:
+            pending.append((document, key))
+
+    batch_size = settings.DB_BATCH_SIZE
+    for start in tqdm(range(0, len(pending), batch_size), desc="Paraphrasing FAQ answers..."):
+        batch = pending[start:start + batch_size]
+        paraphrases = await asyncio.gather(*(_paraphrase(llm, semaphore, document) for document, _ in batch))
+        for (document, key), paraphrased_answer in zip(batch, paraphrases):
+            if paraphrased_answer:
+                document.meta["paraphrased_answer"] = paraphrased_answer
+                document.meta["paraphrase_key"] = key
+                stats["generated"] += 1
+            else:
+                document.meta.pop("paraphrased_answer", None)
+                document.meta.pop("paraphrase_key", None)
+                stats["failed"] += 1
+
+    logger.info(f"FAQ paraphrases: {stats['reused']} reused, {stats['generated']} generated, {stats['failed']} failed.")
+    return stats
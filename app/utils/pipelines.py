@@ -1,5 +1,10 @@
+import asyncio
+import time
+import uuid
 from app.envs import settings
 from app.database import database
+from app.utils.qdrant import qdrant_clients
+from app.utils.faq_index import faq_index
 from haystack import Pipeline
 from haystack.components.embedders import (
     OpenAITextEmbedder,
@@ -8,14 +13,25 @@ from haystack.components.embedders import (
 )
 from app.utils.embedders import embedder
 from haystack_integrations.components.retrievers.qdrant import QdrantEmbeddingRetriever
+from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+from haystack_integrations.document_stores.qdrant.filters import convert_filters_to_qdrant
+from haystack import Document
+from qdrant_client.http import models as rest
 from haystack.utils import Secret
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from app.models.upload import FileUploadParams
-from haystack.components.converters import MultiFileConverter
-from haystack.components.preprocessors import DocumentPreprocessor
+from app.utils.dedup import DocumentDeduplicator
+from app.utils.conversion import parallel_file_converter
+from app.utils.filters import CollectionFilters
+from app.utils.query_cache import get_query_key, query_caches
+from app.utils.profiling import span
+from app.utils.breakers import embedder_breaker, qdrant_breaker
+from app.utils.file_hierarchy import HIERARCHY_PAYLOAD_INDEXES, HierarchicalFileRetriever, assign_chunk_positions, build_section_summaries
+from app.utils.results import RetrievedDocument, search, search_async, to_results
 from haystack.components.writers import DocumentWriter
+from haystack.document_stores.types import DuplicatePolicy
 
 
 class ChatPipeline:
@@ -46,7 +62,7 @@ class ChatPipeline:
         else:
             raise ValueError(f"Unsupported embedding provider for query: {settings.EMBEDDING_PROVIDER}")
 
-        # 2. Initialize Retrievers
+        # 2. Initialize Retrievers (for the Haystack pipeline of `run`; the other searches use `search`)
         self.faq_retriever = QdrantEmbeddingRetriever(
             document_store=self.faq_store,
             top_k=settings.EMBEDDING_TOP_K,
@@ -62,6 +78,10 @@ class ChatPipeline:
             top_k=settings.EMBEDDING_TOP_K,
             score_threshold=settings.EMBEDDING_THRESHOLD
         )
+        # Coarse-to-fine search of uploaded files, when their section summaries are indexed
+        self.file_hierarchy = None
+        if database.file_summaries_store is not None:
+            self.file_hierarchy = HierarchicalFileRetriever(self.file_store, database.file_summaries_store)
 
         # 3. Build the retrieval pipeline
         self.pipeline.add_component("query_embedder", self.query_embedder)
@@ -74,35 +94,213 @@ class ChatPipeline:
         self.pipeline.connect("query_embedder.embedding", "web_retriever.query_embedding")
         self.pipeline.connect("query_embedder.embedding", "file_retriever.query_embedding")
 
-    def run(self, query: str):
+    def run(self, query: str, filters: Optional[CollectionFilters] = None):
+        if filters:
+            return self.retrieve(self.embed(query), filters)
+        if settings.CACHE_ENABLED:
+            key = get_query_key(query)
+            output = query_caches.retrievals.get(key)
+            if output is None:
+                output = self.retrieve(self.embed(query))
+                query_caches.retrievals.set(key, output)
+            return output
         pipeline_output = self.pipeline.run({
             "query_embedder": {"text": query}
         })
         return {
-            "faq_documents": pipeline_output["faq_retriever"]["documents"],
-            "web_documents": pipeline_output["web_retriever"]["documents"],
-            "file_documents": pipeline_output["file_retriever"]["documents"]
+            "faq_documents": to_results(pipeline_output["faq_retriever"]["documents"]),
+            "web_documents": to_results(pipeline_output["web_retriever"]["documents"]),
+            "file_documents": to_results(pipeline_output["file_retriever"]["documents"])
         }
 
+    def embed(self, query: str) -> List[float]:
+        """
+        Embeds a single query with the pipeline's query embedder (or takes it from the query cache).
+        """
+        key = get_query_key(query) if settings.CACHE_ENABLED else None
+        if key is not None:
+            embedding = query_caches.embeddings.get(key)
+            if embedding is not None:
+                return embedding
+        if hasattr(self.query_embedder, "warm_up"):
+            self.query_embedder.warm_up()
+        with span("embed", sync=True):
+            embedding = self.query_embedder.run(text=query)["embedding"]
+        if key is not None:
+            query_caches.embeddings.set(key, embedding)
+        return embedding
+
+    async def embed_async(self, query: str) -> List[float]:
+        """
+        Runs `embed` in a worker thread within the embedder's circuit breaker and latency budget.
+        Cached embeddings are returned even while the breaker is open.
+        """
+        if settings.CACHE_ENABLED:
+            embedding = query_caches.embeddings.get(get_query_key(query))
+            if embedding is not None:
+                return embedding
+        return await embedder_breaker.run(lambda: asyncio.to_thread(self.embed, query))
+
+    def retrieve(self, query_embedding: List[float], filters: Optional[CollectionFilters] = None) -> Dict[str, Any]:
+        """
+        Runs the three retrievers for an already computed query embedding.
+        :param filters: Per-collection Haystack filters, as returned by `parse_filters`.
+        """
+        with span("retrieve", sync=True):
+            return {
+                "faq_documents": self.retrieve_faq(query_embedding, filters),
+                **self.retrieve_web_and_files(query_embedding, filters)
+            }
+
+    def _use_faq_index(self, filters: Optional[CollectionFilters]) -> bool:
+        # The in-process FAQ index has no payload filtering.
+        return settings.FAQ_INDEX_ENABLED and not (filters or {}).get("faq") and faq_index.ready
+
+    def retrieve_faq(self, query_embedding: List[float], filters: Optional[CollectionFilters] = None) -> List[RetrievedDocument]:
+        if self._use_faq_index(filters):
+            return faq_index.search(query_embedding)
+        return self._search(self.faq_store, query_embedding, (filters or {}).get("faq"))
+
+    def retrieve_web_and_files(self, query_embedding: List[float], filters: Optional[CollectionFilters] = None) -> Dict[str, Any]:
+        filters = filters or {}
+        return {
+            "web_documents": self._search(self.web_store, query_embedding, filters.get("web")),
+            "file_documents": self.retrieve_files(query_embedding, filters.get("files"))
+        }
+
+    def retrieve_files(self, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None) -> List[RetrievedDocument]:
+        if self.file_hierarchy is not None:
+            return self.file_hierarchy.run(query_embedding, filters)
+        return self._search(self.file_store, query_embedding, filters)
+
+    async def _retrieve_files_qdrant_async(self, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None) -> List[RetrievedDocument]:
+        if self.file_hierarchy is not None:
+            return await self.file_hierarchy.run_async(query_embedding, filters)
+        return await self._search_async(self.file_store, query_embedding, filters)
+
+    @staticmethod
+    def _search(document_store: QdrantDocumentStore, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None) -> List[RetrievedDocument]:
+        return search(document_store, query_embedding, filters, top_k=settings.EMBEDDING_TOP_K, score_threshold=settings.EMBEDDING_THRESHOLD)
+
+    @staticmethod
+    async def _search_async(document_store: QdrantDocumentStore, query_embedding: List[float], filters: Optional[Dict[str, Any]] = None) -> List[RetrievedDocument]:
+        return await search_async(document_store, query_embedding, filters, top_k=settings.EMBEDDING_TOP_K, score_threshold=settings.EMBEDDING_THRESHOLD)
+
+    async def retrieve_async(self, query_embedding: List[float], filters: Optional[CollectionFilters] = None) -> Dict[str, Any]:
+        """
+        Async variant of `retrieve`: the three searches run concurrently on the shared async Qdrant client,
+        as one call of the Qdrant circuit breaker.
+        :raises CircuitOpenError: If the Qdrant breaker is open.
+        """
+        with span("retrieve"):
+            if self._use_faq_index(filters):
+                faq_documents = faq_index.search(query_embedding)
+                rest = await self.retrieve_web_and_files_async(query_embedding, filters)
+            else:
+                faq_documents, rest = await qdrant_breaker.run(lambda: asyncio.gather(
+                    self._retrieve_faq_qdrant_async(query_embedding, filters),
+                    self._retrieve_web_and_files_qdrant_async(query_embedding, filters),
+                ))
+        return {"faq_documents": faq_documents, **rest}
+
+    async def retrieve_faq_async(self, query_embedding: List[float], filters: Optional[CollectionFilters] = None) -> List[RetrievedDocument]:
+        if self._use_faq_index(filters):
+            # A single in-memory dot product; not worth a thread hop.
+            return faq_index.search(query_embedding)
+        return await qdrant_breaker.run(lambda: self._retrieve_faq_qdrant_async(query_embedding, filters))
+
+    async def retrieve_web_and_files_async(self, query_embedding: List[float], filters: Optional[CollectionFilters] = None) -> Dict[str, Any]:
+        return await qdrant_breaker.run(lambda: self._retrieve_web_and_files_qdrant_async(query_embedding, filters))
+
+    async def _retrieve_faq_qdrant_async(self, query_embedding: List[float], filters: Optional[CollectionFilters] = None) -> List[RetrievedDocument]:
+        if qdrant_clients.async_client is None:
+            return await asyncio.to_thread(self.retrieve_faq, query_embedding, filters)
+        return await self._search_async(self.faq_store, query_embedding, (filters or {}).get("faq"))
+
+    async def _retrieve_web_and_files_qdrant_async(self, query_embedding: List[float], filters: Optional[CollectionFilters] = None) -> Dict[str, Any]:
+        if qdrant_clients.async_client is None:
+            return await asyncio.to_thread(self.retrieve_web_and_files, query_embedding, filters)
+        filters = filters or {}
+        web_documents, file_documents = await asyncio.gather(
+            self._search_async(self.web_store, query_embedding, filters.get("web")),
+            self._retrieve_files_qdrant_async(query_embedding, filters.get("files")),
+        )
+        return {
+            "web_documents": web_documents,
+            "file_documents": file_documents
+        }
+
+    def run_batch(self, queries: List[str], filters: Optional[CollectionFilters] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieves documents for many queries at once: all queries are embedded in one embedder
+        batch, then each collection is searched with Qdrant batch search requests.
+        :return: One dict per query, in input order, with the same keys as `run`.
+        """
+        embedded = embedder.run(documents=[Document(content=query) for query in queries])["documents"]
+        return self.retrieve_batch([doc.embedding for doc in embedded], filters)
+
+    def retrieve_batch(self, query_embeddings: List[List[float]], filters: Optional[CollectionFilters] = None) -> List[Dict[str, Any]]:
+        filters = filters or {}
+        results_by_collection = {
+            "faq_documents": (
+                faq_index.search_batch(query_embeddings)
+                if self._use_faq_index(filters)
+                else self._search_batch(self.faq_store, query_embeddings, filters.get("faq"))
+            ),
+            "web_documents": self._search_batch(self.web_store, query_embeddings, filters.get("web")),
+            "file_documents": (
+                # The coarse-to-fine search takes several dependent requests per query.
+                [self.file_hierarchy.run(query_embedding, filters.get("files")) for query_embedding in query_embeddings]
+                if self.file_hierarchy is not None
+                else self._search_batch(self.file_store, query_embeddings, filters.get("files"))
+            ),
+        }
+        return [
+            {key: results[i] for key, results in results_by_collection.items()}
+            for i in range(len(query_embeddings))
+        ]
+
+    def _search_batch(self, document_store: QdrantDocumentStore, query_embeddings: List[List[float]], filters: Optional[Dict[str, Any]] = None) -> List[List[RetrievedDocument]]:
+        query_filter = convert_filters_to_qdrant(filters) if filters else None
+        documents: List[List[RetrievedDocument]] = []
+        for start in range(0, len(query_embeddings), settings.DB_BATCH_SIZE):
+            requests = [
+                rest.QueryRequest(
+                    query=query_embedding,
+                    filter=query_filter,
+                    limit=settings.EMBEDDING_TOP_K,
+                    score_threshold=settings.EMBEDDING_THRESHOLD,
+                    with_payload=True,
+                )
+                for query_embedding in query_embeddings[start:start + settings.DB_BATCH_SIZE]
+            ]
+            responses = qdrant_clients.client.query_batch_points(collection_name=document_store.index, requests=requests)
+            documents.extend(
+                [RetrievedDocument.from_point(point) for point in response.points]
+                for response in responses
+            )
+        return documents
+
 
 class FileProcessingPipeline:
     def __init__(self, file_upload_params: FileUploadParams):
         self.pipeline = Pipeline()
         self.file_store = database.file_documents_store
+        self.summary_store = database.file_summaries_store
 
-        # 1. Define Converter
-        self.converter = MultiFileConverter()
-        self.pipeline.add_component("converter", self.converter)
-
-        # 2. DocumentPreprocessor
-        self.preprocessor = DocumentPreprocessor(
-            split_by=file_upload_params.split_by,
-            split_length=file_upload_params.split_length,
-            split_overlap=file_upload_params.split_overlap,
-            remove_empty_lines=file_upload_params.remove_empty_lines,
-            remove_extra_whitespaces=file_upload_params.remove_extra_whitespaces,
-        )
-        self.pipeline.add_component("preprocessor", self.preprocessor)
+        # 1-2. Conversion and DocumentPreprocessor run in the process pool of `parallel_file_converter`
+        self.preprocessor_params = {
+            "split_by": file_upload_params.split_by,
+            "split_length": file_upload_params.split_length,
+            "split_overlap": file_upload_params.split_overlap,
+            "remove_empty_lines": file_upload_params.remove_empty_lines,
+            "remove_extra_whitespaces": file_upload_params.remove_extra_whitespaces,
+        }
+
+        # 4. Deduplicator (drops repeated passages and files that were already uploaded)
+        if settings.DEDUP_ENABLED:
+            self.deduplicator = DocumentDeduplicator(document_store=self.file_store)
+            self.pipeline.add_component("deduplicator", self.deduplicator)
 
         # 5. Embedder (using the global embedder instance from app.utils.embedders)
         self.pipeline.add_component("embedder", embedder)
@@ -112,17 +310,82 @@ class FileProcessingPipeline:
         self.pipeline.add_component("document_writer", self.document_writer)
 
         # Connect components:
-        # Converter -> Preprocessor
-        self.pipeline.connect("converter.documents", "preprocessor.documents")
-        # Preprocessor -> Embedder
-        self.pipeline.connect("preprocessor.documents", "embedder.documents")
-        # Embedder -> DocumentWriter
+        # (Deduplicator ->) Embedder -> DocumentWriter
+        if settings.DEDUP_ENABLED:
+            self.pipeline.connect("deduplicator.documents", "embedder.documents")
         self.pipeline.connect("embedder.documents", "document_writer.documents")
 
     def run(self, file_paths: List[Path]) -> Dict[str, Any]:
         """
-        Runs the file processing pipeline.
+        Converts and preprocesses the files in parallel (per file, and per page range of large PDFs)
+        and feeds each part through the embedding pipeline as soon as it is converted.
         :param file_paths: A list of pathlib.Path objects pointing to the files to process.
-        :return: The output of the Haystack pipeline run.
+        :return: The upload id set on every written document, per-file status and timings, the number
+            of documents written and, with deduplication enabled, the deduplication report.
         """
-        return self.pipeline.run(data={"converter": {"sources": file_paths}})
+        started = time.perf_counter()
+        # Lets clients restrict queries to the documents of this upload (`meta.upload_id`).
+        upload_id = uuid.uuid4().hex
+        qdrant_clients.ensure_payload_indexes(self.file_store.index, HIERARCHY_PAYLOAD_INDEXES if self.summary_store is not None else None)
+        if self.summary_store is not None:
+            qdrant_clients.ensure_payload_indexes(self.summary_store.index, HIERARCHY_PAYLOAD_INDEXES)
+        tasks = parallel_file_converter.plan(file_paths)
+        files = {
+            path.name: {"status": "ok", "parts": 0, "failed_parts": 0, "documents": 0, "sections": 0, "conversion_seconds": 0.0, "indexing_seconds": 0.0, "completed_after_seconds": None, "errors": []}
+            for path in file_paths
+        }
+        for task in tasks:
+            files[task.path.name]["parts"] += 1
+        deduplication: Dict[str, int] = {}
+
+        for result in parallel_file_converter.run(tasks, self.preprocessor_params):
+            report = files[result.task.path.name]
+            report["conversion_seconds"] += result.seconds
+            if result.error or not result.documents:
+                # The converters skip unreadable files with a warning: a part without text failed too.
+                pages = f" (pages {result.task.pages[0] + 1}-{result.task.pages[1]})" if result.task.pages else ""
+                report["failed_parts"] += 1
+                report["errors"].append(f"{result.error or 'No text could be extracted'}{pages}")
+            else:
+                with span("index", sync=True):
+                    indexing_started = time.perf_counter()
+                    for document in result.documents:
+                        document.meta["upload_id"] = upload_id
+                    assign_chunk_positions(
+                        result.documents,
+                        doc_id=f"{upload_id}:{result.task.path.name}",
+                        part=result.task.pages[0] if result.task.pages else 0,
+                        hierarchical=self.summary_store is not None,
+                    )
+                    first = "deduplicator" if settings.DEDUP_ENABLED else "embedder"
+                    include_outputs_from = {"deduplicator"} if settings.DEDUP_ENABLED else set()
+                    if self.summary_store is not None:
+                        include_outputs_from.add("embedder")
+                    output = self.pipeline.run(
+                        data={first: {"documents": result.documents}},
+                        include_outputs_from=include_outputs_from or None,
+                    )
+                    report["documents"] += output["document_writer"]["documents_written"]
+                    if self.summary_store is not None:
+                        # A part always holds whole sections, so its summaries are final.
+                        summaries = build_section_summaries(output["embedder"]["documents"])
+                        self.summary_store.write_documents(summaries, policy=DuplicatePolicy.OVERWRITE)
+                        report["sections"] += len(summaries)
+                    report["indexing_seconds"] += time.perf_counter() - indexing_started
+                    for key, value in output.get("deduplicator", {}).get("stats", {}).items():
+                        deduplication[key] = deduplication.get(key, 0) + value
+            report["completed_after_seconds"] = time.perf_counter() - started
+
+        for report in files.values():
+            if report["failed_parts"]:
+                report["status"] = "failed" if report["failed_parts"] == report["parts"] else "partial"
+            for key in ("conversion_seconds", "indexing_seconds", "completed_after_seconds"):
+                if report[key] is not None:
+                    report[key] = round(report[key], 3)
+        return {
+            "upload_id": upload_id,
+            "files": files,
+            "documents_written": sum(report["documents"] for report in files.values()),
+            "seconds": round(time.perf_counter() - started, 3),
+            "deduplication": deduplication or None,
+        }
@@ -0,0 +1,333 @@
+import asyncio
+import contextvars
+import hashlib
+import html
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from types import FrameType
+from typing import Any, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from app.envs import settings
+
+# Deepest stack kept per sample; deeper frames (recursion) are cut at the root side.
+_MAX_STACK_DEPTH = 128
+# Leaf functions of threads that are idle (waiting for work or I/O); dropped unless asked for.
+_IDLE_LEAVES = {"wait", "select", "poll", "epoll", "accept", "_wait_for_tstate_lock", "_worker", "sleep", "recv_into"}
+_PATH_PREFIXES = sorted({os.getcwd() + os.sep, sys.prefix + os.sep, sys.base_prefix + os.sep}, key=len, reverse=True)
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _fold_frame(frame: Optional[FrameType]) -> List[str]:
+    """Frame labels from the root to `frame`."""
+    labels = []
+    while frame is not None and len(labels) < _MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return labels[::-1]
+
+
+def _fold_task(task: "asyncio.Task") -> List[str]:
+    """Labels of the coroutine chain a task is suspended in (or running), outermost first."""
+    labels = []
+    coro = task.get_coro()
+    while coro is not None and len(labels) < _MAX_STACK_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return labels
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for the whole worker process.
+
+    A background thread snapshots the Python stack of every other thread (`sys._current_frames`)
+    every `interval` seconds and counts identical stacks, so the cost is independent of how much
+    code runs and nothing is instrumented. Stacks are kept in the folded format
+    (`thread;outer;...;inner count`) and rendered as a flame graph. Time spent awaiting I/O on the
+    event loop is not attributed to the awaiting coroutine; use the request traces for that.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self.samples = 0
+        self.interval = settings.PROFILER_SAMPLE_INTERVAL
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self.include_idle = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: Optional[float] = None, include_idle: bool = False):
+        """
+        Starts sampling for `seconds` (at most `PROFILER_MAX_SECONDS`), discarding the previous profile.
+        :raises RuntimeError: If the profiler is already running.
+        """
+        with self._lock:
+            if self.running:
+                raise RuntimeError("The profiler is already running.")
+            self._stacks = Counter()
+            self.samples = 0
+            self.interval = interval or settings.PROFILER_SAMPLE_INTERVAL
+            self.include_idle = include_idle
+            self.started_at, self.stopped_at = time.time(), None
+            self._stop.clear()
+            deadline = time.monotonic() + min(seconds, settings.PROFILER_MAX_SECONDS)
+            self._thread = threading.Thread(target=self._run, args=(deadline,), name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sampling profiler started for {min(seconds, settings.PROFILER_MAX_SECONDS)}s at {self.interval * 1000:g}ms intervals.")
+
+    def stop(self):
+        thread = self._thread
+        self._stop.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self, deadline: float):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                labels = _fold_frame(frame)
+                if not labels or (not self.include_idle and labels[-1].split(" ", 1)[0] in _IDLE_LEAVES):
+                    continue
+                self._stacks[";".join([names.get(thread_id, str(thread_id)), *labels])] += 1
+            self.samples += 1
+        self.stopped_at = time.time()
+        logger.info(f"Sampling profiler stopped after {self.samples} samples.")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+            "interval": self.interval,
+            "samples": self.samples,
+            "distinct_stacks": len(self._stacks),
+        }
+
+    def folded(self) -> str:
+        """The profile in the folded stack format read by flamegraph.pl, speedscope and inferno."""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self._stacks.items()))
+
+    def flamegraph_svg(self, title: str = "Sampling profile") -> str:
+        return render_flamegraph(dict(self._stacks), title=f"{title} ({self.samples} samples, {self.interval * 1000:g}ms)")
+
+
+def render_flamegraph(stacks: Dict[str, int], title: str = "Flame graph", width: int = 1200, frame_height: int = 16) -> str:
+    """Renders folded stacks as a self-contained SVG flame graph (root at the bottom, hover for details)."""
+    root: Dict[str, Any] = {"count": 0, "children": {}}
+    for stack, count in stacks.items():
+        node = root
+        node["count"] += count
+        for label in stack.split(";"):
+            node = node["children"].setdefault(label, {"count": 0, "children": {}})
+            node["count"] += count
+
+    def depth(node: Dict[str, Any]) -> int:
+        return 1 + max((depth(child) for child in node["children"].values()), default=0)
+
+    total = root["count"] or 1
+    levels = depth(root) - 1
+    top_margin = 30
+    height = top_margin + max(levels, 1) * frame_height + 10
+    scale = (width - 20) / total
+    rects: List[str] = []
+
+    def draw(node: Dict[str, Any], label: str, x: float, level: int):
+        w = node["count"] * scale
+        if w < 0.3:
+            return
+        y = height - 10 - (level + 1) * frame_height
+        digest = hashlib.md5(label.split(" (", 1)[0].encode()).digest()
+        color = f"rgb({205 + digest[0] % 50},{80 + digest[1] % 120},{digest[2] % 60})"
+        tooltip = html.escape(f"{label}: {node['count']} samples ({node['count'] / total:.1%})")
+        text = ""
+        if w > 35:
+            max_chars = int((w - 6) / 7)
+            shown = label if len(label) <= max_chars else label[:max(max_chars - 2, 1)] + ".."
+            text = f'<text x="{x + 3:.1f}" y="{y + frame_height - 4}" font-size="11" font-family="monospace">{html.escape(shown)}</text>'
+        rects.append(f'<g><title>{tooltip}</title><rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{frame_height - 1}" fill="{color}" rx="2"/>{text}</g>')
+        child_x = x
+        for child_label, child in sorted(node["children"].items()):
+            draw(child, child_label, child_x, level + 1)
+            child_x += child["count"] * scale
+
+    x = 10.0
+    for label, child in sorted(root["children"].items()):
+        draw(child, label, x, 0)
+        x += child["count"] * scale
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+        f'<rect width="100%" height="100%" fill="#fdfdf6"/>'
+        f'<text x="{width / 2}" y="20" font-size="15" font-family="sans-serif" text-anchor="middle">{html.escape(title)}</text>'
+        + "".join(rects) + "</svg>"
+    )
+
+
+class RequestTrace:
+    """
+    Timing breakdown of one request: named spans (start offset and duration) and, once the request
+    runs longer than `SLOW_REQUEST_THRESHOLD_MS`, periodic samples of where it is waiting.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.samples: Counter = Counter()
+        self.task: Optional[asyncio.Task] = None
+        # Thread running the request's current synchronous span (e.g. a pipeline in the threadpool).
+        self.thread_id: Optional[int] = None
+        self.finished = False
+        try:
+            self.task = asyncio.current_task()
+        except RuntimeError:
+            pass
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def sample(self):
+        frames = sys._current_frames()
+        if self.thread_id is not None and self.thread_id in frames:
+            labels = _fold_frame(frames[self.thread_id])
+        elif self.task is not None and not self.task.done():
+            labels = _fold_task(self.task)
+        else:
+            return
+        if labels:
+            self.samples[";".join(labels)] += 1
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "total_ms": round(self.elapsed_ms, 1),
+            "spans": self.spans,
+            "stack_samples": [
+                {"stack": stack, "count": count}
+                for stack, count in self.samples.most_common(settings.SLOW_REQUEST_MAX_STACKS)
+            ],
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("request_trace", default=None)
+
+
+class SlowRequestMonitor:
+    """
+    Samples the stacks of in-flight requests that already exceed `SLOW_REQUEST_THRESHOLD_MS`,
+    every `SLOW_REQUEST_SAMPLE_INTERVAL` seconds. Fast requests are never sampled.
+    """
+    def __init__(self):
+        self._traces: "weakref.WeakSet[RequestTrace]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, trace: RequestTrace):
+        with self._lock:
+            self._traces.add(trace)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="slow-request-monitor", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(settings.SLOW_REQUEST_SAMPLE_INTERVAL)
+            with self._lock:
+                traces = list(self._traces)
+            for trace in traces:
+                if trace.finished:
+                    with self._lock:
+                        self._traces.discard(trace)
+                elif trace.elapsed_ms >= settings.SLOW_REQUEST_THRESHOLD_MS:
+                    try:
+                        trace.sample()
+                    except Exception:
+                        # The coroutine chain can change under us; the next sample will do.
+                        pass
+
+
+slow_request_monitor = SlowRequestMonitor()
+profiler = SamplingProfiler()
+
+
+def start_trace(name: str) -> Optional[RequestTrace]:
+    """Starts tracing the current request (a no-op when `SLOW_REQUEST_THRESHOLD_MS` is 0)."""
+    if settings.SLOW_REQUEST_THRESHOLD_MS <= 0:
+        return None
+    trace = RequestTrace(name)
+    _current_trace.set(trace)
+    slow_request_monitor.register(trace)
+    return trace
+
+
+def get_current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, sync: bool = False) -> Iterator[None]:
+    """
+    Records the duration of a step in the current request trace, if any.
+    :param sync: The step blocks the current thread (code run in the threadpool); slow-request
+        samples then show this thread's stack instead of the awaiting coroutine.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    previous_thread = trace.thread_id
+    if sync:
+        trace.thread_id = threading.get_ident()
+    try:
+        yield
+    finally:
+        if sync:
+            trace.thread_id = previous_thread
+        trace.spans.append({
+            "name": name,
+            "start_ms": round((started - trace.started) * 1000, 1),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+
+def finish_trace(trace: Optional[RequestTrace]) -> Optional[Dict[str, Any]]:
+    """
+    Ends a request trace.
+    :return: The trace report if the request exceeded `SLOW_REQUEST_THRESHOLD_MS`, else None.
+    """
+    if trace is None or trace.finished:
+        return None
+    trace.finished = True
+    if trace.elapsed_ms < settings.SLOW_REQUEST_THRESHOLD_MS:
+        return None
+    report = trace.report()
+    logger.warning(f"Slow request {trace.name}: {report['total_ms']}ms; spans: {[(s['name'], s['duration_ms']) for s in report['spans']]}.")
+    return report
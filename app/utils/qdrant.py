@@ -0,0 +1,186 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models as rest
+from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+from haystack.utils import Secret
+
+from app.envs import settings
+
+
+# Private members of `QdrantDocumentStore` that `create_document_store` relies on to share clients
+# (checked against qdrant-haystack 12.0.0, pinned in requirements.txt).
+_STORE_INTERNALS = ("_client", "_async_client", "_set_up_collection")
+
+
+def _check_store_internals(store: QdrantDocumentStore):
+    missing = [name for name in _STORE_INTERNALS if not hasattr(store, name)]
+    if missing:
+        raise RuntimeError(
+            f"QdrantDocumentStore has no {missing}: the installed qdrant-haystack is not compatible with "
+            "shared Qdrant clients. Install the version pinned in requirements.txt."
+        )
+
+
+class QdrantClients:
+    """
+    Process-wide Qdrant clients shared by every document store.
+
+    One sync and one async client (each with its own connection pool, REST or gRPC) serve all
+    collections instead of one client per `QdrantDocumentStore`. In DEBUG mode a single in-memory
+    client is used and no async client is available, because an async in-memory client would not
+    see the data written through the sync one.
+    """
+    def __init__(self):
+        self._client: Optional[QdrantClient] = None
+        self._async_client: Optional[AsyncQdrantClient] = None
+        self._lock = threading.Lock()
+
+    def client_params(self, prefer_grpc: Optional[bool] = None) -> Dict[str, Any]:
+        if settings.DEBUG:
+            return {"location": ":memory:"}
+        return {
+            "url": settings.QDRANTDB_URL,
+            "api_key": settings.QDRANTDB_API_KEY or None,
+            "prefer_grpc": settings.QDRANTDB_PREFER_GRPC if prefer_grpc is None else prefer_grpc,
+            "grpc_port": settings.QDRANTDB_GRPC_PORT,
+            "timeout": settings.DB_TIMEOUT,
+            "pool_size": settings.QDRANTDB_POOL_SIZE,
+        }
+
+    @property
+    def client(self) -> QdrantClient:
+        with self._lock:
+            if self._client is None:
+                self._client = QdrantClient(**self.client_params())
+                logger.info(f"Initialized shared Qdrant client (grpc={not settings.DEBUG and settings.QDRANTDB_PREFER_GRPC}, pool_size={settings.QDRANTDB_POOL_SIZE}).")
+            return self._client
+
+    @property
+    def async_client(self) -> Optional[AsyncQdrantClient]:
+        if settings.DEBUG:
+            return None
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = AsyncQdrantClient(**self.client_params())
+            return self._async_client
+
+    def create_document_store(self, index: str, recreate_index: bool = False) -> QdrantDocumentStore:
+        """
+        Builds a `QdrantDocumentStore` for `index` that uses the shared clients and makes sure
+        its collection exists.
+        """
+        if settings.DEBUG:
+            store = QdrantDocumentStore(
+                ":memory:",
+                embedding_dim=settings.EMBEDDING_DIM,
+                index=index,
+                recreate_index=recreate_index,
+            )
+        else:
+            store = QdrantDocumentStore(
+                url=settings.QDRANTDB_URL,
+                api_key=Secret.from_token(settings.QDRANTDB_API_KEY),
+                prefer_grpc=settings.QDRANTDB_PREFER_GRPC,
+                grpc_port=settings.QDRANTDB_GRPC_PORT,
+                embedding_dim=settings.EMBEDDING_DIM,
+                hnsw_config={"m": 128},
+                timeout=settings.DB_TIMEOUT,
+                write_batch_size=settings.DB_BATCH_SIZE,
+                recreate_index=recreate_index,
+                index=index,
+            )
+        _check_store_internals(store)
+        # The store creates its clients lazily; handing it ours before first use makes it skip that.
+        store._client = self.client
+        store._async_client = self.async_client
+        if not recreate_index and self.get_alias_target(index) is not None:
+            # Aliased collections are created and validated by the blue/green reindex.
+            self.ensure_payload_indexes(index)
+            return store
+        # Keyword arguments, so a changed signature fails here instead of passing values to the wrong parameters.
+        store._set_up_collection(
+            collection_name=store.index,
+            embedding_dim=store.embedding_dim,
+            recreate_collection=store.recreate_index,
+            similarity=store.similarity,
+            use_sparse_embeddings=store.use_sparse_embeddings,
+            sparse_idf=store.sparse_idf,
+            on_disk=store.on_disk,
+            payload_fields_to_index=store.payload_fields_to_index,
+        )
+        self.ensure_payload_indexes(index)
+        return store
+
+    def ensure_payload_indexes(self, collection_name: str, extra: Optional[Dict[str, str]] = None) -> List[str]:
+        """
+        Creates the `QDRANTDB_PAYLOAD_INDEXES` (and `extra` field: schema indexes) that `collection_name`
+        (or the collection the alias points to) does not have yet, so filtered searches do not scan
+        every point's payload.
+        :return: The newly indexed fields.
+        """
+        indexes = {**settings.QDRANTDB_PAYLOAD_INDEXES, **(extra or {})}
+        if settings.DEBUG or not indexes:
+            # The local in-memory client does not support payload indexes.
+            return []
+        collection_name = self.get_alias_target(collection_name) or collection_name
+        existing = self.client.get_collection(collection_name).payload_schema or {}
+        created = []
+        for field, schema in indexes.items():
+            if field in existing:
+                continue
+            self.client.create_payload_index(collection_name, field_name=field, field_schema=rest.PayloadSchemaType(schema), wait=True)
+            created.append(field)
+        if created:
+            logger.info(f"Created payload indexes on '{collection_name}': {created}.")
+        return created
+
+    def get_alias_target(self, alias: str) -> Optional[str]:
+        """Returns the collection `alias` currently points to, or None if it is not an alias."""
+        for collection_alias in self.client.get_aliases().aliases:
+            if collection_alias.alias_name == alias:
+                return collection_alias.collection_name
+        return None
+
+    def count_points(self, collection_name: str) -> Optional[int]:
+        """Returns the exact number of points in `collection_name`, or None if it does not exist."""
+        if not self.client.collection_exists(collection_name):
+            return None
+        return self.client.count(collection_name=collection_name, exact=True).count
+
+    def list_versions(self, alias: str) -> List[str]:
+        """Returns the versioned collections (`<alias>_v<version>`) built for `alias`, oldest first."""
+        pattern = re.compile(rf"^{re.escape(alias)}_v\d+$")
+        return sorted(c.name for c in self.client.get_collections().collections if pattern.match(c.name))
+
+    def swap_alias(self, alias: str, collection_name: str):
+        """
+        Atomically points `alias` at `collection_name`. A legacy collection named like the alias
+        (from before blue/green reindexing) is dropped first, since an alias cannot shadow it.
+        """
+        operations: List[Any] = []
+        if self.get_alias_target(alias) is not None:
+            operations.append(rest.DeleteAliasOperation(delete_alias=rest.DeleteAlias(alias_name=alias)))
+        elif self.client.collection_exists(alias):
+            logger.warning(f"Dropping legacy collection '{alias}' so it can be replaced by an alias.")
+            self.client.delete_collection(alias)
+        operations.append(rest.CreateAliasOperation(create_alias=rest.CreateAlias(collection_name=collection_name, alias_name=alias)))
+        self.client.update_collection_aliases(change_aliases_operations=operations)
+        logger.info(f"Alias '{alias}' now points to '{collection_name}'.")
+
+    def drop_old_versions(self, alias: str, keep: int) -> List[str]:
+        """Deletes all but the newest `keep` versions of `alias`, never the live one."""
+        live = self.get_alias_target(alias)
+        versions = [v for v in self.list_versions(alias) if v != live]
+        # The live version counts towards `keep`.
+        stale = versions[:max(len(versions) - max(keep - 1, 0), 0)]
+        for collection_name in stale:
+            self.client.delete_collection(collection_name)
+            logger.info(f"Dropped old collection version '{collection_name}'.")
+        return stale
+
+
+qdrant_clients = QdrantClients()
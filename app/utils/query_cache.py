@@ -0,0 +1,74 @@
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from app.envs import settings
+from app.utils.cache import TTLCache
+from app.utils.qdrant import qdrant_clients
+
+# Collections whose blue/green version, when swapped by a reindex, invalidates cached retrievals.
+_VERSIONED_ALIASES = ("faq", "web")
+# Collection whose point count, when an upload (in any worker) adds documents to it, invalidates them too.
+_UPLOADS_COLLECTION = "files"
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def get_query_key(query: str) -> str:
+    """Cache key of a standalone query; case and whitespace variants share it."""
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+class QueryCaches:
+    """
+    In-process caches for standalone (unfiltered, single-turn) queries, used when `CACHE_ENABLED`:
+    query embeddings, retrieval results and generated answers, keyed by `get_query_key`.
+
+    Embeddings only depend on the embedding model and are kept until evicted. Retrievals and
+    answers depend on the indexed documents, so they expire after `QUERY_CACHE_TTL` and are dropped
+    as soon as `check_versions` sees a reindex publish new collection versions or an upload index
+    new files.
+    """
+    def __init__(self):
+        self.embeddings = TTLCache(max_size=settings.QUERY_CACHE_SIZE)
+        self.retrievals = TTLCache(max_size=settings.QUERY_CACHE_SIZE, ttl=settings.QUERY_CACHE_TTL)
+        self.answers = TTLCache(max_size=settings.QUERY_CACHE_SIZE, ttl=settings.QUERY_CACHE_TTL)
+        # Report of the last warm-up run in this process.
+        self.last_warmup: Optional[Dict[str, Any]] = None
+        self._versions: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def clear_results(self):
+        """Drops cached retrievals and answers (e.g. after new documents were indexed)."""
+        self.retrievals.clear()
+        self.answers.clear()
+
+    def check_versions(self) -> bool:
+        """
+        Compares the collections the aliases point to, and the number of uploaded file chunks, with
+        the last check and drops cached results when they changed.
+        :return: True if a new version was published or files were indexed since the last check.
+        """
+        versions: Dict[str, Any] = {alias: qdrant_clients.get_alias_target(alias) for alias in _VERSIONED_ALIASES}
+        versions[_UPLOADS_COLLECTION] = qdrant_clients.count_points(_UPLOADS_COLLECTION)
+        with self._lock:
+            changed = self._versions is not None and versions != self._versions
+            self._versions = versions
+        if changed:
+            logger.info(f"Collections were reindexed or files uploaded ({versions}); dropping cached retrievals and answers.")
+            self.clear_results()
+        return changed
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "embeddings": len(self.embeddings),
+            "retrievals": len(self.retrievals),
+            "answers": len(self.answers),
+        }
+
+
+query_caches = QueryCaches()
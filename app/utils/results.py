@@ -0,0 +1,107 @@
+from typing import Any, Dict, List, Optional, Union
+
+from haystack import Document
+from haystack_integrations.document_stores.qdrant import QdrantDocumentStore
+from haystack_integrations.document_stores.qdrant.filters import convert_filters_to_qdrant
+from qdrant_client.http import models as rest
+
+from app.utils.qdrant import qdrant_clients
+
+
+class RetrievedDocument:
+    """
+    Compact record of one retrieval hit, used from the searches to the citations, the query caches
+    and the `/query` response instead of a Haystack `Document`.
+
+    It only has `id`, `content`, `score` and `meta`: no embedding, blob or sparse embedding, and no
+    per-instance `__dict__`. Built from a Qdrant point (or an FAQ index entry), it keeps a reference
+    to the raw payload and takes `meta` from it on first access, so no meta dict is copied or
+    flattened on the hot path. The meta may be shared with caches and the FAQ index: treat it as
+    read-only and build a new record to change it.
+    """
+    __slots__ = ("id", "content", "score", "_meta", "_payload")
+
+    def __init__(self, id: str, content: Optional[str], score: Optional[float] = None, meta: Optional[Dict[str, Any]] = None, payload: Optional[Dict[str, Any]] = None):
+        self.id = id
+        self.content = content
+        self.score = score
+        self._meta = meta
+        self._payload = payload
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        if self._meta is None:
+            self._meta = self._payload.get("meta") or {} if self._payload else {}
+            self._payload = None
+        return self._meta
+
+    @classmethod
+    def from_point(cls, point: Union[rest.ScoredPoint, rest.Record]) -> "RetrievedDocument":
+        payload = point.payload or {}
+        return cls(str(payload.get("id", point.id)), payload.get("content"), getattr(point, "score", None), payload=payload)
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any], score: Optional[float] = None) -> "RetrievedDocument":
+        """From a document dict as written by `Document.to_dict(flatten=False)`."""
+        return cls(payload["id"], payload.get("content"), score, payload=payload)
+
+    @classmethod
+    def from_document(cls, document: Document) -> "RetrievedDocument":
+        return cls(document.id, document.content, document.score, meta=document.meta)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "content": self.content, "score": self.score, "meta": self.meta}
+
+    def __repr__(self) -> str:
+        content = (self.content or "")[:50]
+        return f"RetrievedDocument(id={self.id!r}, content={content!r}, score={self.score})"
+
+
+def to_results(documents: List[Any]) -> List[RetrievedDocument]:
+    """Converts Haystack Documents (e.g. the output of a Haystack retriever) to retrieval records."""
+    return [document if isinstance(document, RetrievedDocument) else RetrievedDocument.from_document(document) for document in documents]
+
+
+def _query_params(
+    document_store: QdrantDocumentStore,
+    query_embedding: List[float],
+    filters: Optional[Union[Dict[str, Any], rest.Filter]],
+    top_k: int,
+    score_threshold: Optional[float],
+) -> Dict[str, Any]:
+    return {
+        "collection_name": document_store.index,
+        "query": query_embedding,
+        "query_filter": convert_filters_to_qdrant(filters),
+        "limit": top_k,
+        "score_threshold": score_threshold,
+        "with_payload": True,
+        "with_vectors": False,
+    }
+
+
+def search(
+    document_store: QdrantDocumentStore,
+    query_embedding: List[float],
+    filters: Optional[Union[Dict[str, Any], rest.Filter]] = None,
+    top_k: int = 10,
+    score_threshold: Optional[float] = None,
+) -> List[RetrievedDocument]:
+    """
+    Vector search of `document_store` through the shared Qdrant client, like `QdrantEmbeddingRetriever`
+    (Haystack or Qdrant filters, cosine `score_threshold`) but returning `RetrievedDocument`s.
+    """
+    response = qdrant_clients.client.query_points(**_query_params(document_store, query_embedding, filters, top_k, score_threshold))
+    return [RetrievedDocument.from_point(point) for point in response.points]
+
+
+async def search_async(
+    document_store: QdrantDocumentStore,
+    query_embedding: List[float],
+    filters: Optional[Union[Dict[str, Any], rest.Filter]] = None,
+    top_k: int = 10,
+    score_threshold: Optional[float] = None,
+) -> List[RetrievedDocument]:
+    """Async variant of `search`, on the shared async Qdrant client (not available in DEBUG mode)."""
+    response = await qdrant_clients.async_client.query_points(**_query_params(document_store, query_embedding, filters, top_k, score_threshold))
+    return [RetrievedDocument.from_point(point) for point in response.points]
@@ -0,0 +1,116 @@
+import json
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from haystack import Document
+from loguru import logger
+from qdrant_client import QdrantClient
+
+from app.envs import settings
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# `meta` is stored as JSON text: its keys differ between documents and collections.
+_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("content", pa.string()),
+    ("meta", pa.string()),
+])
+
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """
+    Reads a snapshot's manifest and checks that its vectors were made with the configured embedding
+    model and dimension, since they would otherwise be meaningless for the app's queries.
+    """
+    with open(Path(directory) / "manifest.json", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format_version')} (expected {SNAPSHOT_FORMAT_VERSION}).")
+    if manifest["embedding_model"] != settings.EMBEDDING_MODEL or manifest["embedding_dim"] != settings.EMBEDDING_DIM:
+        raise ValueError(
+            f"Snapshot was embedded with {manifest['embedding_model']} (dim {manifest['embedding_dim']}), "
+            f"but the app is configured for {settings.EMBEDDING_MODEL} (dim {settings.EMBEDDING_DIM})."
+        )
+    return manifest
+
+
+def write_manifest(directory: str, collections: Dict[str, Dict[str, Any]]):
+    with open(Path(directory) / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "embedding_model": settings.EMBEDDING_MODEL,
+            "embedding_dim": settings.EMBEDDING_DIM,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "collections": collections,
+        }, f, indent=2)
+
+
+def export_collection(client: QdrantClient, collection_name: str, target: Path, batch_size: int) -> Dict[str, Any]:
+    """
+    Streams every point of `collection_name` into `target/documents.parquet` (one row group per
+    scroll page) and `target/vectors.npy` (row i is the vector of document row i), so memory use is
+    bounded by `batch_size` whatever the collection size.
+    :return: The collection's manifest entry.
+    """
+    target.mkdir(parents=True, exist_ok=True)
+    expected = client.count(collection_name, exact=True).count
+    vectors = np.lib.format.open_memmap(target / "vectors.npy", mode="w+", dtype=np.float32, shape=(expected, settings.EMBEDDING_DIM))
+    count = 0
+    offset = None
+    with pq.ParquetWriter(target / "documents.parquet", _SCHEMA, compression="zstd") as writer:
+        while True:
+            records, offset = client.scroll(collection_name, limit=batch_size, offset=offset, with_payload=True, with_vectors=True)
+            if count + len(records) > expected:
+                raise RuntimeError(f"Collection '{collection_name}' grew during the export; retry when it is not being written to.")
+            payloads = [record.payload or {} for record in records]
+            writer.write_batch(pa.record_batch([
+                pa.array([payload.get("id") for payload in payloads], pa.string()),
+                pa.array([payload.get("content") for payload in payloads], pa.string()),
+                pa.array([json.dumps(payload.get("meta") or {}, ensure_ascii=False) for payload in payloads], pa.string()),
+            ], schema=_SCHEMA))
+            if records:
+                vectors[count:count + len(records)] = np.asarray([record.vector for record in records], dtype=np.float32)
+            count += len(records)
+            if offset is None:
+                break
+    vectors.flush()
+    del vectors
+    # Points deleted during the export leave unused rows at the end; readers stop at `count`.
+    logger.info(f"Exported {count} documents from '{collection_name}' to '{target}'.")
+    return {"source": collection_name, "count": count, "path": target.name}
+
+
+def iter_collection_batches(directory: str, entry: Dict[str, Any], batch_size: int) -> Iterator[List[Document]]:
+    """Yields the documents of one exported collection, with their embeddings, `batch_size` at a time."""
+    target = Path(directory) / entry["path"]
+    vectors = np.load(target / "vectors.npy", mmap_mode="r")
+    start = 0
+    for batch in pq.ParquetFile(target / "documents.parquet").iter_batches(batch_size=batch_size):
+        rows = batch.to_pydict()
+        embeddings = vectors[start:start + batch.num_rows]
+        yield [
+            Document(id=id, content=content, meta=json.loads(meta), embedding=embedding.tolist())
+            for id, content, meta, embedding in zip(rows["id"], rows["content"], rows["meta"], embeddings)
+        ]
+        start += batch.num_rows
+    if start != entry["count"]:
+        raise ValueError(f"Snapshot '{target}' has {start} documents, its manifest says {entry['count']}.")
+
+
+def reservoir_sample(sample: List[Document], seen: int, batch: List[Document], size: int, rng: random.Random) -> int:
+    """Keeps a uniform sample of at most `size` documents over a stream; returns the updated `seen`."""
+    for document in batch:
+        if len(sample) < size:
+            sample.append(document)
+        else:
+            j = rng.randint(0, seen)
+            if j < size:
+                sample[j] = document
+        seen += 1
+    return seen
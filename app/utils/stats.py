@@ -0,0 +1,318 @@
+import asyncio
+import bisect
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+from pymongo import ASCENDING, UpdateOne
+
+from app.envs import settings
+from app.models.stats import QueryStats
+from app.utils.query_cache import get_query_key
+
+ROLLUPS_COLLECTION = "query_stats_rollups"
+TOP_QUERIES_COLLECTION = "query_stats_top_queries"
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is unbounded.
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 150, 250, 400, 600, 800, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 10000, 15000, 20000, 30000, 60000]
+
+GRANULARITIES = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1)}
+# Longest window answered from minute rollups; longer ones use hour rollups.
+_MAX_MINUTE_WINDOW = timedelta(hours=6)
+_WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def parse_window(window: str) -> timedelta:
+    """Parses a window such as `30m`, `24h` or `7d`."""
+    match = re.fullmatch(r"\s*(\d+)\s*([mhd])\s*", window or "")
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid window '{window}'. Use a number followed by m, h or d, e.g. '24h'.")
+    return timedelta(seconds=int(match.group(1)) * _WINDOW_UNITS[match.group(2)])
+
+
+def _truncate(moment: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return moment.replace(second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _expires_at(start: datetime, granularity: str) -> Optional[datetime]:
+    days = settings.STATS_MINUTE_ROLLUP_RETENTION_DAYS if granularity == "minute" else settings.STATS_HOUR_ROLLUP_RETENTION_DAYS
+    return start + timedelta(days=days) if days > 0 else None
+
+
+def latency_percentile(histogram: List[int], q: float, latency_max: float = 0.0) -> Optional[float]:
+    """
+    Estimates the `q` quantile (0-1) from histogram counts over `LATENCY_BUCKETS_MS`, interpolating
+    linearly inside the bucket it falls in. The unbounded last bucket ends at `latency_max`.
+    """
+    total = sum(histogram)
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(histogram):
+        if count and cumulative + count >= rank:
+            lower = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+            upper = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else max(latency_max, lower)
+            upper = min(upper, latency_max) if latency_max else upper
+            return round(lower + (upper - lower) * (rank - cumulative) / count, 1)
+        cumulative += count
+    return latency_max or float(LATENCY_BUCKETS_MS[-1])
+
+
+class _Bucket:
+    def __init__(self):
+        self.count = 0
+        self.rag_hits = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, resolve_time_ms: float, rag_hit: bool, error: bool):
+        self.count += 1
+        self.rag_hits += int(rag_hit)
+        self.errors += int(error)
+        self.latency_sum += resolve_time_ms
+        self.latency_max = max(self.latency_max, resolve_time_ms)
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, resolve_time_ms)] += 1
+
+    def to_update(self) -> Dict[str, Any]:
+        increments: Dict[str, Any] = {
+            "count": self.count,
+            "rag_hits": self.rag_hits,
+            "errors": self.errors,
+            "latency_sum": self.latency_sum,
+        }
+        # Histogram counts live in an object keyed by bucket index, since `$inc` on a missing array
+        # element of an upserted document would create an object anyway.
+        increments.update({f"latency_hist.{i}": count for i, count in enumerate(self.histogram) if count})
+        return {"$inc": increments, "$max": {"latency_max": self.latency_max}}
+
+
+class StatsRollups:
+    """
+    Incrementally maintained aggregates of `query_stats`, so analytics never scan raw rows.
+
+    Every recorded query is added to in-memory per-minute and per-hour buckets (count, RAG hits,
+    errors, latency sum/max and a fixed latency histogram for percentiles) and to per-hour query
+    counts. `flush` merges them into Mongo with `$inc` upserts every `STATS_ROLLUP_FLUSH_INTERVAL`
+    seconds, so several workers can share the rollups and the request path does no extra writes.
+    Queries recorded since the last flush are lost if the process dies; `rebuild` recomputes the
+    rollups from the raw collection.
+    """
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, datetime], _Bucket] = {}
+        self._queries: Dict[Tuple[datetime, str], List[Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+
+    def record(self, stats: QueryStats):
+        created_at = stats.created_at
+        error = stats.bot_answer.startswith("Error: ")
+        with self._lock:
+            for granularity in GRANULARITIES:
+                key = (granularity, _truncate(created_at, granularity))
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = _Bucket()
+                bucket.add(stats.resolve_time_ms, stats.rag_hit, error)
+            query_key = (_truncate(created_at, "hour"), get_query_key(stats.user_query))
+            entry = self._queries.get(query_key)
+            if entry is None:
+                self._queries[query_key] = [stats.user_query.strip(), 1]
+            else:
+                entry[1] += 1
+
+    def _take(self) -> Tuple[Dict[Tuple[str, datetime], _Bucket], Dict[Tuple[datetime, str], List[Any]]]:
+        with self._lock:
+            buckets, queries = self._buckets, self._queries
+            self._buckets, self._queries = {}, {}
+        return buckets, queries
+
+    async def flush(self, db) -> int:
+        """
+        Writes the buckets recorded since the last flush. On failure they are merged back and
+        retried on the next flush.
+        :return: The number of upserts sent.
+        """
+        async with self._flush_lock:
+            buckets, queries = self._take()
+            if not buckets and not queries:
+                return 0
+            rollup_updates = []
+            for (granularity, start), bucket in buckets.items():
+                update = bucket.to_update()
+                update["$setOnInsert"] = {"expires_at": _expires_at(start, granularity)}
+                rollup_updates.append(UpdateOne({"granularity": granularity, "start": start}, update, upsert=True))
+            query_updates = [
+                UpdateOne(
+                    {"start": start, "key": key},
+                    {"$inc": {"count": count}, "$setOnInsert": {"query": query, "expires_at": _expires_at(start, "hour")}},
+                    upsert=True,
+                )
+                for (start, key), (query, count) in queries.items()
+            ]
+            try:
+                if rollup_updates:
+                    await db[ROLLUPS_COLLECTION].bulk_write(rollup_updates, ordered=False)
+                if query_updates:
+                    await db[TOP_QUERIES_COLLECTION].bulk_write(query_updates, ordered=False)
+            except Exception:
+                self._restore(buckets, queries)
+                raise
+            return len(rollup_updates) + len(query_updates)
+
+    def _restore(self, buckets: Dict[Tuple[str, datetime], _Bucket], queries: Dict[Tuple[datetime, str], List[Any]]):
+        # An unordered bulk write may have applied part of the updates; re-sending them double counts
+        # those, which is preferred over silently dropping the rest.
+        with self._lock:
+            for key, bucket in buckets.items():
+                current = self._buckets.get(key)
+                if current is None:
+                    self._buckets[key] = bucket
+                    continue
+                current.count += bucket.count
+                current.rag_hits += bucket.rag_hits
+                current.errors += bucket.errors
+                current.latency_sum += bucket.latency_sum
+                current.latency_max = max(current.latency_max, bucket.latency_max)
+                current.histogram = [a + b for a, b in zip(current.histogram, bucket.histogram)]
+            for key, (query, count) in queries.items():
+                entry = self._queries.setdefault(key, [query, 0])
+                entry[1] += count
+
+    async def run_flusher(self, db):
+        """Flushes every `STATS_ROLLUP_FLUSH_INTERVAL` seconds until cancelled, then one last time."""
+        try:
+            while True:
+                await asyncio.sleep(settings.STATS_ROLLUP_FLUSH_INTERVAL)
+                try:
+                    await self.flush(db)
+                except Exception as e:
+                    logger.warning(f"Could not flush query stats rollups: {e}")
+        except asyncio.CancelledError:
+            try:
+                await self.flush(db)
+            except Exception as e:
+                logger.warning(f"Could not flush query stats rollups on shutdown: {e}")
+            raise
+
+    async def summarize(self, db, window: timedelta, top: int = 10) -> Dict[str, Any]:
+        """
+        Aggregates the rollups of the last `window`: totals, RAG hit rate, latency percentiles, a
+        per-bucket series (minute buckets up to 6 hours, hour buckets beyond) and the top queries.
+        """
+        now = datetime.utcnow()
+        minute_retention = timedelta(days=settings.STATS_MINUTE_ROLLUP_RETENTION_DAYS)
+        use_minutes = window <= _MAX_MINUTE_WINDOW and (not settings.STATS_MINUTE_ROLLUP_RETENTION_DAYS or window <= minute_retention)
+        granularity = "minute" if use_minutes else "hour"
+        since = _truncate(now - window, granularity)
+
+        cursor = db[ROLLUPS_COLLECTION].find({"granularity": granularity, "start": {"$gte": since}}, {"_id": 0, "expires_at": 0}).sort("start", ASCENDING)
+        total = _Bucket()
+        series = []
+        async for doc in cursor:
+            histogram = [doc.get("latency_hist", {}).get(str(i), 0) for i in range(len(LATENCY_BUCKETS_MS) + 1)]
+            count = doc.get("count", 0)
+            total.count += count
+            total.rag_hits += doc.get("rag_hits", 0)
+            total.errors += doc.get("errors", 0)
+            total.latency_sum += doc.get("latency_sum", 0.0)
+            total.latency_max = max(total.latency_max, doc.get("latency_max", 0.0))
+            total.histogram = [a + b for a, b in zip(total.histogram, histogram)]
+            series.append({
+                "start": doc["start"],
+                "count": count,
+                "rag_hit_rate": round(doc.get("rag_hits", 0) / count, 4) if count else None,
+                "errors": doc.get("errors", 0),
+                "latency_p50_ms": latency_percentile(histogram, 0.5, doc.get("latency_max", 0.0)),
+                "latency_p95_ms": latency_percentile(histogram, 0.95, doc.get("latency_max", 0.0)),
+            })
+
+        top_cursor = await db[TOP_QUERIES_COLLECTION].aggregate([
+            {"$match": {"start": {"$gte": _truncate(now - window, "hour")}}},
+            {"$group": {"_id": "$key", "query": {"$first": "$query"}, "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1}},
+            {"$limit": top},
+            {"$project": {"_id": 0, "query": 1, "count": 1}},
+        ])
+        top_queries = await top_cursor.to_list(length=top)
+
+        return {
+            "window_seconds": int(window.total_seconds()),
+            "granularity": granularity,
+            "since": since,
+            "count": total.count,
+            "rag_hit_rate": round(total.rag_hits / total.count, 4) if total.count else None,
+            "error_rate": round(total.errors / total.count, 4) if total.count else None,
+            "latency_ms": {
+                "avg": round(total.latency_sum / total.count, 1) if total.count else None,
+                "p50": latency_percentile(total.histogram, 0.5, total.latency_max),
+                "p90": latency_percentile(total.histogram, 0.9, total.latency_max),
+                "p95": latency_percentile(total.histogram, 0.95, total.latency_max),
+                "p99": latency_percentile(total.histogram, 0.99, total.latency_max),
+                "max": round(total.latency_max, 1) if total.count else None,
+            },
+            "series": series,
+            "top_queries": top_queries,
+        }
+
+    async def rebuild(self, db, batch_size: int = 10000) -> int:
+        """
+        Recomputes the rollups from the raw `query_stats` collection (e.g. to backfill history).
+        Run it while the app is stopped: flushes from running workers during the rebuild would be
+        counted twice or lost.
+        :return: The number of raw rows aggregated.
+        """
+        await db[ROLLUPS_COLLECTION].delete_many({})
+        await db[TOP_QUERIES_COLLECTION].delete_many({})
+        rebuilt = StatsRollups()
+        rows = 0
+        cursor = db[QueryStats.Config.collection_name].find(
+            {}, {"_id": 0, "user_query": 1, "resolve_time_ms": 1, "bot_answer": 1, "rag_hit": 1, "created_at": 1}
+        ).batch_size(batch_size)
+        async for doc in cursor:
+            try:
+                rebuilt.record(QueryStats(**doc))
+            except Exception as e:
+                logger.warning(f"Skipping malformed query stats row: {e}")
+                continue
+            rows += 1
+            if rows % batch_size == 0:
+                await rebuilt.flush(db)
+        await rebuilt.flush(db)
+        logger.info(f"Rebuilt query stats rollups from {rows} rows.")
+        return rows
+
+
+async def ensure_stats_indexes(db):
+    """
+    Creates the indexes of `query_stats` and its rollups: `created_at` (with a TTL when
+    `STATS_RETENTION_DAYS` is set) on the raw collection, unique bucket keys and `expires_at` TTLs
+    on the rollups. An existing `created_at` index whose TTL differs is updated in place.
+    """
+    raw = db[QueryStats.Config.collection_name]
+    ttl = int(settings.STATS_RETENTION_DAYS * 86400)
+    existing = (await raw.index_information()).get("created_at_1")
+    if existing is None:
+        await raw.create_index([("created_at", ASCENDING)], **({"expireAfterSeconds": ttl} if ttl else {}))
+    elif existing.get("expireAfterSeconds") != (ttl or None):
+        if ttl and "expireAfterSeconds" in existing:
+            await db.command("collMod", raw.name, index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": ttl})
+        else:
+            # Adding or removing a TTL needs the index to be rebuilt.
+            await raw.drop_index("created_at_1")
+            await raw.create_index([("created_at", ASCENDING)], **({"expireAfterSeconds": ttl} if ttl else {}))
+        logger.info(f"Updated the TTL of '{raw.name}.created_at' to {ttl or 'none'} seconds.")
+
+    await db[ROLLUPS_COLLECTION].create_index([("granularity", ASCENDING), ("start", ASCENDING)], unique=True)
+    await db[ROLLUPS_COLLECTION].create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    await db[TOP_QUERIES_COLLECTION].create_index([("start", ASCENDING), ("key", ASCENDING)], unique=True)
+    await db[TOP_QUERIES_COLLECTION].create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+
+stats_rollups = StatsRollups()
@@ -0,0 +1,208 @@
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+
+from haystack import Document, component
+from loguru import logger
+
+from app.envs import settings
+from app.utils.dedup import get_content_hash
+
+TABLE_FORMATS = ("markdown", "text")
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_MARKDOWN_SEPARATOR = re.compile(r"^\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?$")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of `text`: words and punctuation marks. Subword tokenizers produce at least
+    this many tokens, so limits should leave some headroom below the model's maximum.
+    """
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+class _HTMLTableParser(HTMLParser):
+    """Collects the cells of every `<tr>` of an HTML fragment; `colspan` cells are repeated."""
+    def __init__(self):
+        super().__init__()
+        self.rows: List[List[str]] = []
+        self.header_rows: set = set()
+        self._row: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+        self._colspan = 1
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr":
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+            span = dict(attrs).get("colspan") or "1"
+            self._colspan = int(span) if span.isdigit() else 1
+            if tag == "th":
+                self.header_rows.add(len(self.rows))
+        elif tag == "br" and self._cell is not None:
+            self._cell.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._cell is not None:
+            self._row.extend([" ".join(self._cell)] * min(self._colspan, 50))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def _clean(cell: str) -> str:
+    return " ".join(cell.split())
+
+
+def parse_table(table: str) -> Dict[str, Any]:
+    """
+    Parses a crawled table (HTML, a Markdown pipe table or tab-separated lines) into a header and rows
+    of cleaned cells. Empty rows and columns are dropped. Text that is neither is kept as one single-
+    cell row per line, without a header.
+    :return: `{"header": Optional[List[str]], "rows": List[List[str]]}`
+    """
+    header: Optional[List[str]] = None
+    if re.search(r"<t[rd][\s>]", table, re.IGNORECASE):
+        parser = _HTMLTableParser()
+        parser.feed(table)
+        rows = [[_clean(cell) for cell in row] for row in parser.rows]
+        if rows and 0 in parser.header_rows:
+            header, rows = rows[0], rows[1:]
+    else:
+        lines = [line.strip() for line in table.splitlines() if line.strip()]
+        if lines and all("|" in line for line in lines):
+            rows = []
+            for line in lines:
+                if _MARKDOWN_SEPARATOR.match(line):
+                    if len(rows) == 1 and header is None:
+                        header, rows = rows[0], []
+                    continue
+                rows.append([_clean(cell) for cell in line.strip("|").split("|")])
+        elif lines and all("\t" in line for line in lines):
+            header, *rows = [[_clean(cell) for cell in line.split("\t")] for line in lines]
+        else:
+            rows = [[_clean(line)] for line in lines]
+
+    rows = [row for row in rows if any(row)]
+    width = max([len(row) for row in rows] + [len(header or [])], default=0)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    if header is not None:
+        header = header + [""] * (width - len(header))
+    keep = [i for i in range(width) if (header and header[i]) or any(row[i] for row in rows)]
+    if len(keep) < width:
+        rows = [[row[i] for i in keep] for row in rows]
+        header = [header[i] for i in keep] if header is not None else None
+    return {"header": header if header and any(header) else None, "rows": rows}
+
+
+def _render_header(header: Optional[List[str]], table_format: str) -> str:
+    if header is None or table_format != "markdown":
+        return ""
+    return "| " + " | ".join(header) + " |\n|" + "---|" * len(header)
+
+
+def _render_row(row: List[str], header: Optional[List[str]], table_format: str) -> str:
+    if table_format == "markdown":
+        return "| " + " | ".join(row) + " |"
+    if header is None:
+        return " | ".join(cell for cell in row if cell)
+    # `Column: value` pairs keep each value next to its column name for the embedding model.
+    return "; ".join(f"{name}: {cell}" if name else cell for name, cell in zip(header, row) if cell)
+
+
+@component
+class TableSplitter:
+    """
+    Splits crawled tables into row groups that fit the embedding model.
+
+    Each table is parsed (`parse_table`) and re-rendered compactly, as a Markdown table or as
+    `Column: value` lines (`table_format="text"`). Rows are grouped greedily so that each chunk
+    stays within `max_tokens` (`estimate_tokens`), the Markdown header being repeated on top of
+    every chunk. A row that is longer on its own becomes a chunk by itself.
+
+    Every chunk keeps the meta of its table and gets `table_id` (content hash of the whole table,
+    shared by all its chunks), `chunk_index`, `chunk_count`, `row_start`, `row_end` (exclusive)
+    and `table_rows`, so the rest of a table can be fetched with a `meta.table_id` filter.
+    """
+    def __init__(self, max_tokens: Optional[int] = None, table_format: Optional[str] = None):
+        self.max_tokens = max_tokens or settings.TABLE_CHUNK_MAX_TOKENS
+        self.table_format = table_format or settings.TABLE_CHUNK_FORMAT
+        if self.table_format not in TABLE_FORMATS:
+            raise ValueError(f"Invalid table format: {self.table_format}. Must be one of {list(TABLE_FORMATS)}")
+
+    def split(self, table: Document) -> List[Document]:
+        parsed = parse_table(table.content or "")
+        header, rows = parsed["header"], parsed["rows"]
+        if not rows:
+            return []
+        header_text = _render_header(header, self.table_format)
+        header_tokens = estimate_tokens(header_text)
+        rendered = [_render_row(row, header, self.table_format) for row in rows]
+
+        groups = []
+        start, tokens = 0, header_tokens
+        for i, line in enumerate(rendered):
+            line_tokens = estimate_tokens(line)
+            if i > start and tokens + line_tokens > self.max_tokens:
+                groups.append((start, i))
+                start, tokens = i, header_tokens
+            tokens += line_tokens
+        groups.append((start, len(rendered)))
+
+        table_id = get_content_hash(table.content)
+        return [
+            Document(
+                content="\n".join(([header_text] if header_text else []) + rendered[row_start:row_end]),
+                meta={
+                    **table.meta,
+                    "table_id": table_id,
+                    "chunk_index": index,
+                    "chunk_count": len(groups),
+                    "row_start": row_start,
+                    "row_end": row_end,
+                    "table_rows": len(rows),
+                },
+            )
+            for index, (row_start, row_end) in enumerate(groups)
+        ]
+
+    @component.output_types(documents=List[Document], stats=Dict[str, Any])
+    def run(self, documents: List[Document]):
+        """
+        :returns: The table chunks, in input order, and a report comparing the tables with their
+            chunks (counts, average and maximum estimated tokens, and how many exceed `max_tokens`).
+        """
+        chunks: List[Document] = []
+        before = [estimate_tokens(document.content or "") for document in documents]
+        split_tables = 0
+        for document in documents:
+            table_chunks = self.split(document)
+            split_tables += len(table_chunks) > 1
+            chunks.extend(table_chunks)
+        after = [estimate_tokens(chunk.content) for chunk in chunks]
+
+        stats = {
+            "tables": len(documents),
+            "split_tables": split_tables,
+            "chunks": len(chunks),
+            "max_tokens": self.max_tokens,
+            "avg_tokens_before": round(sum(before) / len(before), 1) if before else 0.0,
+            "avg_tokens_after": round(sum(after) / len(after), 1) if after else 0.0,
+            "max_tokens_before": max(before, default=0),
+            "max_tokens_after": max(after, default=0),
+            "over_limit_before": sum(tokens > self.max_tokens for tokens in before),
+            "over_limit_after": sum(tokens > self.max_tokens for tokens in after),
+        }
+        logger.info(
+            f"Table chunking: {stats['tables']} tables ({stats['over_limit_before']} over {self.max_tokens} tokens) "
+            f"-> {stats['chunks']} chunks ({stats['over_limit_after']} over); average tokens "
+            f"{stats['avg_tokens_before']} -> {stats['avg_tokens_after']}, max {stats['max_tokens_before']} -> {stats['max_tokens_after']}."
+        )
+        return {"documents": chunks, "stats": stats}
@@ -0,0 +1,123 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from haystack import Document
+from loguru import logger
+
+from app.database import database
+from app.envs import settings
+from app.utils.citations import build_citations_and_context, get_rag_answer
+from app.utils.embedders import embedder
+from app.utils.llm import LLM
+from app.utils.pipelines import ChatPipeline
+from app.utils.query_cache import get_query_key, query_caches
+
+
+async def warm_up_caches(top_n: Optional[int] = None, window_days: Optional[float] = None, answers: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Fills the query caches with the most frequent recent standalone queries from `query_stats`:
+    their embeddings (one embedder request per `WARMUP_BATCH_SIZE` queries), retrieval results
+    (Qdrant batch searches) and, with `answers`, the LLM answers of queries the FAQ cannot answer
+    directly. Only queries that retrieve documents get a precomputed answer.
+    :return: A report, including `coverage`: the share of standalone queries in the window that the
+        warmed queries account for.
+    """
+    top_n = top_n or settings.WARMUP_TOP_N
+    window_days = settings.WARMUP_WINDOW_DAYS if window_days is None else window_days
+    answers = settings.WARMUP_ANSWERS if answers is None else answers
+    started = time.perf_counter()
+
+    top = await database.get_top_queries(datetime.utcnow() - timedelta(days=window_days), top_n)
+    counts = {entry["query"]: entry["count"] for entry in top["queries"] if entry["query"] and entry["query"].strip()}
+    report = {
+        "window_days": window_days,
+        "top_n": top_n,
+        "queries": len(counts),
+        "distinct_queries": top["distinct"],
+        "traffic": top["total"],
+        "covered_traffic": 0,
+        "coverage": 0.0,
+        "embeddings_computed": 0,
+        "retrievals_cached": 0,
+        "answers_cached": 0,
+        "failed_queries": 0,
+        "seconds": 0.0,
+    }
+
+    chat_pipeline = ChatPipeline()
+    llm = LLM() if answers else None
+    semaphore = asyncio.Semaphore(settings.WARMUP_ANSWER_CONCURRENCY)
+
+    async def warm_answer(query: str, key: str, context: str) -> bool:
+        async with semaphore:
+            try:
+                response = await llm.get_answer_async(query=query, context=context)
+            except Exception as e:
+                logger.warning(f"Warm-up could not generate an answer for '{query[:50]}': {e}")
+                return False
+        query_caches.answers.set(key, response.choices[0].message.content)
+        return True
+
+    queries = list(counts)
+    for start in range(0, len(queries), settings.WARMUP_BATCH_SIZE):
+        batch = queries[start:start + settings.WARMUP_BATCH_SIZE]
+        keys = [get_query_key(query) for query in batch]
+        try:
+            embeddings = [query_caches.embeddings.get(key) for key in keys]
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if missing:
+                embedded = await run_in_threadpool(embedder.run, documents=[Document(content=batch[i]) for i in missing])
+                for i, document in zip(missing, embedded["documents"]):
+                    embeddings[i] = document.embedding
+                    query_caches.embeddings.set(keys[i], document.embedding)
+                report["embeddings_computed"] += len(missing)
+            outputs = await run_in_threadpool(chat_pipeline.retrieve_batch, embeddings)
+        except Exception as e:
+            logger.warning(f"Warm-up batch of {len(batch)} queries failed: {e}")
+            report["failed_queries"] += len(batch)
+            continue
+
+        answer_tasks = []
+        for query, key, output in zip(batch, keys, outputs):
+            query_caches.retrievals.set(key, output)
+            report["retrievals_cached"] += 1
+            report["covered_traffic"] += counts[query]
+            if llm is not None and key not in query_caches.answers:
+                citations, context = build_citations_and_context(output)
+                if citations and not get_rag_answer(citations):
+                    answer_tasks.append(warm_answer(query, key, context))
+        if answer_tasks:
+            results = await asyncio.gather(*answer_tasks)
+            report["answers_cached"] += sum(results)
+            report["failed_queries"] += len(results) - sum(results)
+
+    report["coverage"] = round(report["covered_traffic"] / report["traffic"], 4) if report["traffic"] else 0.0
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    report["cache"] = query_caches.stats()
+    query_caches.last_warmup = report
+    logger.info(
+        f"Cache warm-up: {report['retrievals_cached']} queries covering {report['coverage']:.1%} of "
+        f"{report['traffic']} standalone queries in the last {window_days:g} days, "
+        f"{report['answers_cached']} answers, {report['failed_queries']} failures, {report['seconds']}s."
+    )
+    return report
+
+
+async def watch_for_reindex():
+    """
+    Checks every `QUERY_CACHE_VERSION_CHECK_INTERVAL` seconds whether a reindex published new
+    collection versions or an upload indexed new files; if so, cached results are dropped and, with
+    `WARMUP_ENABLED`, warmed again.
+    """
+    while True:
+        await asyncio.sleep(settings.QUERY_CACHE_VERSION_CHECK_INTERVAL)
+        try:
+            if await run_in_threadpool(query_caches.check_versions) and settings.WARMUP_ENABLED:
+                await warm_up_caches()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Query cache version check failed: {e}")
@@ -0,0 +1,82 @@
+"""
+Compares FAQ search latency of the in-process NumPy index (`FAQ_INDEX_ENABLED`) with Qdrant.
+
+Creates a throw-away Qdrant collection and an FAQ index snapshot (in a temporary directory) from the
+same random vectors, runs the same queries one at a time against both, prints latency percentiles
+and how often both return the same top-k, then drops the collection.
+
+    python -m benchmarks.faq_index --points 5000 --queries 1000 --dtype float32 float16
+"""
+import argparse
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from haystack import Document
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as rest
+
+from app.envs import settings
+from app.utils.faq_index import FAQVectorIndex, write_faq_snapshot
+
+
+def _percentiles(latencies: list) -> str:
+    return "".join(f"{np.percentile(latencies, p):>10.3f}" for p in (50, 95, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the in-process FAQ index against Qdrant.")
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=settings.EMBEDDING_DIM)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=settings.EMBEDDING_TOP_K)
+    parser.add_argument("--dtype", nargs="+", default=["float32", "float16"], choices=["float32", "float16"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.points, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    ids = [str(i) for i in range(args.points)]
+
+    client = QdrantClient(url=settings.QDRANTDB_URL, api_key=settings.QDRANTDB_API_KEY or None, timeout=settings.DB_TIMEOUT)
+    collection = f"bench_faq_{uuid.uuid4().hex[:8]}"
+    print(f"Creating {collection} with {args.points} points of dim {args.dim}...")
+    client.create_collection(collection, vectors_config=rest.VectorParams(size=args.dim, distance=rest.Distance.COSINE))
+    client.upload_collection(collection, vectors=vectors, ids=range(args.points), wait=True)
+
+    try:
+        latencies = []
+        qdrant_top = []
+        for query in queries:
+            started = time.perf_counter()
+            response = client.query_points(collection, query=query.tolist(), limit=args.top_k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            qdrant_top.append([str(point.id) for point in response.points])
+        print(f"{'backend':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'same top-k':>12}")
+        print(f"{'qdrant':<16}{_percentiles(latencies)}{'':>12}")
+
+        # The benchmark embeds with its own random model; the index only accepts snapshots matching the settings.
+        settings.EMBEDDING_DIM = args.dim
+        documents = [Document(id=i, content=f"question {i}", embedding=v.tolist()) for i, v in zip(ids, vectors)]
+        for dtype in args.dtype:
+            settings.FAQ_INDEX_DTYPE = dtype
+            with tempfile.TemporaryDirectory() as directory:
+                write_faq_snapshot(documents, source=collection, directory=directory)
+                index = FAQVectorIndex(directory)
+                index.maybe_refresh(force=True)
+                latencies = []
+                same = 0
+                for query, expected in zip(queries, qdrant_top):
+                    started = time.perf_counter()
+                    found = index.search(query.tolist(), top_k=args.top_k, score_threshold=-1.0)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    same += [doc.id for doc in found] == expected
+                print(f"{'numpy ' + dtype:<16}{_percentiles(latencies)}{same / len(queries):>12.1%}")
+    finally:
+        client.delete_collection(collection)
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
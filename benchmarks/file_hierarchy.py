@@ -0,0 +1,116 @@
+"""
+Compares flat and coarse-to-fine (`FILE_HIERARCHY_ENABLED`) search over uploaded files as the
+`files` collection grows.
+
+Generates synthetic files whose chunk embeddings cluster around one topic vector per section, writes
+them with their section summaries to throw-away collections, and for each scale prints the latency
+percentiles of both searches, their recall@k against the flat top-k, and how often the chunk
+a query was drawn from is returned. The collections are dropped afterwards. Run it against a Qdrant
+server: the in-memory client of DEBUG mode evaluates filters point by point in Python, so it only
+shows the recall side.
+
+    python -m benchmarks.file_hierarchy --chunks 10000 50000 --queries 200
+"""
+import argparse
+import time
+import uuid
+
+import numpy as np
+from haystack import Document
+from haystack_integrations.components.retrievers.qdrant import QdrantEmbeddingRetriever
+
+from app.envs import settings
+from app.utils.file_hierarchy import HIERARCHY_PAYLOAD_INDEXES, HierarchicalFileRetriever, assign_chunk_positions, build_section_summaries
+from app.utils.qdrant import qdrant_clients
+
+
+def _synthetic_files(chunks: int, chunks_per_file: int, dim: int, noise: float, rng: np.random.Generator) -> list:
+    files = []
+    for file_index in range(max(chunks // chunks_per_file, 1)):
+        doc_id = f"bench:{file_index}"
+        documents = []
+        for start in range(0, chunks_per_file, settings.FILE_SECTION_CHUNKS):
+            count = min(settings.FILE_SECTION_CHUNKS, chunks_per_file - start)
+            topic = rng.standard_normal(dim, dtype=np.float32)
+            vectors = topic + noise * rng.standard_normal((count, dim), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            documents += [
+                Document(content=f"{doc_id} chunk {start + i}", embedding=vector.tolist(), meta={"file_path": f"{doc_id}.pdf"})
+                for i, vector in enumerate(vectors)
+            ]
+        assign_chunk_positions(documents, doc_id=doc_id, part=0, hierarchical=True)
+        files.append(documents)
+    return files
+
+
+def _percentiles(latencies: list) -> str:
+    return f"{np.percentile(latencies, 50):>9.1f}{np.percentile(latencies, 95):>9.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark flat vs coarse-to-fine search over uploaded files.")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 50000], help="Collection sizes to measure.")
+    parser.add_argument("--chunks-per-file", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=settings.EMBEDDING_DIM)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.5, help="Spread of chunks around their section topic.")
+    args = parser.parse_args()
+
+    settings.EMBEDDING_DIM = args.dim
+    # Recall is measured on the retrieved chunks themselves: no neighbor expansion, and no score
+    # threshold, which would make both searches return nothing for the harder queries.
+    settings.FILE_NEIGHBOR_CHUNKS = 0
+    settings.EMBEDDING_THRESHOLD = None
+    top_k = settings.EMBEDDING_TOP_K
+    rng = np.random.default_rng(0)
+    print(
+        f"top_k={top_k}, section={settings.FILE_SECTION_CHUNKS} chunks, coarse top_k={settings.FILE_COARSE_TOP_K}, "
+        f"{args.chunks_per_file} chunks per file, dim={args.dim}"
+    )
+    print(f"{'chunks':>8}  {'search':<8}{'p50 ms':>9}{'p95 ms':>9}{'recall@k':>10}{'source hit':>12}")
+
+    for chunks in args.chunks:
+        suffix = uuid.uuid4().hex[:8]
+        file_store = qdrant_clients.create_document_store(f"bench_files_{suffix}")
+        summary_store = qdrant_clients.create_document_store(f"bench_summaries_{suffix}")
+        try:
+            qdrant_clients.ensure_payload_indexes(file_store.index, HIERARCHY_PAYLOAD_INDEXES)
+            documents = [document for file in _synthetic_files(chunks, args.chunks_per_file, args.dim, args.noise, rng) for document in file]
+            for start in range(0, len(documents), settings.DB_BATCH_SIZE):
+                file_store.write_documents(documents[start:start + settings.DB_BATCH_SIZE])
+            summary_store.write_documents(build_section_summaries(documents))
+
+            # Queries are noisy copies of random chunks, which should be found again.
+            sources = rng.choice(len(documents), size=args.queries, replace=False)
+            queries = [np.asarray(documents[i].embedding) + 0.3 * args.noise * rng.standard_normal(args.dim) for i in sources]
+            queries = [(query / np.linalg.norm(query)).tolist() for query in queries]
+
+            flat = QdrantEmbeddingRetriever(document_store=file_store, top_k=top_k)
+            hierarchical = HierarchicalFileRetriever(file_store, summary_store)
+            searches = {
+                "flat": lambda query: flat.run(query_embedding=query)["documents"],
+                "coarse": lambda query: hierarchical.run(query),
+            }
+            results = {}
+            for name, search in searches.items():
+                search(queries[0])
+                latencies, ids = [], []
+                for query in queries:
+                    started = time.perf_counter()
+                    found = search(query)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    ids.append([document.id for document in found])
+                results[name] = (latencies, ids)
+
+            truth = results["flat"][1]
+            for name, (latencies, ids) in results.items():
+                recall = np.mean([len(set(found) & set(expected)) / max(len(expected), 1) for found, expected in zip(ids, truth)])
+                source_hit = np.mean([documents[source].id in found for source, found in zip(sources, ids)])
+                print(f"{len(documents):>8}  {name:<8}{_percentiles(latencies)}{recall:>10.3f}{source_hit:>12.3f}")
+        finally:
+            for store in (file_store, summary_store):
+                qdrant_clients.client.delete_collection(store.index)
+
+
+if __name__ == "__main__":
+    main()
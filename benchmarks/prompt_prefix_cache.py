@@ -0,0 +1,185 @@
+"""
+Measures prompt-token reuse and time-to-first-token of the two LLM prompt layouts
+(`LLM_PROMPT_LAYOUT=legacy` vs `prefix_cache`) against a local stand-in backend.
+
+The stand-in is an OpenAI-compatible streaming endpoint that simulates automatic prefix caching
+the way vLLM/TGI do it: the prompt is split into fixed-size token blocks, each block is identified by
+the hash of everything before it, and only blocks not seen before are "prefilled" (slept for
+`--prefill-us-per-token`). Requests are sent through the app's own `LLM` class, with contexts built
+from a Zipf-distributed pool of passages as retrieval would return them.
+
+    python -m benchmarks.prompt_prefix_cache --requests 300 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+BLOCK_SIZE = 16
+
+
+class PrefixCacheSimulator:
+    def __init__(self):
+        self.blocks = set()
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def prefill(self, prompt: str) -> int:
+        """Registers the prompt's blocks and returns the number of tokens that had to be computed."""
+        tokens = re.findall(r"\w+|[^\w\s]", prompt)
+        prefix_hash = 0
+        cached = 0
+        contiguous = True
+        for start in range(0, len(tokens) - len(tokens) % BLOCK_SIZE, BLOCK_SIZE):
+            prefix_hash = hash((prefix_hash, tuple(tokens[start:start + BLOCK_SIZE])))
+            if contiguous and prefix_hash in self.blocks:
+                cached += BLOCK_SIZE
+            else:
+                contiguous = False
+                self.blocks.add(prefix_hash)
+        self.prompt_tokens += len(tokens)
+        self.cached_tokens += cached
+        return len(tokens) - cached
+
+    def reset(self):
+        self.__init__()
+
+
+def build_standin_app(cache: PrefixCacheSimulator, base_latency_ms: float, prefill_us_per_token: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        prompt = "".join(f"<|{m['role']}|>{m['content']}" for m in body["messages"])
+        uncached = cache.prefill(prompt)
+        completion_id = uuid.uuid4().hex
+
+        async def stream():
+            await asyncio.sleep(base_latency_ms / 1000 + uncached * prefill_us_per_token / 1_000_000)
+            for i, piece in enumerate(["Stand-in ", "answer."]):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "standin"),
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece} if i == 0 else {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            chunk["choices"] = [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def start_standin(app: FastAPI) -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return port
+
+
+class Passage:
+    def __init__(self, id: str, content: str):
+        self.id = id
+        self.content = content
+
+
+def build_workload(requests: int, passages: int, passages_per_query: int, seed: int = 0):
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(5000)]
+    pool = [Passage(f"{i:06d}", " ".join(rng.choices(vocabulary, k=120))) for i in range(passages)]
+    popularity = np.random.default_rng(seed).zipf(1.3, size=(requests, passages_per_query * 4))
+    workload = []
+    for row in popularity:
+        picked = []
+        for rank in row:
+            passage = pool[(rank - 1) % passages]
+            if passage not in picked:
+                picked.append(passage)
+            if len(picked) == passages_per_query:
+                break
+        # Retrieval returns passages by score, which varies from query to query.
+        rng.shuffle(picked)
+        workload.append((" ".join(rng.choices(vocabulary, k=12)) + "?", picked))
+    return workload
+
+
+async def run_layout(layout: str, workload, concurrency: int):
+    from app.envs import settings
+    from app.utils.llm import LLM, order_passages
+
+    settings.LLM_PROMPT_LAYOUT = layout
+    llm = LLM()
+    semaphore = asyncio.Semaphore(concurrency)
+    ttfts = []
+
+    async def one(query, passages):
+        context = "\n\n".join(p.content for p in order_passages(passages))
+        async with semaphore:
+            started = time.perf_counter()
+            stream = await llm.get_answer_async_stream(query=query, context=context)
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        ttfts.append((time.perf_counter() - started) * 1000)
+                        break
+                async for _ in stream:
+                    pass
+            finally:
+                await stream.aclose()
+
+    await asyncio.gather(*(one(query, passages) for query, passages in workload))
+    return ttfts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt layouts against a prefix-caching stand-in backend.")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--passages", type=int, default=200)
+    parser.add_argument("--passages-per-query", type=int, default=4)
+    parser.add_argument("--base-latency-ms", type=float, default=5)
+    parser.add_argument("--prefill-us-per-token", type=float, default=200)
+    args = parser.parse_args()
+
+    cache = PrefixCacheSimulator()
+    port = start_standin(build_standin_app(cache, args.base_latency_ms, args.prefill_us_per_token))
+    # Must be set before app.utils.llm builds its backend pool.
+    os.environ["LLM_BACKENDS"] = json.dumps([{"name": "standin", "base_url": f"http://127.0.0.1:{port}/v1", "model": "standin", "api_key": "standin"}])
+    os.environ["LLM_HEDGE_DELAY_MS"] = "0"
+
+    workload = build_workload(args.requests, args.passages, args.passages_per_query)
+
+    async def run_all():
+        print(f"{'layout':<14}{'reuse':>8}{'ttft p50':>11}{'ttft p95':>11}")
+        for layout in ("legacy", "prefix_cache"):
+            cache.reset()
+            ttfts = await run_layout(layout, workload, args.concurrency)
+            reuse = cache.cached_tokens / max(cache.prompt_tokens, 1)
+            print(f"{layout:<14}{reuse:>8.1%}{np.percentile(ttfts, 50):>9.1f}ms{np.percentile(ttfts, 95):>9.1f}ms")
+
+    # One event loop for both layouts: the LLM clients are shared and bound to it.
+    asyncio.run(run_all())
+
+
+if __name__ == "__main__":
+    main()
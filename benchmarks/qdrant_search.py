@@ -0,0 +1,99 @@
+"""
+Compares Qdrant search latency over REST (HTTP) and gRPC under concurrency.
+
+Creates a throw-away collection filled with random vectors, runs the same query load through the
+shared-client settings used by the app (pool size, timeout) with `prefer_grpc` off and on, prints
+throughput and latency percentiles, then drops the collection.
+
+    python -m benchmarks.qdrant_search --points 20000 --concurrency 1 8 32 --queries 500
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models as rest
+
+from app.envs import settings
+
+
+def _client_params(prefer_grpc: bool) -> dict:
+    return {
+        "url": settings.QDRANTDB_URL,
+        "api_key": settings.QDRANTDB_API_KEY or None,
+        "prefer_grpc": prefer_grpc,
+        "grpc_port": settings.QDRANTDB_GRPC_PORT,
+        "timeout": settings.DB_TIMEOUT,
+        "pool_size": settings.QDRANTDB_POOL_SIZE,
+    }
+
+
+def _create_collection(collection: str, points: int, dim: int, batch_size: int):
+    client = QdrantClient(**_client_params(prefer_grpc=True))
+    client.create_collection(collection, vectors_config=rest.VectorParams(size=dim, distance=rest.Distance.COSINE))
+    rng = np.random.default_rng(0)
+    for start in range(0, points, batch_size):
+        vectors = rng.standard_normal((min(batch_size, points - start), dim), dtype=np.float32)
+        client.upload_collection(collection, vectors=vectors, ids=range(start, start + len(vectors)), wait=True)
+    client.close()
+
+
+async def _run_load(prefer_grpc: bool, collection: str, queries: np.ndarray, concurrency: int, top_k: int) -> dict:
+    client = AsyncQdrantClient(**_client_params(prefer_grpc))
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def search(vector):
+        async with semaphore:
+            started = time.perf_counter()
+            await client.query_points(collection, query=vector.tolist(), limit=top_k)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    # Warm up connections before measuring.
+    await asyncio.gather(*(search(v) for v in queries[:concurrency]))
+    latencies.clear()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(search(v) for v in queries))
+    elapsed = time.perf_counter() - started
+    await client.close()
+
+    return {
+        "qps": len(queries) / elapsed,
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark Qdrant search latency, HTTP vs gRPC.")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=settings.EMBEDDING_DIM)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=settings.EMBEDDING_TOP_K)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    collection = f"bench_{uuid.uuid4().hex[:8]}"
+    print(f"Creating {collection} with {args.points} points of dim {args.dim}...")
+    _create_collection(collection, args.points, args.dim, settings.DB_BATCH_SIZE)
+    queries = np.random.default_rng(1).standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    try:
+        print(f"{'transport':<10}{'conc':>6}{'qps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for concurrency in args.concurrency:
+            for prefer_grpc in (False, True):
+                result = await _run_load(prefer_grpc, collection, queries, concurrency, args.top_k)
+                transport = "grpc" if prefer_grpc else "http"
+                print(f"{transport:<10}{concurrency:>6}{result['qps']:>10.1f}{result['p50']:>10.2f}{result['p95']:>10.2f}{result['p99']:>10.2f}")
+    finally:
+        client = QdrantClient(**_client_params(prefer_grpc=False))
+        client.delete_collection(collection)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,178 @@
+"""
+Compares the per-request cost of carrying retrieval hits as Haystack `Document`s (the previous hot
+path) and as `RetrievedDocument` records, from the Qdrant points to the citations and the `/query`
+response.
+
+For synthetic Qdrant points shaped like the app's payloads (top-k hits of the `faq`, `web` and
+`files` collections per request) each path converts the points, builds the citations and context,
+copies the final stream chunk and serializes the `/query` response. It prints the CPU time per
+request for each step, the memory allocated per request (tracemalloc peak) and the memory retained
+per cached retrieval. No Qdrant server is needed.
+
+    python -m benchmarks.retrieval_results --requests 2000 --top-k 3
+"""
+import argparse
+import copy
+import gc
+import json
+import time
+import tracemalloc
+import uuid
+import warnings
+from typing import Any, Dict, List, Optional
+
+from haystack import Document
+from haystack_integrations.document_stores.qdrant.converters import convert_qdrant_point_to_haystack_document
+from pydantic import BaseModel
+from qdrant_client.http import models as rest
+
+from app.models.query import QueryResponse
+from app.utils.citations import build_citations_and_context, extract_source_from_meta
+from app.utils.llm import order_passages
+from app.utils.results import RetrievedDocument
+
+COLLECTIONS = ("faq_documents", "web_documents", "file_documents")
+
+
+class DocumentQueryResponse(BaseModel):
+    """The `/query` response model as it was, with Haystack Documents."""
+    faq_documents: Optional[List[Document]] = None
+    web_documents: Optional[List[Document]] = None
+    file_documents: Optional[List[Document]] = None
+    llm_answer: Optional[str] = None
+
+
+def _document_citations_and_context(pipeline_output: Dict[str, Any]) -> tuple:
+    """`build_citations_and_context` as it was for Haystack Documents."""
+    faq_documents, web_documents, file_documents = (pipeline_output.get(key, []) for key in COLLECTIONS)
+    all_retrieved_docs = (faq_documents or []) + (web_documents or []) + (file_documents or [])
+    all_retrieved_docs.sort(key=lambda x: getattr(x, 'score', 0) or 0, reverse=True)
+    citations = []
+    for doc in all_retrieved_docs:
+        doc_meta = getattr(doc, 'meta', {})
+        citations.append({
+            "id": str(getattr(doc, 'id', uuid.uuid4().hex)),
+            "content": doc.content,
+            "source": extract_source_from_meta(doc_meta),
+            "score": getattr(doc, 'score', None),
+            "meta": doc_meta
+        })
+    context_parts = [f"FAQ: {doc.content}. Answer: {doc.meta.get('answer', '')}" for doc in order_passages(faq_documents) if doc.content]
+    context_parts += [doc.content for doc in order_passages(web_documents) + order_passages(file_documents) if doc.content]
+    return citations, "\n\n".join(context_parts)
+
+
+def _points(top_k: int, index: int) -> Dict[str, List[rest.ScoredPoint]]:
+    meta = {
+        "faq_documents": lambda i: {"answer": "Sinh viên đăng ký môn học qua hệ thống myBK trong tuần đăng ký. " * 4, "source_id": str(i)},
+        "web_documents": lambda i: {"content_type": "text", "url": f"https://hcmut.edu.vn/page/{i}", "title": "Thông báo đào tạo", "split_id": i, "split_idx_start": 0},
+        "file_documents": lambda i: {"file_path": "quy-che.pdf", "upload_id": "3f2b9c", "doc_id": "3f2b9c:quy-che.pdf", "part": 0, "chunk_index": i, "page_number": 2, "split_id": i},
+    }
+    return {
+        key: [
+            rest.ScoredPoint(
+                id=str(uuid.uuid4()),
+                version=0,
+                score=0.9 - 0.01 * rank,
+                payload={
+                    "id": f"{key}-{index}-{rank}",
+                    "content": "Quy chế đào tạo trình độ đại học của Trường Đại học Bách khoa. " * 12,
+                    "blob": None,
+                    "meta": meta[key](rank),
+                    "sparse_embedding": None,
+                },
+            )
+            for rank in range(top_k)
+        ]
+        for key in COLLECTIONS
+    }
+
+
+def _deepcopy_chunk(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    return copy.deepcopy(chunk)
+
+
+def _copy_chunk(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    return {**chunk, "choices": [{**chunk["choices"][0], "delta": dict(chunk["choices"][0]["delta"])}]}
+
+
+def _handle(points: Dict[str, List[rest.ScoredPoint]], path: Dict[str, Any], timings: Dict[str, float]) -> Dict[str, Any]:
+    started = time.process_time()
+    output = {key: [path["convert"](point) for point in collection_points] for key, collection_points in points.items()}
+    converted = time.process_time()
+    citations, _ = path["citations_and_context"](output)
+    cited = time.process_time()
+    # The final stream chunk, copied to append the disclaimer or log it.
+    path["copy_chunk"]({"id": "chatcmpl", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "citations": citations})
+    streamed = time.process_time()
+    response_model = path["response_model"]
+    response = response_model(**output, llm_answer="answer")
+    # What FastAPI does with a model returned for `response_model`: dump, validate, serialize.
+    json.dumps(response_model.model_validate(response.model_dump()).model_dump(mode="json"))
+    finished = time.process_time()
+    timings["convert"] += converted - started
+    timings["citations"] += cited - converted
+    timings["stream"] += streamed - cited
+    timings["/query"] += finished - streamed
+    return output
+
+
+def _run_path(name: str, requests: List[Dict[str, List[rest.ScoredPoint]]], path: Dict[str, Any]):
+    count = len(requests) // 3
+    timings = {"convert": 0.0, "citations": 0.0, "stream": 0.0, "/query": 0.0}
+    for points in requests[:count]:
+        _handle(points, path, timings)
+
+    # Memory allocated while handling one request (peak above the baseline), without tracing the timed run.
+    gc.collect()
+    tracemalloc.start()
+    allocated = 0
+    for points in requests[count:2 * count]:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        _handle(points, path, {key: 0.0 for key in timings})
+        allocated += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    # Memory held by cached retrievals (`query_caches.retrievals` keeps such outputs).
+    gc.collect()
+    tracemalloc.start()
+    retained = [{key: [path["convert"](point) for point in collection_points] for key, collection_points in points.items()} for points in requests[2 * count:3 * count]]
+    retained_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+
+    total = sum(timings.values())
+    print(
+        f"{name:<20}" + "".join(f"{timings[step] / count * 1e6:>11.1f}" for step in timings)
+        + f"{total / count * 1e6:>11.1f}{allocated / count / 1024:>12.1f}{retained_bytes / count / 1024:>12.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Haystack Documents vs RetrievedDocument records on the retrieval hot path.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=3, help="Hits per collection per request.")
+    args = parser.parse_args()
+    # Validating the response re-creates each Document, which warns about its id being set.
+    warnings.filterwarnings("ignore", message="Mutating attribute")
+
+    print(f"{args.requests} requests, {args.top_k} hits per collection; CPU microseconds and KiB per request")
+    print(f"{'path':<20}{'convert':>11}{'citations':>11}{'stream':>11}{'/query':>11}{'total':>11}{'alloc KiB':>12}{'cached KiB':>12}")
+    # Each path gets fresh points (the Haystack converter writes into the payload): a third for
+    # timing, a third for allocations and a third for the cache footprint.
+    _run_path("Document", [_points(args.top_k, i) for i in range(3 * args.requests)], {
+        "convert": lambda point: convert_qdrant_point_to_haystack_document(point, use_sparse_embeddings=False),
+        "citations_and_context": _document_citations_and_context,
+        "copy_chunk": _deepcopy_chunk,
+        "response_model": DocumentQueryResponse,
+    })
+    _run_path("RetrievedDocument", [_points(args.top_k, i) for i in range(3 * args.requests)], {
+        "convert": RetrievedDocument.from_point,
+        "citations_and_context": build_citations_and_context,
+        "copy_chunk": _copy_chunk,
+        "response_model": QueryResponse,
+    })
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares how web tables are chunked at reindex with and without `TABLE_CHUNKING_ENABLED`.
+
+Loads the tables of a web data file (the same JSON/CSV `--web-file` the reindex reads), or generates
+synthetic timetable-like tables, and prints for the passage preprocessor (whole tables, the previous
+behavior) and for `TableSplitter` in each format: the number of chunks, the average, p95 and maximum
+estimated tokens, and how many chunks exceed the limit. Nothing is embedded or written.
+
+    python -m benchmarks.table_chunking --web-file data/web.json --max-tokens 200
+"""
+import argparse
+import json
+import random
+
+import numpy as np
+import pandas as pd
+from haystack import Document
+from haystack.components.preprocessors import DocumentPreprocessor
+
+from app.envs import settings
+from app.utils.tables import TABLE_FORMATS, TableSplitter, estimate_tokens
+
+
+def _load_tables(web_file: str) -> list:
+    web_df = pd.read_csv(web_file) if web_file.endswith(".csv") else pd.read_json(web_file)
+    tables = []
+    for value in web_df["tables"]:
+        tables.extend(json.loads(value) if isinstance(value, str) else list(value))
+    return tables
+
+
+def _synthetic_tables(count: int) -> list:
+    rng = random.Random(0)
+    header = ["STT", "Mã MH", "Tên môn học", "Nhóm", "Thứ", "Tiết", "Phòng", "Tuần học"]
+    tables = []
+    for _ in range(count):
+        rows = [
+            [str(i + 1), f"CO{rng.randint(1000, 3999)}", rng.choice(["Giải tích 1", "Cấu trúc dữ liệu và giải thuật", "Hệ điều hành", "Mạng máy tính"]),
+             f"L{rng.randint(1, 20):02d}", str(rng.randint(2, 7)), f"{rng.randint(1, 10)}-{rng.randint(11, 14)}",
+             f"H{rng.randint(1, 6)}-{rng.randint(101, 812)}", "1234567-90123456"]
+            for i in range(rng.choice([3, 10, 40, 150]))
+        ]
+        tables.append("\n".join(["| " + " | ".join(header) + " |", "|" + "---|" * len(header)] + ["| " + " | ".join(row) + " |" for row in rows]))
+    return tables
+
+
+def _report(name: str, documents: list, max_tokens: int):
+    tokens = [estimate_tokens(document.content or "") for document in documents] or [0]
+    print(
+        f"{name:<24}{len(documents):>8}{np.mean(tokens):>10.1f}{np.percentile(tokens, 95):>10.0f}"
+        f"{max(tokens):>10}{sum(t > max_tokens for t in tokens):>12}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare web table chunking before and after table-aware splitting.")
+    parser.add_argument("--web-file", help="Web data file (JSON or CSV); synthetic tables are used when omitted.")
+    parser.add_argument("--synthetic-tables", type=int, default=200)
+    parser.add_argument("--max-tokens", type=int, default=settings.TABLE_CHUNK_MAX_TOKENS)
+    args = parser.parse_args()
+
+    tables = _load_tables(args.web_file) if args.web_file else _synthetic_tables(args.synthetic_tables)
+    documents = [Document(content=table, meta={"content_type": "table"}) for table in tables if table]
+    print(f"{len(documents)} tables, limit {args.max_tokens} estimated tokens")
+    print(f"{'chunking':<24}{'chunks':>8}{'avg tok':>10}{'p95 tok':>10}{'max tok':>10}{'over limit':>12}")
+
+    # The reindex preprocessor, which tables went through before table-aware chunking.
+    processor = DocumentPreprocessor(
+        split_by="passage",
+        split_length=1,
+        split_overlap=0,
+        remove_empty_lines=True,
+        remove_extra_whitespaces=True,
+        remove_repeated_substrings=True,
+        respect_sentence_boundary=False,
+    )
+    _report("passages (before)", processor.run(documents=documents)["documents"], args.max_tokens)
+    for table_format in TABLE_FORMATS:
+        chunks = TableSplitter(max_tokens=args.max_tokens, table_format=table_format).run(documents=documents)["documents"]
+        _report(f"row groups ({table_format})", chunks, args.max_tokens)
+
+
+if __name__ == "__main__":
+    main()